@@ -0,0 +1,299 @@
+"""
+End to end, offline: crawls `--copies` copies of the sites saved in
+benchmarks/corpus (see corpus_server.py, a host per source, `--latency`
+seconds per request) with
+
+- async_build: newz.async_build of one source after the other, the
+  latency is that of each build
+- AsyncSource.async_build: every source built at once, the latency is
+  that of each source's build
+- AsyncNewsPool: the sources built, then all their articles downloaded
+  and parsed (threads, no processes), the latency is that of each
+  article minus the time queued, from a tracing.TraceRecorder
+
+and reports articles per second, p50 / p99 latency, CPU time per article
+and peak RSS of each. The builds only discover articles, so their
+'articles' are the urls found. The pool's are the articles it crawled,
+and 'valid' those it kept, with a valid body: never the zh site's, as
+its text has no spaces to count words by.
+
+Every run is a fresh process with a TMPDIR of its own, so caches are
+cold. Its languages are warmed up before the clock starts, and on linux
+the peak RSS is reset after that, so it is the crawl's. The server runs
+in this process: its CPU isn't counted. The best of `--repeat` runs is
+kept, per metric.
+
+    python benchmarks/bench_e2e.py --save-baseline
+    python benchmarks/bench_e2e.py
+
+compares with benchmarks/baseline_e2e.json (when it was saved with the
+same arguments) and exits with 1 when a time or rate is `--tolerance`
+worse, peak RSS `--memory-tolerance` bigger or a count changed. Baselines
+are only comparable on the machine they were saved on.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from corpus_server import CorpusServer, load_sites, source_urls
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_e2e.json')
+SCENARIOS = ('async_build', 'AsyncSource.async_build', 'AsyncNewsPool')
+# the arguments a baseline is only comparable with
+ARGUMENTS = ('copies', 'latency', 'jitter', 'threads')
+LOWER_IS_BETTER = ('seconds', 'p50_ms', 'p99_ms', 'cpu_ms_per_article', 'peak_rss_mb')
+HIGHER_IS_BETTER = ('articles_per_second',)
+COUNTS = ('sources', 'articles', 'valid')
+
+
+def source_kwargs(site) -> dict:
+    return {'language': site.language, 'memoize_articles': False, 'fetch_images': False}
+
+
+async def run_async_build(urls, args):
+    import newz
+
+    latencies, articles = [], 0
+    for url, site in urls:
+        start = time.perf_counter()
+        source = await newz.async_build(url, **source_kwargs(site))
+        latencies.append(time.perf_counter() - start)
+        articles += len(source.articles)
+    return latencies, articles, None
+
+
+async def run_source_build(urls, args):
+    import anyio
+
+    from newz.source import AsyncSource
+
+    sources = [AsyncSource(url, **source_kwargs(site)) for url, site in urls]
+    latencies = []
+
+    async def build(source):
+        start = time.perf_counter()
+        await source.async_build()
+        latencies.append(time.perf_counter() - start)
+
+    async with anyio.create_task_group() as task_group:
+        for source in sources:
+            task_group.start_soon(build, source)
+    return latencies, sum(len(s.articles) for s in sources), None
+
+
+async def run_pool(urls, args):
+    from newz.mthreading import AsyncNewsPool
+    from newz.source import AsyncSource
+    from newz.tracing import TraceRecorder
+
+    sources = [AsyncSource(url, **source_kwargs(site)) for url, site in urls]
+    path = os.path.join(tempfile.gettempdir(), 'traces.jsonl')
+    recorder = TraceRecorder(path)
+    pool = AsyncNewsPool(recorder=recorder)
+    await pool.async_build_sources(sources)
+    await pool.async_set(sources, threads_per_source=args.threads, processes=0, parse=True)
+    await pool.async_join()
+    recorder.close()
+
+    latencies = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            trace = json.loads(line)
+            latencies.append(trace['duration'] - sum(
+                s['duration'] for s in trace['spans'] if s['name'] == 'queued'))
+    # the pool drops the articles that failed or have no valid body
+    return latencies, len(latencies), sum(len(s.articles) for s in sources)
+
+
+RUNNERS = {'async_build': run_async_build, 'AsyncSource.async_build': run_source_build,
+           'AsyncNewsPool': run_pool}
+
+
+def reset_peak_rss():
+    """Lowers the peak RSS to the current RSS, on linux
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_scenario(args):
+    """In the child process: runs `args.run` once, prints its results as
+    a json line
+    """
+    import anyio
+
+    import newz
+
+    sites = load_sites()
+    urls = source_urls(sites, args.port, args.copies)
+    newz.warmup(sorted(set(site.language for site in sites)))
+    reset_peak_rss()
+
+    cpu, start = time.process_time(), time.perf_counter()
+    latencies, articles, valid = anyio.run(RUNNERS[args.run], urls, args)
+    seconds = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    latencies.sort()
+    print(json.dumps({
+        'sources': len(urls),
+        'articles': articles,
+        'valid': valid,
+        'seconds': seconds,
+        'articles_per_second': articles / seconds,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else None,
+        'cpu_ms_per_article': cpu * 1000 / max(1, articles),
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def spawn(scenario: str, port: int, args) -> dict:
+    directory = tempfile.mkdtemp(prefix='bench-e2e-')
+    try:
+        command = [sys.executable, os.path.abspath(__file__), '--run', scenario, '--port', str(port),
+                   '--copies', str(args.copies), '--threads', str(args.threads)]
+        process = subprocess.run(command, env=dict(os.environ, TMPDIR=directory), capture_output=True,
+                                 text=True, timeout=args.timeout)
+        if process.returncode:
+            sys.stderr.write(process.stderr)
+            raise RuntimeError('%s exited with %d' % (scenario, process.returncode))
+        return json.loads(process.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def best(runs: list) -> dict:
+    result = dict(runs[0])
+    for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+        values = [r[metric] for r in runs if r[metric] is not None]
+        if values:
+            result[metric] = (max if metric in HIGHER_IS_BETTER else min)(values)
+    return result
+
+
+def compare(results: dict, baseline: dict, args) -> list:
+    """Lines of the regressions against `baseline`
+    """
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline['results'].get(scenario)
+        if base is None:
+            continue
+        for metric in COUNTS:
+            if result[metric] != base[metric]:
+                regressions.append('%s %s changed: %s -> %s' % (scenario, metric, base[metric], result[metric]))
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = base[metric], result[metric]
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            if metric in HIGHER_IS_BETTER:
+                change = -change
+            tolerance = args.memory_tolerance if metric == 'peak_rss_mb' else args.tolerance
+            if change > tolerance:
+                regressions.append('%s %s: %.1f -> %.1f (%.0f%% worse)' % (
+                    scenario, metric, old, new, change * 100))
+    return regressions
+
+
+def machine() -> dict:
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--copies', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--memory-tolerance', type=float, default=0.1)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append')
+    parser.add_argument('--run', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    if args.run:
+        run_scenario(args)
+        return
+
+    scenarios = args.scenario or SCENARIOS
+    server = CorpusServer(latency=args.latency, jitter=args.jitter)
+    port = server.start()
+    print('%d sources (%d sites x %d), %.0f ms latency' % (
+        args.copies * len(server.sites), len(server.sites), args.copies, args.latency * 1000))
+    runs = {scenario: [] for scenario in scenarios}
+    try:
+        # alternated, so a noisy moment doesn't hit a single scenario
+        for _ in range(args.repeat):
+            for scenario in scenarios:
+                runs[scenario].append(spawn(scenario, port, args))
+    finally:
+        server.stop()
+    results = {scenario: best(scenario_runs) for scenario, scenario_runs in runs.items()}
+
+    print('%-24s %8s %6s %8s %8s %8s %11s %8s' % (
+        'scenario', 'articles', 'valid', 'art/s', 'p50 ms', 'p99 ms', 'cpu ms/art', 'peak MB'))
+    for scenario, r in results.items():
+        print('%-24s %8d %6s %8.1f %8.1f %8.1f %11.2f %8.1f' % (
+            scenario, r['articles'], '-' if r['valid'] is None else r['valid'], r['articles_per_second'],
+            r['p50_ms'], r['p99_ms'], r['cpu_ms_per_article'], r['peak_rss_mb']))
+
+    arguments = {name: getattr(args, name) for name in ARGUMENTS}
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'arguments': arguments, 'machine': machine(), 'results': results}, f, indent=2)
+            f.write('\n')
+        print('Saved the baseline to %s' % args.baseline)
+        return
+    if not os.path.exists(args.baseline):
+        print('No baseline at %s, see --save-baseline' % args.baseline)
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline['arguments'] != arguments:
+        print('Not compared: the baseline was saved with %s' % baseline['arguments'])
+        return
+    if baseline['machine'] != machine():
+        print('The baseline was saved on another machine: %s' % baseline['machine'])
+    regressions = compare(results, baseline, args)
+    for line in regressions:
+        print('REGRESSION ' + line)
+    if regressions:
+        sys.exit(1)
+    print('No regression against the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Stage isolation of utils.executor.Executor: a burst of slow nlp calls
+(simulated, each blocks its worker for `--nlp-time` seconds) next to a
+steady stream of quick io helper calls (cache lookups and the like), all
+on one shared pool of `--workers` threads (what Executor used to be)
+against separate io and nlp stages of `--workers` threads each.
+
+Reports the latency of the io calls and the stage metrics.
+
+    python benchmarks/bench_executor.py --workers 8 --nlp 200 --nlp-time 0.02
+"""
+import argparse
+import statistics
+import time
+
+import anyio
+
+from newz.configuration import Configuration
+from newz.utils.executor import Executor
+
+
+def run(args, nlp_stage):
+    latencies = []
+
+    async def io_calls():
+        for _ in range(args.io):
+            start = time.perf_counter()
+            await Executor.run_in_stage('io', time.sleep, 0.001)
+            latencies.append(time.perf_counter() - start)
+            await anyio.sleep(0.005)
+
+    async def main():
+        async with anyio.create_task_group() as task_group:
+            for _ in range(args.nlp):
+                task_group.start_soon(Executor.run_in_stage, nlp_stage, time.sleep, args.nlp_time)
+            task_group.start_soon(io_calls)
+
+    start = time.perf_counter()
+    anyio.run(main)
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--nlp', type=int, default=200)
+    parser.add_argument('--nlp-time', type=float, default=0.02)
+    parser.add_argument('--io', type=int, default=50)
+    args = parser.parse_args()
+
+    config = Configuration()
+    config.number_threads = config.number_nlp_workers = args.workers
+    for name, nlp_stage in (('shared pool', 'io'), ('separate stages', 'nlp')):
+        Executor.shutdown()
+        Executor.stages = {}
+        Executor.configure(config)
+        elapsed, latencies = run(args, nlp_stage)
+        latencies.sort()
+        print('%-16s %5.2fs   io call p50 %7.1f ms  p99 %7.1f ms' % (
+            name, elapsed, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000))
+        for stage, metrics in sorted(Executor.metrics().items()):
+            if metrics['submitted']:
+                print('    %-4s %4d calls  wait avg %7.1f ms  max %7.1f ms' % (
+                    stage, metrics['submitted'], metrics['wait_avg'] * 1000, metrics['wait_max'] * 1000))
+    Executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Feed parsing benchmark: newz.feeds.iter_feed_entries against feedparser
+on large synthetic RSS and Atom feeds, time and tracemalloc peak. Note
+tracemalloc only sees Python allocations, not libxml2's own.
+
+    python benchmarks/bench_feeds.py --entries 20000
+"""
+import argparse
+import time
+import tracemalloc
+
+from newz.feeds import iter_feed_entries
+
+RSS_ITEM = ('<item><title>Story number %(i)d</title>'
+            '<link>http://news.test/2022/06/01/story-%(i)d.html</link>'
+            '<guid>story-%(i)d</guid><pubDate>Wed, 01 Jun 2022 10:00:00 GMT</pubDate>'
+            '<description><![CDATA[%(body)s]]></description></item>')
+ATOM_ENTRY = ('<entry><title>Story number %(i)d</title><id>urn:story:%(i)d</id>'
+              '<link href="http://news.test/2022/06/01/story-%(i)d.html"/>'
+              '<published>2022-06-01T10:00:00Z</published><summary>%(body)s</summary></entry>')
+
+
+def make_feed(kind, entries, body_size):
+    body = 'lorem ipsum ' * (body_size // 12)
+    if kind == 'rss':
+        items = ''.join(RSS_ITEM % {'i': i, 'body': body} for i in range(entries))
+        return '<?xml version="1.0"?><rss version="2.0"><channel><title>t</title>%s</channel></rss>' % items
+    items = ''.join(ATOM_ENTRY % {'i': i, 'body': body} for i in range(entries))
+    return '<?xml version="1.0"?><feed xmlns="http://www.w3.org/2005/Atom"><title>t</title>%s</feed>' % items
+
+
+def measure(func, text):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = func(text)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def newz_feeds(text):
+    return sum(1 for entry in iter_feed_entries(text) if entry.url)
+
+
+def feedparser_feeds(text):
+    import feedparser
+    return sum(1 for entry in feedparser.parse(text).entries if entry.get('link'))
+
+
+def run_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--body-size', type=int, default=500)
+    args = parser.parse_args()
+
+    for kind in ('rss', 'atom'):
+        text = make_feed(kind, args.entries, args.body_size)
+        print('%s feed, %d entries, %.1f MB' % (kind, args.entries, len(text) / 1e6))
+        for name, func in (('newz.feeds', newz_feeds), ('feedparser', feedparser_feeds)):
+            try:
+                count, elapsed, peak = measure(func, text)
+            except ImportError as e:
+                print('  %-11s skipped (%s)' % (name, e))
+                continue
+            print('  %-11s %6d entries  %8.0f entries/s  peak %7.1f MB' % (
+                name, count, count / elapsed, peak / 1e6))
+
+
+if __name__ == '__main__':
+    run_bench()
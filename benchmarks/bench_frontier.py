@@ -0,0 +1,72 @@
+"""
+Cost of checkpointing a crawl to a frontier.CrawlFrontier: the same
+AsyncNewsPool crawl of a local server (no latency, so the overhead shows
+as much as it can) without a frontier and with frontiers checkpointing
+every article (interval 0) and every `--interval` seconds. Then the
+resume of the finished crawl, which restores every article.
+
+    python benchmarks/bench_frontier.py --sources 8 --articles 250 --parse
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import anyio
+
+from newz.frontier import CrawlFrontier
+from newz.mthreading import AsyncNewsPool
+
+from bench_pool import make_html, make_sources, serve
+
+
+def run(port, args, frontier=None):
+    sources = make_sources(port, args.sources, args.articles)
+    pool = AsyncNewsPool(frontier=frontier)
+
+    async def crawl():
+        await pool.async_set(sources, threads_per_source=args.threads, processes=0, parse=args.parse)
+        await pool.async_join()
+
+    start = time.perf_counter()
+    anyio.run(crawl)
+    elapsed = time.perf_counter() - start
+    assert sum(len(s.articles) for s in sources) == args.sources * args.articles
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=8)
+    parser.add_argument('--articles', type=int, default=250)
+    parser.add_argument('--threads', type=int, default=5)
+    parser.add_argument('--interval', type=float, default=5)
+    parser.add_argument('--parse', action='store_true')
+    args = parser.parse_args()
+
+    server = serve([make_html(i).encode() for i in range(50)], 0)
+    port = server.server_address[1]
+    total = args.sources * args.articles
+    directory = tempfile.mkdtemp()
+    print('%d sources x %d articles%s' % (args.sources, args.articles, ', parsed' if args.parse else ''))
+
+    run(port, args)
+    baseline = run(port, args)
+    print('%-22s %7.2fs' % ('no frontier', baseline))
+    for interval in (0, args.interval):
+        frontier = CrawlFrontier(os.path.join(directory, 'every-%g.frontier' % interval), interval)
+        elapsed = run(port, args, frontier)
+        size = os.path.getsize(frontier.path) + os.path.getsize(frontier.path + '-wal')
+        print('%-22s %7.2fs  %+6.1f%%  %5.1f us per article  %4d checkpoints  %5.1f MB' % (
+            'checkpoint every %gs' % interval, elapsed, (elapsed / baseline - 1) * 100,
+            (elapsed - baseline) * 1e6 / total, frontier.checkpoints, size / 1e6))
+        frontier.close()
+
+    frontier = CrawlFrontier(frontier.path, args.interval)
+    elapsed = run(port, args, frontier)
+    print('%-22s %7.2fs  (%.0f articles/s, nothing fetched)' % ('resume when done', elapsed, total / elapsed))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Parse time of pathological pages with and without article.guard_html:
+a page far over MAX_HTML_BYTES, one nested past MAX_DOM_DEPTH and one
+with many times MAX_DOM_NODES elements, then the cost of the guard on a
+typical page.
+
+    python benchmarks/bench_guards.py --repeat 3
+"""
+import argparse
+import time
+
+from newz.article import Article, guard_html
+from newz.configuration import Configuration
+
+from bench_pool import make_html
+
+
+def parse(html, config, guarded):
+    start = time.perf_counter()
+    article = Article('http://bench.test/page.html', config=config)
+    article.set_html(html)
+    truncated = []
+    if guarded:
+        article.html, truncated = guard_html(article.html, config)
+    article.parse()
+    return time.perf_counter() - start, truncated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    config = Configuration()
+    body = make_html(0)
+    pages = {
+        'huge (30 MB)': body.replace('</body>', '<p>%s</p></body>' % ('filler text ' * 2600000)),
+        'deep (2000 levels)': body.replace('</body>', '%s<p>deep</p>%s</body>' % ('<div>' * 2000, '</div>' * 2000)),
+        'wide (500k nodes)': body.replace('</body>', '%s</body>' % ('<span>x</span>' * 500000)),
+    }
+    for name, html in pages.items():
+        times = {}
+        for guarded in (False, True):
+            times[guarded] = min(parse(html, config, guarded)[0] for _ in range(args.repeat))
+        print('%-20s %8.2fs unguarded %8.2fs guarded  %s' % (
+            name, times[False], times[True], parse(html, config, True)[1]))
+
+    typical = [make_html(i) for i in range(50)]
+    for guarded in (False, True):
+        start = time.perf_counter()
+        for html in typical * args.repeat:
+            parse(html, config, guarded)
+        per_page = (time.perf_counter() - start) / (len(typical) * args.repeat)
+        print('%-20s %8.2f ms per page' % ('typical, %s' % ('guarded' if guarded else 'unguarded'), per_page * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Cold import time of the newz package, measured in fresh interpreters.
+
+    python benchmarks/bench_import.py --runs 20 --budget-ms 50
+
+Exits non-zero when the median import time is over budget.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+CODE = 'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+
+
+def measure(module: str, runs: int):
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', CODE.format(module=module)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(out.strip().splitlines()[-1]) * 1000)
+    return timings
+
+
+def run_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='newz')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    timings = measure(args.module, args.runs)
+    median = statistics.median(timings)
+    print('import %s: median %.1f ms, min %.1f ms, max %.1f ms over %d runs (budget %.1f ms)' % (
+        args.module, median, min(timings), max(timings), args.runs, args.budget_ms))
+    if median > args.budget_ms:
+        print('OVER BUDGET')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run_bench()
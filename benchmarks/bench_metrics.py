@@ -0,0 +1,81 @@
+"""
+Cost of utils/metrics.py: the same parsed AsyncNewsPool crawl of a local
+server (no latency) with metrics off and on, then what one instrumented
+call site costs on its own, off and on.
+
+    python benchmarks/bench_metrics.py --sources 4 --articles 250
+"""
+import argparse
+import logging
+import time
+import timeit
+
+import anyio
+
+from newz.configuration import Configuration
+from newz.mthreading import AsyncNewsPool
+from newz.utils import metrics
+
+from bench_pool import make_html, make_sources, serve
+
+
+def crawl(port, args, collect):
+    config = Configuration()
+    config.collect_metrics = collect
+    pool = AsyncNewsPool(config)
+    sources = make_sources(port, args.sources, args.articles)
+
+    async def main():
+        await pool.async_set(sources, threads_per_source=args.threads, processes=0, parse=True)
+        await pool.async_join()
+
+    start = time.perf_counter()
+    anyio.run(main)
+    return time.perf_counter() - start, pool
+
+
+def call_site(number):
+    def site():
+        with metrics.timed('parse', 'http://bench.test/a.html'):
+            pass
+        metrics.request_trace('http://bench.test/a.html')
+    return min(timeit.repeat(site, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=4)
+    parser.add_argument('--articles', type=int, default=250)
+    parser.add_argument('--threads', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    server = serve([make_html(i).encode() for i in range(50)], 0)
+    port = server.server_address[1]
+    total = args.sources * args.articles
+    print('%d sources x %d articles, parsed' % (args.sources, args.articles))
+
+    crawl(port, args, False)
+    # alternated, best of `repeat`, the machine's noise is of the same order
+    off, on = [], []
+    for _ in range(args.repeat):
+        off.append(crawl(port, args, False)[0])
+        elapsed, pool = crawl(port, args, True)
+        on.append(elapsed)
+    off, on = min(off), min(on)
+    print('%-14s %7.2fs' % ('metrics off', off))
+    print('%-14s %7.2fs  %+6.1f%%  %6.1f us per article' % (
+        'metrics on', on, (on / off - 1) * 100, (on - off) * 1e6 / total))
+    series = sum(len(s) for kind in ('counters', 'histograms') for s in pool.metrics()[kind].values())
+    print('%-14s %7d series, %d bytes of prometheus text' % ('', series, len(pool.metrics('prometheus'))))
+
+    metrics.disable()
+    print('call site off  %7.3f us' % (call_site(200000) * 1e6))
+    metrics.enable()
+    print('call site on   %7.3f us' % (call_site(50000) * 1e6))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+AsyncSource.async_parse_articles throughput: one article at a time (the
+old behaviour) against the concurrent thread and process backends, on
+synthetic article pages.
+
+    python benchmarks/bench_parse.py --articles 400
+"""
+import argparse
+import os
+import time
+
+import anyio
+
+from newz.article import AsyncArticle
+from newz.source import AsyncSource
+
+SITE = 'http://bench.test'
+
+
+def make_html(index, paragraphs):
+    paragraph = '<p>%s</p>' % ' '.join(
+        'Sentence %d of story %d tells the readers about an important event.' % (i, index) for i in range(12))
+    nav = ''.join('<li><a href="/section/%d">Section %d</a></li>' % (i, i) for i in range(80))
+    return ('<html><head><title>Story %d</title><meta property="og:type" content="article"></head>'
+            '<body><nav><ul>%s</ul></nav><article><h1>Story %d</h1>%s</article>'
+            '<footer>%s</footer></body></html>' % (index, nav, index, paragraph * paragraphs, nav))
+
+
+def make_source(count, paragraphs):
+    source = AsyncSource(SITE, memoize_articles=False, fetch_images=False)
+    source.articles = []
+    for i in range(count):
+        article = AsyncArticle('%s/2022/06/01/story-%d.html' % (SITE, i), source_url=SITE, config=source.config)
+        article.set_html(make_html(i, paragraphs))
+        source.articles.append(article)
+    return source
+
+
+def run(count, paragraphs, **kwargs):
+    source = make_source(count, paragraphs)
+    start = time.perf_counter()
+    anyio.run(lambda: source.async_parse_articles(**kwargs))
+    elapsed = time.perf_counter() - start
+    assert len(source.articles) == count
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=400)
+    parser.add_argument('--paragraphs', type=int, default=20)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count()
+    # start the process pool outside the timing
+    run(cpus, args.paragraphs, limit=cpus, backend='process')
+
+    print('%d cpus, %d articles' % (cpus, args.articles))
+    print('serial            %8.1f articles/s' % run(args.articles, args.paragraphs, limit=1, backend='thread'))
+    print('threads (%2d)      %8.1f articles/s' % (cpus, run(args.articles, args.paragraphs, limit=cpus, backend='thread')))
+    print('processes (%2d)    %8.1f articles/s' % (cpus, run(args.articles, args.paragraphs, limit=cpus, backend='process')))
+
+
+if __name__ == '__main__':
+    main()
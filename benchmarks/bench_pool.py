@@ -0,0 +1,149 @@
+"""
+AsyncNewsPool throughput on a replayed corpus: synthetic article pages
+served from memory by a local http server that answers after `--latency`
+seconds, crawled on the caller's event loop and by worker processes,
+downloading only and downloading + parsing.
+
+Then async_join against async_iter_completed with a consumer that drops
+each article once it's handled (as an indexer would): when the first
+article is available, and the peak python memory (tracemalloc) of the
+crawl.
+
+    python benchmarks/bench_pool.py --sources 8 --articles 50 --latency 0.05
+"""
+import argparse
+import os
+import threading
+import time
+import tracemalloc
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import anyio
+
+from newz.article import AsyncArticle
+from newz.mthreading import AsyncNewsPool
+from newz.source import AsyncSource
+
+
+def make_html(index):
+    paragraph = '<p>%s</p>' % ' '.join(
+        'Sentence %d of story %d tells the readers about an important event.' % (i, index) for i in range(12))
+    nav = ''.join('<li><a href="/section/%d">Section %d</a></li>' % (i, i) for i in range(80))
+    return ('<html><head><title>Story %d</title><meta property="og:type" content="article"></head>'
+            '<body><nav><ul>%s</ul></nav><article><h1>Story %d</h1>%s</article>'
+            '<footer>%s</footer></body></html>' % (index, nav, index, paragraph * 20, nav))
+
+
+def serve(corpus, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = corpus[int(self.path.rsplit('-', 1)[1].split('.')[0]) % len(corpus)]
+            self.send_response(200)
+            self.send_header('content-type', 'text/html; charset=utf-8')
+            self.send_header('content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    # on all of 127.0.0.0/8, so every source can be a host of its own
+    server = ThreadingHTTPServer(('', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_sources(port, count, articles):
+    sources = []
+    for s in range(count):
+        url = 'http://127.0.0.%d:%d/source%d' % (s % 250 + 1, port, s)
+        source = AsyncSource(url, memoize_articles=False, fetch_images=False)
+        source.articles = [AsyncArticle('%s/2022/06/01/story-%d.html' % (url, s * articles + i),
+                                        source_url=url, config=source.config) for i in range(articles)]
+        sources.append(source)
+    return sources
+
+
+def run(pool, sources, threads, **kwargs):
+    async def crawl():
+        await pool.async_set(sources, threads_per_source=threads, **kwargs)
+        await pool.async_join()
+
+    start = time.perf_counter()
+    anyio.run(crawl)
+    return sum(len(s.articles) for s in sources) / (time.perf_counter() - start)
+
+
+def run_stream(pool, sources, threads, stream, buffer_size):
+    first = None
+    start = time.perf_counter()
+
+    async def crawl():
+        nonlocal first
+        if stream:
+            async with pool.async_iter_completed(sources, threads_per_source=threads, processes=0,
+                                                 buffer_size=buffer_size) as stream:
+                async for article in stream:
+                    first = first or time.perf_counter() - start
+                    article.html = ''
+            return
+        await pool.async_set(sources, threads_per_source=threads, processes=0)
+        await pool.async_join()
+        first = time.perf_counter() - start
+        for source in sources:
+            for article in source.articles:
+                article.html = ''
+
+    tracemalloc.start()
+    anyio.run(crawl)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, time.perf_counter() - start, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=8)
+    parser.add_argument('--articles', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=5, help='articles of a source downloaded at once')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    corpus = [make_html(i).encode() for i in range(50)]
+    server = serve(corpus, args.latency)
+    port = server.server_address[1]
+    pool = AsyncNewsPool()
+    try:
+        # start the worker processes outside the timing
+        run(pool, make_sources(port, args.processes, 1), 1, processes=args.processes, parse=True)
+
+        print('%d sources x %d articles, %d at once per source, %.0f ms latency' % (
+            args.sources, args.articles, args.threads, args.latency * 1000))
+        for parse in (False, True):
+            label = 'download + parse' if parse else 'download'
+            for processes in (0, args.processes):
+                sources = make_sources(port, args.sources, args.articles)
+                speed = run(pool, sources, args.threads, processes=processes, parse=parse)
+                assert sum(len(s.articles) for s in sources) == args.sources * args.articles
+                print('%-17s %-14s %8.1f articles/s' % (
+                    label, '%d processes' % processes if processes else 'event loop', speed))
+
+        for stream in (False, True):
+            first, total, peak = run_stream(pool, make_sources(port, args.sources, args.articles),
+                                            args.threads, stream, buffer_size=10)
+            print('%-20s first article after %6.2fs of %6.2fs   peak %6.1f MB' % (
+                'async_iter_completed' if stream else 'async_join', first, total, peak / 1e6))
+    finally:
+        pool.shutdown()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Fetch scheduling across hosts: a plain global limit (first come, first
+served, what one thread per source amounts to once the pool is full)
+against scheduler.FetchScheduler, for a few big sources queued ahead of
+many small ones. Requests are simulated, each takes `--latency` seconds.
+
+Reports the throughput against the ideal (concurrency / latency), when
+the small sources are done, and the most requests a host had in flight.
+Once only the big hosts are left, the fair scheduler can't go faster than
+their per host limits allow.
+
+    python benchmarks/bench_scheduler.py --concurrency 20 --big-hosts 5 --big 100
+"""
+import argparse
+import statistics
+import time
+
+import anyio
+
+from newz.scheduler import FetchScheduler
+
+
+def make_requests(big_hosts, big, small, per_small):
+    return [('big%d.test' % b, i) for b in range(big_hosts) for i in range(big)] + \
+        [('small%d.test' % s, i) for s in range(small) for i in range(per_small)]
+
+
+def run(requests, latency, slot):
+    done = {}
+    active = {}
+    peak = {}
+    start = time.perf_counter()
+
+    async def request(host):
+        async with slot(host):
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+            await anyio.sleep(latency)
+            active[host] -= 1
+        done[host] = time.perf_counter() - start
+
+    async def main():
+        async with anyio.create_task_group() as task_group:
+            for host, _ in requests:
+                task_group.start_soon(request, host)
+
+    anyio.run(main)
+    elapsed = time.perf_counter() - start
+    small_done = [t for host, t in done.items() if host.startswith('small')]
+    return len(requests) / elapsed, statistics.median(small_done), max(small_done), max(peak.values())
+
+
+def fifo(concurrency):
+    limiter = None
+
+    def slot(host):
+        nonlocal limiter
+        limiter = limiter or anyio.CapacityLimiter(concurrency)
+        return limiter
+    return slot
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--big-hosts', type=int, default=5)
+    parser.add_argument('--big', type=int, default=100)
+    parser.add_argument('--small', type=int, default=20)
+    parser.add_argument('--per-small', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--domain-concurrency', type=int, default=4)
+    parser.add_argument('--domain-rate', type=float, default=100)
+    args = parser.parse_args()
+
+    requests = make_requests(args.big_hosts, args.big, args.small, args.per_small)
+    print('%d requests, %d hosts, %d at once, %.0f ms each (ideal %.0f requests/s)' % (
+        len(requests), args.big_hosts + args.small, args.concurrency, args.latency * 1000,
+        args.concurrency / args.latency))
+    schedulers = {
+        'fifo': lambda: fifo(args.concurrency),
+        'fair': lambda: FetchScheduler(args.concurrency, args.domain_concurrency).slot,
+        'fair + %g/s' % args.domain_rate: lambda: FetchScheduler(
+            args.concurrency, args.domain_concurrency, domain_rate=args.domain_rate,
+            domain_burst=args.domain_concurrency).slot,
+    }
+    for name, make_slot in schedulers.items():
+        throughput, small_median, small_last, host_peak = run(requests, args.latency, make_slot())
+        print('%-12s %7.0f requests/s   small sources done %.2fs (median) %.2fs (last)   '
+              'host peak %d in flight' % (name, throughput, small_median, small_last, host_peak))
+
+
+if __name__ == '__main__':
+    main()
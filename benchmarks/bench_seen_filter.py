@@ -0,0 +1,72 @@
+"""
+Seen-url checks: the per-domain SQLite memo alone against the memo behind
+the shared Bloom filter (utils/bloom.py), for batches of mostly new urls
+as category pages produce them, both for plain lookups and for the
+check-and-record path memoize_articles uses. Also reports the filter's
+measured false positive rate against the configured one.
+
+Everything here runs from a warm page cache, which is the filter's worst
+case: its gain is the database pages it saves reading.
+
+    python benchmarks/bench_seen_filter.py --stored 200000 --batch 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from newz.utils.bloom import BloomFilter
+from newz.utils.memo import SeenStore
+
+
+def make_batches(stored, batch_size, count):
+    # 5% of every batch was seen before, the rest is new
+    batches = []
+    for b in range(count):
+        seen = stored[b * batch_size // 20:(b + 1) * batch_size // 20]
+        new = ['http://news.test/2022/06/02/new-%d-%d.html' % (b, i)
+               for i in range(batch_size - len(seen))]
+        batches.append(seen + new)
+    return batches
+
+
+def urls_per_second(func, batches):
+    start = time.perf_counter()
+    for batch in batches:
+        func(batch)
+    return sum(map(len, batches)) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stored', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--batches', type=int, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.001)
+    args = parser.parse_args()
+
+    stored = ['http://news.test/2022/06/01/story-%d.html' % i for i in range(args.stored)]
+    lookups = make_batches(stored, args.batch, args.batches)
+    with tempfile.TemporaryDirectory() as tmp:
+        bloom = BloomFilter(os.path.join(tmp, 'seen.bloom'), capacity=args.stored * 2,
+                            error_rate=args.error_rate)
+        stores = {
+            'sqlite memo': SeenStore(os.path.join(tmp, 'plain.sqlite')),
+            'bloom + sqlite memo': SeenStore(os.path.join(tmp, 'fronted.sqlite'), bloom=bloom),
+        }
+        for name, store in stores.items():
+            store.add_many(stored)
+            print('%-20s contains_many %10.0f urls/s   add_many %10.0f urls/s' % (
+                name, urls_per_second(store.contains_many, lookups),
+                urls_per_second(store.add_many, make_batches(stored, args.batch, args.batches))))
+
+        absent = ['http://other.test/%d' % i for i in range(100000)]
+        false_positive_rate = len(bloom.contains_many(absent)) / len(absent)
+        print('bloom false positives %.4f%% (configured %.4f%%) at %d/%d urls, %.1f MB file' % (
+            false_positive_rate * 100, args.error_rate * 100, bloom.count, bloom.capacity,
+            os.path.getsize(bloom.path) / 1e6))
+        bloom.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Memory of AsyncSource builds, with and without config.lean_source, on a
+synthetic site served by an in-process transport.
+
+For every build it reports the tracemalloc peak (python objects allocated
+while building) and what stays allocated while the built sources are kept
+alive, as a crawler holding many sources does. lxml trees live in libxml2's
+own heap, which tracemalloc doesn't see, so the resident set size growth of
+the process is reported next to it.
+
+    python benchmarks/bench_source_memory.py --sources 10 --categories 30
+"""
+import argparse
+import gc
+import logging
+import os
+import tempfile
+import tracemalloc
+
+import anyio
+import httpx
+
+from newz import network
+from newz import source as source_module
+from newz.source import AsyncSource
+
+
+def make_pages(categories, links, padding):
+    filler = '<p>%s</p>' % ('Some words about the section and its stories. ' * padding)
+    pages = {'/': '<html><head><title>Memory</title></head><body>%s</body></html>' % ''.join(
+        '<a href="/section%d">Section %d</a>' % (c, c) for c in range(categories))}
+    for c in range(categories):
+        pages['/section%d' % c] = '<html><body>%s%s</body></html>' % (filler, ''.join(
+            '<a href="/2022/06/01/section-%d-story-number-%d-about-something.html">Story %d of section %d</a>'
+            % (c, i, i, c) for i in range(links)))
+    pages['/rss'] = '<rss><channel>%s</channel></rss>' % ''.join(
+        '<item><title>Story %d</title><link>/2022/06/02/feed-story-number-%d-about-something.html</link>'
+        '<description>%s</description></item>' % (i, i, filler) for i in range(links))
+    return pages
+
+
+def make_handler(pages):
+    def handler(request: httpx.Request):
+        body = pages.get(request.url.path)
+        if body is None:
+            return httpx.Response(404, text='not found')
+        content_type = 'application/rss+xml' if body.startswith('<rss') else 'text/html'
+        return httpx.Response(200, text=body, headers={'content-type': content_type + '; charset=utf-8'})
+    return handler
+
+
+def rss() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def run(count, lean):
+    sources = []
+    peaks = []
+    gc.collect()
+    rss_before = rss()
+    tracemalloc.start()
+    for i in range(count):
+        source = AsyncSource('http://site%d-%s.test' % (i, lean), memoize_articles=False, lean_source=lean)
+        tracemalloc.reset_peak()
+        anyio.run(source.async_build)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        sources.append(source)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return sources, peaks, retained, rss() - rss_before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=10)
+    parser.add_argument('--categories', type=int, default=30)
+    parser.add_argument('--links', type=int, default=200)
+    parser.add_argument('--padding', type=int, default=400)
+    args = parser.parse_args()
+
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    handler = make_handler(make_pages(args.categories, args.links, args.padding))
+    network.get_async_client = lambda config=None: httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with tempfile.TemporaryDirectory() as tmp:
+        source_module.ANCHOR_DIRECTORY = tmp
+        AsyncSource._async_get_category_urls.cache.directory = tmp
+
+        print('%d sources of %d categories, %d links each' % (args.sources, args.categories, args.links))
+        for lean in (False, True):
+            sources, peaks, retained, rss_growth = run(args.sources, lean)
+            articles = sum(len(s.articles) for s in sources)
+            print('%-8s peak/build %7.1f MB (max %7.1f MB)   retained %7.1f MB   rss +%7.1f MB   %d articles' % (
+                'lean' if lean else 'default', sum(peaks) / len(peaks) / 1e6, max(peaks) / 1e6,
+                retained / 1e6, rss_growth / 1e6, articles))
+            del sources
+
+
+if __name__ == '__main__':
+    main()
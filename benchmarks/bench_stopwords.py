@@ -0,0 +1,97 @@
+"""
+Per-language stopword counting benchmark.
+
+Counts synthetic node texts with the current text.StopWords classes and
+with a copy of the previous implementation, checks that both give
+identical counts and prints node texts per second for each.
+
+    python benchmarks/bench_stopwords.py --nodes 2000 --languages en ko hi
+"""
+import argparse
+import random
+import string
+import time
+
+from newz.configuration import Configuration
+from newz.text import StopWords, StopWordsHindi, StopWordsKorean
+from newz.utils.helpers import get_available_languages
+
+
+def legacy_count(stopwords, content):
+    """The counting loop text.StopWords used before the engine rewrite
+    """
+    if type(stopwords).remove_punctuation is StopWords.remove_punctuation:
+        trans_table = {ord(c): None for c in string.punctuation}
+        stripped_input = content.encode('utf-8').decode('utf-8').translate(trans_table)
+    else:
+        stripped_input = stopwords.remove_punctuation(content)
+    if isinstance(stopwords, StopWordsKorean):
+        words = list(stopwords.candidate_words(stripped_input))
+        return sum(1 for w in words for s in stopwords.STOP_WORDS if w.endswith(s))
+    if isinstance(stopwords, StopWordsHindi):
+        words = list(stopwords.candidate_words(stripped_input))
+        return sum(1 for w in words for _ in stopwords.STOP_WORDS)
+    words = list(stopwords.candidate_words(stripped_input.lower()))
+    return sum(1 for w in words if w in stopwords.STOP_WORDS)
+
+
+def make_nodes(stopwords, num_nodes, words_per_node, seed=0):
+    rng = random.Random(seed)
+    vocab = sorted(stopwords.STOP_WORDS)
+    filler = ['lorem', 'ipsum', 'dolor', 'sit', 'amet']
+    nodes = []
+    for _ in range(num_nodes):
+        words = []
+        for _ in range(words_per_node):
+            kind = rng.random()
+            if kind < 0.4:
+                words.append(rng.choice(vocab))
+            elif kind < 0.7:
+                words.append(rng.choice(filler) + rng.choice(vocab))
+            else:
+                words.append(rng.choice(filler) + rng.choice(string.punctuation))
+        nodes.append(' '.join(words))
+    return nodes
+
+
+def timed(func, nodes):
+    start = time.perf_counter()
+    results = func(nodes)
+    return results, time.perf_counter() - start
+
+
+def bench_language(language, num_nodes, words_per_node):
+    stopwords_class = Configuration.get_stopwords_class(language)
+    try:
+        stopwords = stopwords_class(language=language)
+        stopwords.get_stopword_count('warmup')
+    except ImportError as e:
+        print('%-4s skipped (%s)' % (language, e))
+        return
+
+    nodes = make_nodes(stopwords, num_nodes, words_per_node)
+    # segmenters such as jieba fill internal caches on first sight of a
+    # text, so neither run should pay for that
+    stopwords.get_stopword_counts(nodes)
+    legacy, legacy_secs = timed(lambda n: [legacy_count(stopwords, c) for c in n], nodes)
+    current, current_secs = timed(
+        lambda n: [ws.get_stopword_count() for ws in stopwords.get_stopword_counts(n)], nodes)
+    assert legacy == current, 'stopword counts differ for %s' % language
+    print('%-4s %-18s legacy %9.0f nodes/s   engine %9.0f nodes/s   x%.1f' % (
+        language, stopwords_class.__name__, num_nodes / legacy_secs,
+        num_nodes / current_secs, legacy_secs / current_secs))
+
+
+def run_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=2000)
+    parser.add_argument('--words', type=int, default=60)
+    parser.add_argument('--languages', nargs='*', default=None)
+    args = parser.parse_args()
+
+    for language in args.languages or get_available_languages():
+        bench_language(language, args.nodes, args.words)
+
+
+if __name__ == '__main__':
+    run_bench()
@@ -0,0 +1,63 @@
+"""
+The sync api: Article.download() called in a loop, as a sync script
+would, with an event loop (and so a client and its connections) per call
+(anyio.run, what Executor.run_as_sync used to do) against the background
+loop of Executor.run_as_sync, which keeps its loop and connections.
+Then NewsPool.set + join of a few sources on that loop.
+
+    python benchmarks/bench_sync.py --articles 200 --latency 0.005
+"""
+import argparse
+import logging
+import time
+
+import anyio
+
+from newz.article import AsyncArticle
+from newz.mthreading import AsyncNewsPool
+from newz.source import AsyncSource
+
+from bench_pool import make_html, serve
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=200)
+    parser.add_argument('--sources', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.005)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    server = serve([make_html(i).encode() for i in range(10)], args.latency)
+    site = 'http://127.0.0.1:%d' % server.server_address[1]
+    urls = ['%s/story-%d.html' % (site, i) for i in range(args.articles)]
+
+    def per_call_loop(article):
+        anyio.run(article.async_download)
+
+    for name, download in (('loop per call', per_call_loop),
+                           ('background loop', AsyncArticle.download)):
+        start = time.perf_counter()
+        for url in urls:
+            article = AsyncArticle(url, fetch_images=False)
+            download(article)
+            assert article.html
+        elapsed = time.perf_counter() - start
+        print('%-16s %6.2f ms per download' % (name, elapsed * 1000 / len(urls)))
+
+    sources = []
+    for index in range(args.sources):
+        source = AsyncSource('%s/s%d' % (site, index), memoize_articles=False, fetch_images=False)
+        source.articles = [AsyncArticle(url, config=source.config) for url in urls]
+        sources.append(source)
+    start = time.perf_counter()
+    pool = AsyncNewsPool()
+    pool.set(sources, threads_per_source=5)
+    pool.join()
+    elapsed = time.perf_counter() - start
+    print('pool set + join  %6.0f articles/s' % (sum(len(s.articles) for s in sources) / elapsed))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Cost of tracing.TraceRecorder: the same parsed AsyncNewsPool crawl of a
+local server (no latency) without a recorder, with one writing every
+article's trace, and with one also tracking memory (tracemalloc). Slow
+articles (`--slow` seconds, not counting the time queued) are captured in
+each case, `--max-captures` at most.
+
+    python benchmarks/bench_tracing.py --sources 4 --articles 100
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import anyio
+
+from newz.mthreading import AsyncNewsPool
+from newz.tracing import TraceRecorder
+
+from bench_pool import make_html, make_sources, serve
+
+
+def crawl(port, args, recorder=None):
+    sources = make_sources(port, args.sources, args.articles)
+    pool = AsyncNewsPool(recorder=recorder)
+
+    async def main():
+        await pool.async_set(sources, threads_per_source=args.threads, processes=0, parse=True)
+        await pool.async_join()
+
+    start = time.perf_counter()
+    anyio.run(main)
+    elapsed = time.perf_counter() - start
+    if recorder is not None:
+        recorder.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=4)
+    parser.add_argument('--articles', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=5)
+    parser.add_argument('--slow', type=float, default=5.0)
+    parser.add_argument('--max-captures', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    server = serve([make_html(i).encode() for i in range(50)], 0)
+    port = server.server_address[1]
+    total = args.sources * args.articles
+    directory = tempfile.mkdtemp()
+    print('%d sources x %d articles, parsed' % (args.sources, args.articles))
+
+    crawl(port, args)
+    runs = {'no recorder': [], 'traced': [], 'traced + memory': []}
+    recorders = {}
+    for i in range(args.repeat):
+        runs['no recorder'].append(crawl(port, args))
+        for name, memory_threshold in (('traced', None), ('traced + memory', 50 * 1024 * 1024)):
+            recorder = recorders[name] = TraceRecorder(
+                os.path.join(directory, '%s-%d.jsonl' % (name.replace(' ', ''), i)), slow_seconds=args.slow,
+                memory_threshold=memory_threshold, capture_directory=os.path.join(directory, 'captures'),
+                max_captures=args.max_captures)
+            runs[name].append(crawl(port, args, recorder))
+    baseline = min(runs['no recorder'])
+    for name, times in runs.items():
+        elapsed = min(times)
+        recorder = recorders.get(name)
+        print('%-16s %7.2fs  %+6.1f%%  %6.0f us per article%s' % (
+            name, elapsed, (elapsed / baseline - 1) * 100, (elapsed - baseline) * 1e6 / total,
+            '  %d captures, %.1f MB of traces' % (recorder.captures, os.path.getsize(recorder.path) / 1e6)
+            if recorder else ''))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Article-url classification throughput: newspaper's urls.valid_url against
+newz.urls.is_article_url, on the links of category pages. The first newz
+pass starts from empty caches (a first build), the second is a rebuild
+of the same pages.
+
+Pass saved category pages to use real ones, otherwise synthetic pages
+with a news site's mix of navigation, section and article links are used:
+
+    curl -s https://www.cnn.com/world > world.html
+    python benchmarks/bench_urls.py --base https://www.cnn.com world.html
+"""
+import argparse
+import random
+import time
+
+from newspaper import urls as newspaper_urls
+
+from newz.configuration import Configuration
+from newz import urls as newz_urls
+
+SECTIONS = ['world', 'politics', 'business', 'tech', 'sport', 'video', 'opinion', 'live-news', 'travel']
+STATIC = ['/about', '/careers', '/privacy', '/terms', '/subscribe', '/account/login', '/newsletters',
+          '/static/logo.png', '/static/app.js', '/feeds/rss.xml', '/']
+
+
+def synthetic_links(base, pages, links_per_page, seed=1):
+    rng = random.Random(seed)
+    links = []
+    for page in range(pages):
+        for i in range(links_per_page):
+            kind = rng.random()
+            section = rng.choice(SECTIONS)
+            if kind < 0.3:
+                links.append(base + rng.choice(STATIC))
+            elif kind < 0.45:
+                links.append('%s/%s/%s' % (base, section, rng.choice(SECTIONS)))
+            else:
+                words = '-'.join(rng.choice(['storm', 'vote', 'market', 'team', 'city', 'plan', 'deal', 'wins'])
+                                 for _ in range(rng.randint(3, 8)))
+                links.append('%s/2022/06/%02d/%s/%s-%d.html' % (base, rng.randint(1, 28), section, words, page * 1000 + i))
+    return links
+
+
+def page_links(base, paths):
+    parser = Configuration.get_parser()
+    links = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            doc = parser.fromstring(f.read())
+        links.extend(newspaper_urls.prepare_url(a.get('href'), base) for a in parser.getElementsByTag(doc, tag='a')
+                     if a.get('href'))
+    return links
+
+
+def rate(func, links):
+    start = time.perf_counter()
+    decisions = [func(url) for url in links]
+    return len(links) / (time.perf_counter() - start), decisions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages', nargs='*', help='saved category pages')
+    parser.add_argument('--base', default='https://news.test')
+    parser.add_argument('--synthetic-pages', type=int, default=50)
+    parser.add_argument('--links-per-page', type=int, default=400)
+    args = parser.parse_args()
+
+    if args.pages:
+        links = page_links(args.base, args.pages)
+    else:
+        links = synthetic_links(args.base, args.synthetic_pages, args.links_per_page)
+
+    # warm tldextract's own suffix list outside the timing
+    newspaper_urls.valid_url(args.base + '/warmup/2022/06/01/x.html')
+    newspaper_rate, expected = rate(newspaper_urls.valid_url, links)
+    newz_urls.is_article_url.cache_clear()
+    newz_urls._split_host.cache_clear()
+    first_rate, decisions = rate(newz_urls.is_article_url, links)
+    assert decisions == expected
+    rebuild_rate, _ = rate(newz_urls.is_article_url, links)
+
+    print('%d links, %d unique, %d articles' % (len(links), len(set(links)), sum(expected)))
+    print('newspaper valid_url       %10.0f urls/s' % newspaper_rate)
+    print('newz first build          %10.0f urls/s  (%.1fx)' % (first_rate, first_rate / newspaper_rate))
+    print('newz rebuild (cached)     %10.0f urls/s  (%.1fx)' % (rebuild_rate, rebuild_rate / newspaper_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+A stand-in for the publishers saved in benchmarks/corpus, so benchmarks
+crawl real looking sites offline: an asyncio http/1.1 server (keep-alive,
+GET and HEAD) answering from the saved pages after `latency` seconds,
+give or take `jitter` (a fraction of it).
+
+The corpus is a mirror of a few sites, a directory each with a file per
+url path ('/world' is world/index.html, '/rss' rss/index.xml, '/' is
+index.html), listed in corpus/sites.json with their original origin,
+language and article paths. Copy i of the sites is site i % len(sites)
+served on host 127.0.0.(i + 1), so every source is a host of its own,
+and the links to the original origin are rewritten to that host. A
+site's _redirects file has a 'from to status' line per redirect.
+
+    python benchmarks/corpus_server.py --copies 2 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+
+from typing import Dict, List, Optional, Tuple
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+CONTENT_TYPES = {'.html': 'text/html', '.htm': 'text/html', '.xml': 'application/rss+xml'}
+REASONS = {200: 'OK', 301: 'Moved Permanently', 302: 'Found', 404: 'Not Found', 405: 'Method Not Allowed'}
+NOT_FOUND = b'<html><head><title>404 Not Found</title></head><body><h1>Not Found</h1></body></html>'
+
+
+class Site(object):
+    __slots__ = ('name', 'origin', 'language', 'articles', 'directory', 'redirects')
+
+    def __init__(self, name: str, origin: str, language: str, articles: List[str], corpus: str = CORPUS):
+        self.name = name
+        self.origin = origin
+        self.language = language
+        # paths of the saved articles
+        self.articles = articles
+        self.directory = os.path.join(corpus, name)
+        self.redirects: Dict[str, Tuple[int, str]] = {}
+        path = os.path.join(self.directory, '_redirects')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        source, target, status = line.split()
+                        self.redirects[source] = (int(status), target)
+
+    def find(self, path: str) -> Optional[str]:
+        """The file saved for a url path
+        """
+        relative = os.path.normpath(path.lstrip('/') or '.')
+        if relative.startswith('..') or os.path.basename(relative) == '_redirects':
+            return None
+        base = os.path.join(self.directory, relative)
+        for candidate in (base, os.path.join(base, 'index.html'), os.path.join(base, 'index.xml')):
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+
+def load_sites(corpus: str = CORPUS) -> List[Site]:
+    with open(os.path.join(corpus, 'sites.json'), encoding='utf-8') as f:
+        return [Site(item['name'], item['origin'], item['language'], item['articles'], corpus)
+                for item in json.load(f)]
+
+
+def host(index: int) -> str:
+    return '127.0.0.%d' % (index % 250 + 1)
+
+
+def source_urls(sites: List[Site], port: int, copies: int = 1) -> List[Tuple[str, Site]]:
+    """(url, site) of every source served, `copies` of each site
+    """
+    return [('http://%s:%d' % (host(i), port), sites[i % len(sites)]) for i in range(copies * len(sites))]
+
+
+class CorpusServer(object):
+    """
+    >>> server = CorpusServer(latency=0.05)
+    >>> port = server.start()
+    >>> urls = source_urls(server.sites, port, copies=4)
+    >>> server.stop()
+
+    Runs its event loop on a thread of its own. Rewritten pages are
+    cached, every page is read from disk once per host
+    """
+    def __init__(self, sites: List[Site] = None, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.sites = sites or load_sites()
+        self.latency = latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        # (host, path) -> status, headers, body
+        self.pages: Dict[Tuple[str, str], Tuple[int, List[Tuple[str, str]], bytes]] = {}
+        self.requests = 0
+        self.loop: asyncio.AbstractEventLoop = None
+        self.server: asyncio.AbstractServer = None
+        self.thread: threading.Thread = None
+
+    def start(self, port: int = 0) -> int:
+        """Serves on all of 127.0.0.0/8, returns the port
+        """
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='corpus-server', daemon=True)
+        self.thread.start()
+        # started on the server's own loop, so this works from inside a running one too
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, '0.0.0.0', port, backlog=1024), self.loop).result(5)
+        return self.server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self.loop is None:
+            return
+
+        async def close():
+            self.server.close()
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.loop = None
+
+    def site_of(self, host_header: str) -> Optional[Site]:
+        address = host_header.rsplit(':', 1)[0]
+        parts = address.split('.')
+        if len(parts) != 4 or parts[:3] != ['127', '0', '0'] or not parts[3].isdigit():
+            return None
+        return self.sites[(int(parts[3]) - 1) % len(self.sites)]
+
+    def page(self, host_header: str, path: str) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        key = (host_header, path)
+        page = self.pages.get(key)
+        if page is None:
+            page = self.pages[key] = self._load(host_header, path)
+        return page
+
+    def _load(self, host_header: str, path: str) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        site = self.site_of(host_header)
+        if site is None:
+            return 404, [('content-type', 'text/html')], NOT_FOUND
+        if path in site.redirects:
+            status, target = site.redirects[path]
+            return status, [('location', target), ('content-type', 'text/html')], b''
+        filename = site.find(path)
+        if filename is None:
+            return 404, [('content-type', 'text/html')], NOT_FOUND
+        with open(filename, 'rb') as f:
+            body = f.read().replace(site.origin.encode(), ('http://' + host_header).encode())
+        content_type = CONTENT_TYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+        if content_type == 'application/rss+xml' and b'<feed' in body[:300]:
+            content_type = 'application/atom+xml'
+        return 200, [('content-type', content_type + '; charset=utf-8')], body
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                method, target, _ = lines[0].split(' ', 2)
+                headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+                headers = {k.strip().lower(): v.strip() for k, v in headers.items()}
+                self.requests += 1
+
+                if self.latency:
+                    spread = self.latency * self.jitter
+                    await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-spread, spread)))
+                if method in ('GET', 'HEAD'):
+                    status, page_headers, body = self.page(headers.get('host', ''), target.split('?', 1)[0])
+                else:
+                    status, page_headers, body = 405, [('content-type', 'text/html')], b''
+                close = headers.get('connection', '').lower() == 'close'
+                response = ['HTTP/1.1 %d %s' % (status, REASONS.get(status, 'Unknown')),
+                            'content-length: %d' % len(body)] + ['%s: %s' % h for h in page_headers]
+                if close:
+                    response.append('connection: close')
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--copies', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = CorpusServer(latency=args.latency, jitter=args.jitter)
+    port = server.start(args.port)
+    for url, site in source_urls(server.sites, port, args.copies):
+        print('%s  %s (%s)' % (url, site.name, site.language))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,85 @@
+"""
+Importing newz is cheap and side-effect free: the public names below are
+resolved on first access through the module level `__getattr__`, so
+feedparser, nltk, bs4, httpx and the newspaper3k stack only load once
+they are actually used.
+"""
+import importlib
+import threading
 import warnings
 warnings.filterwarnings('ignore', message='Unclosed')
 
-from .api import (
-    build, 
-    async_build,
-    build_article,
-    async_build_article, 
-    fulltext, 
-    hot, 
-    async_hot,
-    languages,
-    popular_urls, 
-    Configuration as Config
-)
-
-from .article import Article, ArticleException, AsyncArticle
-from .mthreading import NewsPool, AsyncNewsPool
-from .source import Source, AsyncSource
+from typing import TYPE_CHECKING
+
 from .version import __version__
 
-news_pool = NewsPool()
-async_news_pool = AsyncNewsPool()
+if TYPE_CHECKING:
+    from .api import (
+        build,
+        async_build,
+        build_article,
+        async_build_article,
+        fulltext,
+        hot,
+        async_hot,
+        languages,
+        popular_urls,
+        warmup,
+        Configuration as Config
+    )
+    from .article import Article, ArticleException, AsyncArticle
+    from .mthreading import NewsPool, AsyncNewsPool
+    from .source import Source, AsyncSource
+
+    news_pool: NewsPool
+    async_news_pool: AsyncNewsPool
+
+
+_lazy_attributes = {
+    'build': ('.api', 'build'),
+    'async_build': ('.api', 'async_build'),
+    'build_article': ('.api', 'build_article'),
+    'async_build_article': ('.api', 'async_build_article'),
+    'fulltext': ('.api', 'fulltext'),
+    'hot': ('.api', 'hot'),
+    'async_hot': ('.api', 'async_hot'),
+    'languages': ('.api', 'languages'),
+    'popular_urls': ('.api', 'popular_urls'),
+    'warmup': ('.api', 'warmup'),
+    'Config': ('.api', 'Configuration'),
+    'Article': ('.article', 'Article'),
+    'ArticleException': ('.article', 'ArticleException'),
+    'AsyncArticle': ('.article', 'AsyncArticle'),
+    'NewsPool': ('.mthreading', 'NewsPool'),
+    'AsyncNewsPool': ('.mthreading', 'AsyncNewsPool'),
+    'Source': ('.source', 'Source'),
+    'AsyncSource': ('.source', 'AsyncSource'),
+}
+
+# Module level pools, created on first access
+_lazy_instances = {
+    'news_pool': 'NewsPool',
+    'async_news_pool': 'AsyncNewsPool',
+}
+_lazy_lock = threading.RLock()
+
+__all__ = ['__version__'] + list(_lazy_attributes) + list(_lazy_instances)
+
+
+def __getattr__(name: str):
+    if name not in _lazy_attributes and name not in _lazy_instances:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _lazy_lock:
+        if name in globals():
+            return globals()[name]
+        if name in _lazy_instances:
+            value = __getattr__(_lazy_instances[name])()
+        else:
+            module_name, attr = _lazy_attributes[name]
+            value = getattr(importlib.import_module(module_name, __name__), attr)
+        globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -5,14 +5,13 @@ anything which a user might need to import from newspaper.
 View newspaper/__init__.py for its usage.
 """
 
-import feedparser
-
 from .article import AsyncArticle
 from .configuration import Configuration
-from .settings import POPULAR_URLS
 from .source import Source, AsyncSource
-from .utils.helpers import extend_config, print_available_languages
+from .utils import logger as log
+from .utils.helpers import extend_config, get_available_languages, print_available_languages
 from .utils.executor import Executor
+from .utils.resources import ResourceRegistry
 
 from newspaper.api import (
     build,
@@ -54,9 +53,21 @@ def languages():
 def popular_urls():
     """Returns a list of pre-extracted popular source urls
     """
-    with open(POPULAR_URLS) as f:
-        urls = ['http://' + u.strip() for u in f.readlines()]
-        return urls
+    return ['http://' + u for u in ResourceRegistry.get_popular_sources()]
+
+
+def warmup(languages=None):
+    """Loads the resource index and builds the segmenters / stemmers of
+    `languages` (every available language by default) up front, so the
+    first article in a language doesn't pay for it. Languages whose
+    segmenter isn't installed are skipped.
+    """
+    for language in languages or get_available_languages():
+        stopwords_class = Configuration.get_stopwords_class(language)
+        try:
+            stopwords_class(language=language).warmup()
+        except ImportError as e:
+            log.debug('Skipping warmup of %s: %s' % (language, e))
 
 
 async def async_hot():
@@ -1,7 +1,10 @@
 
+from typing import List, Tuple
 from urllib.parse import urlparse
 
+import anyio
 import httpx
+import lxml.html
 from fileio import File
 from . import network
 from . import nlp
@@ -11,6 +14,8 @@ from .utils.helpers import (
     extract_meta_refresh
 )
 from .utils import logger as log
+from .utils import metrics
+from .tracing import TimedExtractor, span
 from newspaper.article import (
     ArticleDownloadState,
     ArticleException,
@@ -18,13 +23,104 @@ from newspaper.article import (
 )
 
 
+# Attributes of a parsed article that stay in the worker process: the
+# lxml trees don't pickle, the rest is already on the caller's side
+WORKER_ONLY_ATTRIBUTES = ('doc', 'clean_doc', 'top_node', 'clean_top_node', 'extractor', 'config', 'html')
+
+
+def guard_html(html, config: Configuration) -> Tuple[str, List[str]]:
+    """Cuts pathological html down to the parse budget of `config`
+    before the article is parsed: to MAX_HTML_BYTES characters (at a tag),
+    and if lxml finds more than MAX_DOM_NODES elements or elements deeper
+    than MAX_DOM_DEPTH, without the elements after the first
+    MAX_DOM_NODES and the children of the deepest ones. Returns the html
+    and the limits it hit ('bytes', 'nodes', 'depth')
+    """
+    truncated = []
+    if not html:
+        return html, truncated
+    if not isinstance(html, str):
+        html = config.get_parser().get_unicode_html(html)
+    max_bytes = config.MAX_HTML_BYTES
+    if max_bytes and len(html) > max_bytes:
+        cut = html.rfind('<', 0, max_bytes)
+        html = html[:cut if cut > 0 else max_bytes]
+        truncated.append('bytes')
+    max_nodes, max_depth = config.MAX_DOM_NODES, config.MAX_DOM_DEPTH
+    if not max_nodes and not max_depth:
+        return html, truncated
+    try:
+        doc = lxml.html.fromstring(html)
+    except Exception:
+        # the parse itself will fail the same way
+        return html, truncated
+    nodes = int(doc.xpath('count(//*)'))
+    if max_nodes and nodes > max_nodes:
+        for element in reversed(doc.xpath('(//*)[position() > $n]', n=max_nodes)):
+            if element.getparent() is not None:
+                element.drop_tree()
+        truncated.append('nodes')
+    if max_depth and min(nodes, max_nodes or nodes) > max_depth:
+        deepest = doc.xpath('//*[count(ancestor::*) = $depth]', depth=max_depth)
+        for element in deepest:
+            for child in list(element):
+                child.drop_tree()
+        if deepest:
+            truncated.append('depth')
+    if 'nodes' in truncated or 'depth' in truncated:
+        html = lxml.html.tostring(doc, encoding='unicode')
+    return html, truncated
+
+
+def parse_in_process(url: str, html: str, title: str, source_url: str, config: Configuration):
+    """Parses a downloaded article in a process pool worker. Returns the
+    parsed attributes and whether the body is valid, which needs the
+    trees that are left behind
+    """
+    article = Article(url, title=title, source_url=source_url, config=config)
+    article.set_html(html)
+    article.html, article.truncated = guard_html(article.html, config)
+    article.parse()
+    valid_body = article.is_parsed and article.is_valid_body()
+    state = {k: v for k, v in article.__dict__.items() if k not in WORKER_ONLY_ATTRIBUTES}
+    return state, valid_body
+
+
+# Attributes an article crawled in another process comes back with, as a
+# tuple in this order: plain strings, lists and dates, much smaller to
+# pickle than the article with its trees, see mthreading.AsyncNewsPool
+RECORD_ATTRIBUTES = ('title', 'html', 'download_state', 'download_exception_msg', 'is_parsed', 'valid_body',
+                     'text', 'authors', 'publish_date', 'top_img', 'top_image', 'meta_img', 'imgs', 'images',
+                     'movies', 'keywords', 'meta_keywords', 'tags', 'summary', 'article_html',
+                     'meta_description', 'meta_lang', 'meta_favicon', 'meta_data', 'canonical_link',
+                     'additional_data', 'truncated')
+
+
+def article_to_record(article: Article) -> tuple:
+    return tuple(getattr(article, name, None) for name in RECORD_ATTRIBUTES)
+
+
+def apply_record(article: Article, record: tuple):
+    """Fills `article` (the caller's copy) with the record of a worker's
+    """
+    article.__dict__.update(zip(RECORD_ATTRIBUTES, record))
+
+
 class AsyncArticle(Article):
     """Article objects abstract an online news article page
     """
     def __init__(self, url: str, title: str = '', source_url: str = '', num_keywords: int = 10, config = None, **kwargs):
         self.num_keywords = num_keywords
+        # set when parsed in another process, see async_parse
+        self.valid_body = None
+        # parse limits the html hit, see guard_html
+        self.truncated: List[str] = []
+        # tracing.ArticleTrace while a TraceRecorder follows the article
+        self.trace = None
         config = config or Configuration()
         super().__init__(url = url, title = title, source_url = source_url, config = config, **kwargs)
+        # after the kwargs (collect_metrics=True, ..) are applied
+        metrics.configure(self.config)
 
 
     async def _async_parse_scheme_file(self, path):
@@ -37,9 +133,9 @@ class AsyncArticle(Article):
             self.download_exception_msg = e.strerror
             return None
 
-    async def _async_parse_scheme_http(self):
+    async def _async_parse_scheme_http(self, client: httpx.AsyncClient = None):
         try:
-            return await network.async_get_html_2XX_only(self.url, self.config)
+            return await network.async_get_html_2XX_only(self.url, self.config, client=client, trace=self.trace)
         except httpx.RequestError as e:
             self.download_state = ArticleDownloadState.FAILED_RESPONSE
             self.download_exception_msg = str(e)
@@ -49,17 +145,44 @@ class AsyncArticle(Article):
         """Build a lone article from a URL independent of the source (newspaper).
         Don't normally call this method b/c it's good to multithread articles
         on a source (newspaper) level.
+
+        Raises TimeoutError past config.article_deadline
+        """
+        with anyio.fail_after(self.config.article_deadline):
+            await self.async_download()
+            await self.async_parse()
+            #self.parse()
+            await self.async_nlp()
+
+    def set_html(self, html):
+        # the verdict on the previous html doesn't hold for this one
+        self.valid_body = None
+        super().set_html(html)
+
+    def parse(self):
+        """Parses the html, cut down to the limits of guard_html first
         """
-        await self.async_download()
-        await self.async_parse()
-        #self.parse()
-        await self.async_nlp()
+        self.throw_if_not_downloaded_verbose()
+        self.valid_body = None
+        with span(self.trace, 'parse.guard') as info:
+            self.html, self.truncated = guard_html(self.html, self.config)
+            info['truncated'] = self.truncated
+        if self.truncated:
+            log.debug('Truncated the html of %s: %s' % (self.url, ', '.join(self.truncated)))
+        if self.trace is None:
+            return super().parse()
+        extractor, self.extractor = self.extractor, TimedExtractor(self.extractor, self.trace)
+        try:
+            super().parse()
+        finally:
+            self.extractor = extractor
     
 
 
-    async def async_download(self, input_html=None, title=None, recursion_counter=0):
+    async def async_download(self, input_html=None, title=None, recursion_counter=0,
+                             client: httpx.AsyncClient = None):
         """Downloads the link's HTML content, don't use if you are batch async
-        downloading articles
+        downloading articles, unless through a shared `client`
 
         recursion_counter (currently 1) stops refreshes that are potentially
         infinite
@@ -69,7 +192,7 @@ class AsyncArticle(Article):
             if parsed_url.scheme == "file":
                 html = await self._async_parse_scheme_file(parsed_url.path)
             else:
-                html = await self._async_parse_scheme_http()
+                html = await self._async_parse_scheme_http(client)
             if html is None:
                 log.debug(f'Download failed on URL {self.url} because of {self.download_exception_msg}')
                 return
@@ -79,15 +202,46 @@ class AsyncArticle(Article):
         if self.config.follow_meta_refresh:
             meta_refresh_url = extract_meta_refresh(html)
             if meta_refresh_url and recursion_counter < 1:
+                with span(self.trace, 'redirect', url=meta_refresh_url, meta_refresh=True):
+                    html = await network.async_get_html(meta_refresh_url, self.config, client=client,
+                                                        trace=self.trace)
                 return await self.async_download(
-                    input_html = await network.async_get_html(meta_refresh_url),
+                    input_html = html,
                     recursion_counter = recursion_counter + 1
                 )
         self.set_html(html)
         self.set_title(title)
+
+    def download(self, input_html=None, title=None, recursion_counter=0):
+        """Sync async_download, on the background event loop of
+        Executor.run_as_sync and over its shared connection pool
+        """
+        Executor.run_as_sync(self._async_download_shared, input_html, title, recursion_counter)
+
+    async def _async_download_shared(self, input_html, title, recursion_counter):
+        await self.async_download(input_html, title, recursion_counter,
+                                  client=network.get_shared_client(self.config))
     
-    async def async_parse(self):
-        return await Executor.run_as_async(self.parse)
+    async def async_parse(self, backend: str = None):
+        """Parses on the parse stage of the Executor, on threads or with
+        backend='process' (config.parse_backend by default) in a worker
+        process. In that case doc, clean_doc and top_node stay None and
+        is_valid_body() answers with the worker's result
+        """
+        stage = Executor.get_stage('parse', backend or self.config.parse_backend)
+        if stage.backend != 'process':
+            with metrics.timed('parse', self.url), span(self.trace, 'parse', backend=stage.backend):
+                return await stage.run(self.parse)
+        self.throw_if_not_downloaded_verbose()
+        with metrics.timed('parse', self.url), span(self.trace, 'parse', backend=stage.backend):
+            state, self.valid_body = await stage.run(
+                parse_in_process, self.url, self.html, self.title, self.source_url, self.config)
+        self.__dict__.update(state)
+
+    def is_valid_body(self):
+        if self.valid_body is not None:
+            return self.valid_body
+        return super().is_valid_body()
 
     async def async_nlp(self):
         """Keyword extraction wrapper
@@ -95,16 +249,10 @@ class AsyncArticle(Article):
         self.throw_if_not_downloaded_verbose()
         self.throw_if_not_parsed_verbose()
 
-        lang = self.config.get_language()
-        nlp.load_stopwords(lang)
-
-        text_keyws = list(nlp.keywords(self.text, num_keywords = self.num_keywords, language = lang).keys())
-        title_keyws = list(nlp.keywords(self.title, num_keywords = self.num_keywords, language = lang).keys())
-        keyws = list(set(title_keyws + text_keyws))
+        with metrics.timed('nlp', self.url), span(self.trace, 'nlp'):
+            keyws, summary_sents = await Executor.run_in_stage(
+                'nlp', nlp.analyze, self.title, self.text, self.num_keywords,
+                self.config.MAX_SUMMARY_SENT, self.config.get_language())
         self.set_keywords(keyws)
-
-        max_sents = self.config.MAX_SUMMARY_SENT
-        summary_sents = await nlp.async_summarize(title=self.title, text=self.text, max_sents=max_sents)
-        summary = '\n'.join(summary_sents)
-        self.set_summary(summary)
+        self.set_summary('\n'.join(summary_sents))
 
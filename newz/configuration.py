@@ -22,11 +22,51 @@ class Configuration(object):
         self.MAX_SUMMARY = 5000  # num of chars
         self.MAX_SUMMARY_SENT = 5  # num of sentences
 
+        # Parse budget of an article, see article.guard_html: html is cut
+        # to MAX_HTML_BYTES chars, and to MAX_DOM_NODES elements and
+        # MAX_DOM_DEPTH levels (libxml2 stops at 256 on its own) before it is
+        # parsed. None for no limit
+        self.MAX_HTML_BYTES = 5 * 1024 * 1024
+        self.MAX_DOM_NODES = 50000
+        self.MAX_DOM_DEPTH = 128
+        # Seconds an article may take in the async api, download, parse and
+        # nlp together (None for no limit). Crawls drop the articles that
+        # run over, parses in worker processes are interrupted, and killed
+        # if they don't stop
+        self.article_deadline = None
+
         # max number of urls we cache for each news source
         self.MAX_FILE_MEMO = 20000
+        # seconds a memoized url is remembered after it was last seen
+        self.MEMO_TTL = 86400 * 30
+        # urls and false positive rate the shared seen-url Bloom filter is
+        # sized for, only used when the filter file is first created
+        self.SEEN_FILTER_CAPACITY = 10000000
+        self.SEEN_FILTER_ERROR_RATE = 0.001
 
         # Cache and save articles run after run
         self.memoize_articles = True
+        # Check memoized urls against the shared Bloom filter before the
+        # per-domain memo database. Pays off when the memo databases don't
+        # stay in the page cache (many domains, network filesystems), on
+        # small local memos SQLite alone is faster
+        self.use_seen_filter = False
+
+        # Skip feed entries published more than this many seconds ago,
+        # None keeps them all. Entries without a date are always kept
+        self.max_feed_entry_age = None
+
+        # How AsyncSource finds articles: 'pages' (categories and feeds),
+        # 'sitemaps' (robots.txt / sitemap.xml) or 'all'
+        self.discovery = 'pages'
+        # Skip sitemap entries, and the sitemaps of an index, modified more
+        # than this many seconds ago. None keeps them all
+        self.max_sitemap_entry_age = 86400 * 2
+        # Drop the html, lxml tree and rss of categories, feeds and the
+        # homepage as soon as their links are extracted. Keeps a built
+        # AsyncSource small, but source.html / category.doc / feed.rss
+        # are None afterwards
+        self.lean_source = False
 
         # Set this to false if you don't care about getting images
         self.fetch_images = True
@@ -54,7 +94,39 @@ class Configuration(object):
         self.headers = {}
         self.request_timeout = 7
         self.proxies = {}
+        # Workers of the stages of utils.executor.Executor (see
+        # Executor.configure): io for blocking helpers (caches, category
+        # pages), parse for articles, nlp for keywords and summaries.
+        # The stages are process wide, sized by the last AsyncNewsPool or
+        # AsyncSource whose config changes one of these settings (see
+        # Executor.maybe_configure), or by calling Executor.configure
         self.number_threads = 10
+        # Also the articles of a source parsed at once by
+        # async_parse_articles. None uses one per cpu
+        self.number_parse_workers = None
+        # 'thread' parses on the parse stage's threads, 'process' in its
+        # processes, which scales with cores since parsing is mostly pure
+        # python
+        self.parse_backend = 'thread'
+        self.number_nlp_workers = None
+        self.nlp_backend = 'thread'
+        # Worker processes AsyncNewsPool shards its sources across, each
+        # with its own event loop and connection pool. 0 crawls on the
+        # caller's event loop
+        self.number_crawl_processes = 0
+        # AsyncNewsPool's fetch scheduler (scheduler.FetchScheduler): requests
+        # in flight across all hosts and per host, and the requests per
+        # second a host gets on average (None for no limit), in bursts of
+        # up to domain_burst
+        self.pool_concurrency = 50
+        self.domain_concurrency = 2
+        self.domain_rate = None
+        self.domain_burst = 1
+
+        # Record per stage and per domain timings, request and cache counts
+        # (utils/metrics.py), see AsyncNewsPool.metrics and
+        # AsyncSource.metrics. Turns on the registry of the whole process
+        self.collect_metrics = False
 
         self.verbose = False  # for debugging
 
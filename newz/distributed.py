@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+Crawling on several nodes: AsyncNewsPool.async_work pulls source and
+article tasks from a shared TaskQueue and pushes the crawled articles to
+a ResultSink, so adding a node is starting one more worker on the same
+queue.
+
+- a 'source' task builds a source and queues its articles as 'articles'
+  tasks of up to `articles_per_task` articles, which any worker can take
+- tasks are leased to a worker for `lease_seconds` and the worker renews
+  the leases of the tasks it holds (its heartbeat) while it works on
+  them. The tasks of a worker that died are leased again once their
+  leases expire. A task that fails `max_attempts` times is given up
+- delivery is at least once: a worker that dies after pushing its
+  results but before completing the task has them pushed again
+
+SQLiteTaskQueue works for workers on one host, or on hosts sharing a
+filesystem with working locks. Other backends (Redis, SQS, ..) implement
+TaskQueue, other sinks ResultSink.
+
+>>> queue = SQLiteTaskQueue('/shared/crawl.queue')
+>>> queue.put_sources(['http://cnn.com', 'http://bbc.co.uk'])
+>>> # on every node
+>>> async with AsyncNewsPool() as pool:
+...     await pool.async_work(queue, JsonLinesSink('/shared/results'), idle_timeout=60)
+"""
+
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from typing import Dict, List, Optional
+
+import anyio
+
+from . import network
+from .article import AsyncArticle, RECORD_ATTRIBUTES, article_to_record
+from .configuration import Configuration
+from .utils import logger as log
+from .utils.executor import Executor
+from .utils.memo import BUSY_TIMEOUT
+
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Task(object):
+    """A unit of work: kind 'source' with payload (url, config) or kind
+    'articles' with payload (source url, [(url, title), ..], config)
+    """
+    __slots__ = ('id', 'kind', 'payload', 'attempts')
+
+    def __init__(self, id, kind: str, payload, attempts: int = 0):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+    def __repr__(self):
+        return '<Task %s %s>' % (self.id, self.kind)
+
+
+class TaskQueue(object):
+    """Interface of the queue backends of AsyncNewsPool.async_work. The
+    methods are blocking, the workers call them on the thread pool
+    """
+    def put(self, tasks: List[Task]):
+        """Queues tasks (their ids are assigned by the queue)
+        """
+        raise NotImplementedError
+
+    def lease(self, worker_id: str, limit: int, lease_seconds: float) -> List[Task]:
+        """Up to `limit` queued tasks, or tasks whose lease expired, now
+        leased to `worker_id` for `lease_seconds`
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id: str, task_ids: List, lease_seconds: float) -> List:
+        """Renews the leases of `worker_id`'s tasks, returns the ids of
+        those it still holds
+        """
+        raise NotImplementedError
+
+    def complete(self, worker_id: str, task_ids: List):
+        raise NotImplementedError
+
+    def fail(self, worker_id: str, task_id, error: str):
+        """Queues the task again, or gives it up after max_attempts
+        """
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        """Number of tasks by state
+        """
+        raise NotImplementedError
+
+    def put_sources(self, urls: List[str], config: Configuration = None):
+        self.put([Task(None, 'source', (url, config)) for url in urls])
+
+    def put_articles(self, source_url: str, url_titles: List[tuple], config: Configuration = None,
+                     articles_per_task: int = 50):
+        self.put([Task(None, 'articles', (source_url, url_titles[i:i + articles_per_task], config))
+                  for i in range(0, len(url_titles), articles_per_task)])
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_until);
+'''
+
+
+class SQLiteTaskQueue(TaskQueue):
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, func, *args):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn, *args)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def put(self, tasks: List[Task]):
+        rows = [(task.kind, pickle.dumps(task.payload, pickle.HIGHEST_PROTOCOL), QUEUED) for task in tasks]
+        self._transaction(lambda conn: conn.executemany(
+            'INSERT INTO tasks (kind, payload, state) VALUES (?, ?, ?)', rows))
+
+    def lease(self, worker_id: str, limit: int, lease_seconds: float) -> List[Task]:
+        def lease(conn):
+            now = time.time()
+            # an expired lease counts as a failed attempt, so a task that
+            # kills its workers is given up too
+            conn.execute('UPDATE tasks SET state = ?, error = ? WHERE state = ? AND lease_until < ? '
+                         'AND attempts + 1 >= ?', (FAILED, 'lease expired', LEASED, now, self.max_attempts))
+            rows = conn.execute(
+                'SELECT id, kind, payload, attempts, state FROM tasks '
+                'WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY id LIMIT ?',
+                (QUEUED, LEASED, now, limit)).fetchall()
+            conn.executemany('UPDATE tasks SET state = ?, worker = ?, lease_until = ?, attempts = ? WHERE id = ?',
+                             [(LEASED, worker_id, now + lease_seconds, attempts + (state == LEASED), id)
+                              for id, _, _, attempts, state in rows])
+            return rows
+        return [Task(id, kind, pickle.loads(payload), attempts + (state == LEASED))
+                for id, kind, payload, attempts, state in self._transaction(lease)]
+
+    def heartbeat(self, worker_id: str, task_ids: List, lease_seconds: float) -> List:
+        def heartbeat(conn):
+            held = []
+            for task_id in task_ids:
+                cursor = conn.execute('UPDATE tasks SET lease_until = ? WHERE id = ? AND state = ? AND worker = ?',
+                                      (time.time() + lease_seconds, task_id, LEASED, worker_id))
+                if cursor.rowcount:
+                    held.append(task_id)
+            return held
+        return self._transaction(heartbeat)
+
+    def complete(self, worker_id: str, task_ids: List):
+        self._transaction(lambda conn: conn.executemany(
+            'UPDATE tasks SET state = ?, lease_until = NULL WHERE id = ? AND worker = ?',
+            [(DONE, task_id, worker_id) for task_id in task_ids]))
+
+    def fail(self, worker_id: str, task_id, error: str):
+        def fail(conn):
+            conn.execute('UPDATE tasks SET attempts = attempts + 1, error = ?, lease_until = NULL, '
+                         'state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END WHERE id = ? AND worker = ?',
+                         (error, self.max_attempts, FAILED, QUEUED, task_id, worker_id))
+        self._transaction(fail)
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._connect().execute('SELECT state, COUNT(*) FROM tasks GROUP BY state'))
+
+
+class ResultSink(object):
+    """Where the workers of AsyncNewsPool.async_work push the articles
+    they crawled. Blocking, called on the thread pool
+    """
+    def put(self, worker_id: str, articles: List[AsyncArticle]):
+        raise NotImplementedError
+
+
+class JsonLinesSink(ResultSink):
+    """One json object per article (url, source_url and the attributes
+    of article.RECORD_ATTRIBUTES), appended to a file per worker in
+    `directory`, so workers on several hosts never write the same file
+    """
+    def __init__(self, directory: str, attributes=RECORD_ATTRIBUTES):
+        self.directory = directory
+        self.attributes = attributes
+        self.lock = threading.Lock()
+
+    def path(self, worker_id: str) -> str:
+        return os.path.join(self.directory, '%s.jsonl' % worker_id)
+
+    def put(self, worker_id: str, articles: List[AsyncArticle]):
+        lines = []
+        for article in articles:
+            record = dict(zip(RECORD_ATTRIBUTES, article_to_record(article)))
+            item = {'url': article.url, 'source_url': article.source_url}
+            item.update((name, record[name]) for name in self.attributes)
+            lines.append(json.dumps(item, default=str, ensure_ascii=False) + '\n')
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(self.path(worker_id), 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+
+
+class QueueWorker(object):
+    """Runs the tasks of a TaskQueue on an AsyncNewsPool: its config,
+    fetch scheduler and one connection pool for all the tasks, see
+    AsyncNewsPool.async_work
+    """
+    def __init__(self, pool, queue: TaskQueue, sink: ResultSink, worker_id: str = None,
+                 tasks_at_once: int = 4, lease_seconds: float = 60, poll_interval: float = 1,
+                 articles_per_task: int = 50, parse: bool = False, limit: int = 5000):
+        self.pool = pool
+        self.queue = queue
+        self.sink = sink
+        self.worker_id = worker_id or '%s-%d-%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:6])
+        self.tasks_at_once = tasks_at_once
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.articles_per_task = articles_per_task
+        self.parse = parse
+        self.limit = limit
+        # task id -> Task, leased and not done yet
+        self.held: Dict[object, Task] = {}
+        self.stats = {'tasks': 0, 'failed_tasks': 0, 'articles': 0, 'lost_leases': 0}
+        self.client = None
+
+    async def run(self, idle_timeout: Optional[float] = None) -> Dict[str, int]:
+        """Works until the queue has been empty for `idle_timeout` seconds
+        (forever with None), returns the stats of the worker
+        """
+        scheduler = self.pool.get_scheduler()
+        self.client = network.get_async_client(self.pool.config, scheduler)
+        idle_since = time.monotonic()
+        async with self.client:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(self._async_heartbeat)
+                while True:
+                    free = self.tasks_at_once - len(self.held)
+                    tasks = []
+                    if free > 0:
+                        tasks = await Executor.run_as_async(
+                            self.queue.lease, self.worker_id, free, self.lease_seconds)
+                    for task in tasks:
+                        self.held[task.id] = task
+                        task_group.start_soon(self._async_run_task, task)
+                    if self.held or tasks:
+                        idle_since = time.monotonic()
+                    elif idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                        break
+                    if not tasks:
+                        await anyio.sleep(self.poll_interval)
+                task_group.cancel_scope.cancel()
+        return self.stats
+
+    async def _async_heartbeat(self):
+        while True:
+            await anyio.sleep(self.lease_seconds / 3)
+            if not self.held:
+                continue
+            task_ids = list(self.held)
+            held = set(await Executor.run_as_async(
+                self.queue.heartbeat, self.worker_id, task_ids, self.lease_seconds))
+            lost = [task_id for task_id in task_ids if task_id not in held and task_id in self.held]
+            if lost:
+                # leased to another worker already, their results may come
+                # twice. They run to the end, but don't count as held
+                log.warning('Worker %s lost the leases of tasks %s' % (self.worker_id, lost))
+                self.stats['lost_leases'] += len(lost)
+                for task_id in lost:
+                    self.held.pop(task_id, None)
+
+    async def _async_run_task(self, task: Task):
+        try:
+            if task.kind == 'source':
+                await self._async_build_source(*task.payload)
+            elif task.kind == 'articles':
+                await self._async_crawl_articles(*task.payload)
+            else:
+                raise ValueError('Unknown task kind %r' % task.kind)
+        except Exception as e:
+            log.warning('Task %r failed on worker %s: %s' % (task, self.worker_id, e))
+            self.stats['failed_tasks'] += 1
+            await Executor.run_as_async(self.queue.fail, self.worker_id, task.id, repr(e))
+        else:
+            self.stats['tasks'] += 1
+            await Executor.run_as_async(self.queue.complete, self.worker_id, [task.id])
+        finally:
+            self.held.pop(task.id, None)
+
+    async def _async_build_source(self, url: str, config: Configuration):
+        from .source import AsyncSource
+
+        source = AsyncSource(url, config=config or self.pool.config)
+        source.scheduler = self.pool.get_scheduler()
+        await source.async_build(self.limit)
+        url_titles = [(a.url, a.title) for a in source.articles]
+        if url_titles:
+            await Executor.run_as_async(self.queue.put_articles, source.url, url_titles, source.config,
+                                        self.articles_per_task)
+
+    async def _async_crawl_articles(self, source_url: str, url_titles: List[tuple], config: Configuration):
+        from .mthreading import async_crawl_articles, is_crawled
+
+        config = config or self.pool.config
+        articles = [AsyncArticle(url, title=title, source_url=source_url, config=config)
+                    for url, title in url_titles]
+        # the scheduler keeps the per host limits
+        await async_crawl_articles(articles, config, self.pool.config.pool_concurrency, self.parse, self.client,
+                                   recorder=self.pool.recorder)
+        crawled = [a for a in articles if is_crawled(a, self.parse)]
+        if crawled:
+            await Executor.run_as_async(self.sink.put, self.worker_id, crawled)
+        self.stats['articles'] += len(crawled)
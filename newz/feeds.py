@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental RSS / Atom parsing. Entries are streamed out of an lxml pull
+parser one at a time and their elements freed right after, so memory stays
+bounded by a single entry rather than the whole feed.
+"""
+import re
+import datetime
+
+from email.utils import parsedate_to_datetime
+from typing import Iterator, List, Optional, Union
+
+from lxml import etree
+
+ENTRY_TAGS = ('item', 'entry')
+XML_DECLARATION = re.compile(r'^\s*<\?xml.*?\?>', re.DOTALL)
+CHUNK_SIZE = 64 * 1024
+
+
+class FeedEntry(object):
+    """One <item> (RSS) or <entry> (Atom) of a feed
+    """
+    __slots__ = ('url', 'title', 'published', 'guid', 'content_length')
+
+    def __init__(self, url: str = '', title: str = '', published: Optional[datetime.datetime] = None,
+                 guid: str = '', content_length: int = 0):
+        self.url = url
+        self.title = title
+        self.published = published
+        self.guid = guid
+        self.content_length = content_length
+
+    def is_older_than(self, max_age: float, now: Optional[datetime.datetime] = None) -> bool:
+        """Entries without a date are never considered stale
+        """
+        if self.published is None or max_age is None:
+            return False
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        return (now - self.published).total_seconds() > max_age
+
+    def __repr__(self):
+        return 'FeedEntry(url=%r, title=%r, published=%r)' % (self.url, self.title, self.published)
+
+
+def _local_name(tag) -> str:
+    if not isinstance(tag, str):
+        return ''
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_date(value: str) -> Optional[datetime.datetime]:
+    """RFC 822 (RSS pubDate) or ISO 8601 (Atom, dc:date) -> aware datetime
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def _entry_from_element(element) -> FeedEntry:
+    entry = FeedEntry()
+    for child in element:
+        name = _local_name(child.tag)
+        text = (child.text or '').strip()
+        if name == 'link':
+            href = child.get('href')
+            if href is None:
+                entry.url = entry.url or text
+            elif child.get('rel', 'alternate') == 'alternate' and not entry.url:
+                entry.url = href.strip()
+        elif name == 'title':
+            entry.title = text
+        elif name in ('pubDate', 'published', 'date', 'updated'):
+            # prefer the publication date over the last update
+            if entry.published is None or name != 'updated':
+                entry.published = parse_date(text) or entry.published
+        elif name in ('guid', 'id'):
+            entry.guid = text
+        elif name in ('encoded', 'content', 'description', 'summary'):
+            entry.content_length = max(entry.content_length, len(''.join(child.itertext())))
+    if not entry.url and entry.guid.startswith('http'):
+        entry.url = entry.guid
+    return entry
+
+
+class FeedParser(object):
+    """Push parser: feed() it the feed in chunks (e.g. as they come off
+    the network) and it returns the entries completed so far.
+
+    >>> parser = FeedParser()
+    >>> for chunk in chunks:
+    >>>     for entry in parser.feed(chunk):
+    >>>         ...
+    >>> entries = parser.close()
+    """
+    entry_tags = ENTRY_TAGS
+
+    def __init__(self):
+        self.parser = etree.XMLPullParser(
+            events=('end',), recover=True, resolve_entities=False, no_network=True, huge_tree=True)
+        self.started = False
+
+    def _prepare(self, chunk: Union[str, bytes]) -> bytes:
+        if isinstance(chunk, str):
+            # the text is already decoded, its encoding declaration no
+            # longer applies
+            if not self.started:
+                chunk = XML_DECLARATION.sub('', chunk, count=1)
+            chunk = chunk.encode('utf-8')
+        self.started = True
+        return chunk
+
+    def _read_events(self) -> List[FeedEntry]:
+        entries = []
+        for _, element in self.parser.read_events():
+            if _local_name(element.tag) not in self.entry_tags:
+                continue
+            entries.append(self.make_entry(element))
+            # drop the entry and everything before it, only the open
+            # ancestors stay in memory
+            element.clear()
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+        return entries
+
+    def make_entry(self, element) -> FeedEntry:
+        return _entry_from_element(element)
+
+    def feed(self, chunk: Union[str, bytes]) -> List[FeedEntry]:
+        if not chunk:
+            return []
+        self.parser.feed(self._prepare(chunk))
+        return self._read_events()
+
+    def close(self) -> List[FeedEntry]:
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        return self._read_events()
+
+
+def iter_feed_entries(rss: Union[str, bytes], chunk_size: int = CHUNK_SIZE) -> Iterator[FeedEntry]:
+    """Streams the entries of an already downloaded feed
+    """
+    if not rss:
+        return
+    parser = FeedParser()
+    try:
+        for start in range(0, len(rss), chunk_size):
+            yield from parser.feed(rss[start:start + chunk_size])
+        yield from parser.close()
+    except etree.XMLSyntaxError:
+        # recover=True gets past most broken feeds, not documents that
+        # aren't xml at all
+        return
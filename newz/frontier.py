@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Crawl frontier of AsyncNewsPool: every source, category, feed and article
+url of a crawl with its state, checkpointed to a SQLite database so a
+crawl that died halfway can be resumed by running it again with the same
+frontier.
+
+- built sources keep their category, feed and article urls, a resumed
+  run restores them instead of building the source again (a source whose
+  build didn't finish is built from scratch)
+- crawled articles keep their record (article.article_to_record), a
+  resumed run restores them instead of downloading them again. Failed
+  articles are retried
+
+State changes are buffered and written in one transaction at most every
+`checkpoint_interval` seconds (and when the pool is done), so the
+checkpoints cost next to nothing. Whatever changed after the last one is
+crawled again.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .utils.memo import BUSY_TIMEOUT, _batches
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source_url TEXT NOT NULL,
+    state TEXT NOT NULL,
+    record BLOB,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (kind, state);
+'''
+
+INSERT = ('INSERT OR IGNORE INTO items (url, kind, source_url, state, record, updated) '
+          'VALUES (?, ?, ?, ?, NULL, ?)')
+UPDATE = 'UPDATE items SET state = ?, record = ?, updated = ? WHERE url = ?'
+
+
+class CrawlFrontier(object):
+    """
+    >>> frontier = CrawlFrontier('/data/crawl.frontier')
+    >>> async with AsyncNewsPool(frontier=frontier) as pool:
+    ...     await pool.async_build_sources(sources)
+    ...     await pool.async_set(sources)
+    ...     await pool.async_join()
+    >>> frontier.clear()  # before the next, unrelated, crawl
+    """
+    def __init__(self, path: str, checkpoint_interval: float = 5):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = time.monotonic()
+        # rows waiting for the next checkpoint
+        self.new_items: List[tuple] = []
+        self.updates: Dict[str, tuple] = {}
+        self.checkpoints = 0
+        self.lock = threading.RLock()
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # used by whichever thread runs the pool's event loop
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self.conn = conn
+        return self.conn
+
+    def add(self, items: Iterable[Tuple[str, str, str]]):
+        """Adds (url, kind, source url) items as pending, unless the
+        frontier has them already
+        """
+        now = time.time()
+        with self.lock:
+            self.new_items.extend((url, kind, source_url, PENDING, now) for url, kind, source_url in items)
+
+    def mark(self, url: str, state: str, record=None):
+        """Sets the state (DONE or FAILED) and the record to restore of an
+        item, kept at the next checkpoint
+        """
+        data = None if record is None else pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.updates[url] = (state, data, time.time(), url)
+
+    def maybe_checkpoint(self) -> bool:
+        """Checkpoints if the last checkpoint is `checkpoint_interval`
+        seconds old
+        """
+        if time.monotonic() - self.last_checkpoint < self.checkpoint_interval:
+            return False
+        self.checkpoint()
+        return True
+
+    def checkpoint(self):
+        """Writes the buffered items and states, in one transaction
+        """
+        with self.lock:
+            self.last_checkpoint = time.monotonic()
+            if not self.new_items and not self.updates:
+                return
+            new_items, self.new_items = self.new_items, []
+            updates, self.updates = self.updates, {}
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(INSERT, new_items)
+                conn.executemany(UPDATE, updates.values())
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                self.new_items[:0] = new_items
+                updates.update(self.updates)
+                self.updates = updates
+                raise
+            self.checkpoints += 1
+
+    def completed(self, urls: Iterable[str]) -> Dict[str, object]:
+        """The records of those of `urls` that are done, by url. Includes
+        the states not checkpointed yet
+        """
+        urls = list(urls)
+        done = {}
+        with self.lock:
+            for batch in _batches(urls):
+                query = 'SELECT url, record FROM items WHERE state = ? AND url IN (%s)' % ','.join('?' * len(batch))
+                done.update(self._connect().execute(query, [DONE] + batch))
+            for url in urls:
+                if url in self.updates:
+                    state, data, _, _ = self.updates[url]
+                    if state == DONE:
+                        done[url] = data
+                    else:
+                        done.pop(url, None)
+        return {url: None if data is None else pickle.loads(data) for url, data in done.items()}
+
+    def counts(self) -> Dict[Tuple[str, str], int]:
+        """Number of items by (kind, state), as of the last checkpoint
+        """
+        with self.lock:
+            rows = self._connect().execute('SELECT kind, state, COUNT(*) FROM items GROUP BY kind, state')
+            return {(kind, state): count for kind, state, count in rows}
+
+    def pending(self, kind: str = None) -> List[str]:
+        """Urls not done yet (pending or failed), as of the last checkpoint
+        """
+        with self.lock:
+            query = 'SELECT url FROM items WHERE state != ?'
+            params = [DONE]
+            if kind is not None:
+                query += ' AND kind = ?'
+                params.append(kind)
+            return [row[0] for row in self._connect().execute(query, params)]
+
+    def close(self):
+        with self.lock:
+            self.checkpoint()
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def clear(self):
+        """Deletes the frontier, for a new crawl
+        """
+        with self.lock:
+            self.new_items = []
+            self.updates = {}
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
@@ -8,14 +8,29 @@ also, it will deserve its own gevent file.
 import queue
 import traceback
 import asyncio
+import contextlib
+import functools
+import multiprocessing
+import time
 
+import anyio
+
+from anyio.streams.memory import MemoryObjectReceiveStream
 from threading import Thread
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from .article import AsyncArticle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Tuple
+from urllib.parse import urlparse
+
+from . import network
+from .frontier import CrawlFrontier, DONE, FAILED
+from .scheduler import FetchScheduler
+from .tracing import TraceRecorder
+from .article import AsyncArticle, apply_record, article_to_record
 from .configuration import Configuration
 
 from .utils.executor import Executor
 from .utils import logger as log
+from .utils import metrics
 
 from newspaper.mthreading import NewsPool
 
@@ -62,9 +77,107 @@ class ThreadPool:
         self.tasks.join()
 
 
+async def _async_crawl_article(article, client, parse: bool):
+    """Downloads (and parses) `article` within config.article_deadline,
+    an article that runs over is left failed
+    """
+    deadline = getattr(article.config, 'article_deadline', None)
+    with anyio.move_on_after(deadline) as scope:
+        try:
+            if isinstance(article, AsyncArticle):
+                await article.async_download(client=client)
+            else:
+                await Executor.run_as_async(article.download)
+            if parse and article.html:
+                if isinstance(article, AsyncArticle):
+                    await article.async_parse()
+                else:
+                    with metrics.timed('parse', article.url):
+                        await Executor.get_stage('parse', 'thread').run(article.parse)
+                article.valid_body = article.is_parsed and article.is_valid_body()
+        except Exception as e:
+            log.debug('Crawling %s failed: %s' % (article.url, e))
+            # a plain newspaper Article only gets it from here
+            article.valid_body = False
+    if scope.cancelled_caught:
+        log.debug('Crawling %s ran over its deadline of %ss' % (article.url, deadline))
+        article.download_exception_msg = 'Ran over the deadline of %ss' % deadline
+        article.valid_body = False
+
+
+def is_crawled(article, parse: bool) -> bool:
+    """Was the article downloaded, and with `parse` does it have a body
+    """
+    return bool(article.html) and (not parse or bool(getattr(article, 'valid_body', False)))
+
+
+async def async_crawl_articles(articles, config: Configuration, concurrency: int, parse: bool = False,
+                               client=None, done: Callable[[Any], Awaitable] = None,
+                               recorder: TraceRecorder = None):
+    """Downloads (and parses) `articles`, `concurrency` at once, over one
+    connection pool: `client`'s or a new one. `done(article)` is awaited
+    for each article before its slot is given to the next one. With a
+    `recorder` (tracing.TraceRecorder) each AsyncArticle is traced, from
+    the moment it's queued
+    """
+    if client is None:
+        async with network.get_async_client(config) as client:
+            return await async_crawl_articles(articles, config, concurrency, parse, client, done, recorder)
+    limiter = anyio.CapacityLimiter(concurrency)
+
+    async def crawl(article):
+        trace = recorder.start(article) if recorder is not None and isinstance(article, AsyncArticle) else None
+        try:
+            async with limiter:
+                if trace is not None:
+                    trace.add('queued', trace.started, time.perf_counter())
+                await _async_crawl_article(article, client, parse)
+                if trace is not None:
+                    recorder.finish(article)
+                if done is not None:
+                    await done(article)
+        finally:
+            # a cancelled crawl still writes and detaches its trace, a
+            # no-op once finished
+            if trace is not None:
+                recorder.finish(article)
+
+    async with anyio.create_task_group() as task_group:
+        for article in articles:
+            task_group.start_soon(crawl, article)
+
+
+async def _async_crawl_shard(jobs, config: Configuration, concurrency: int, parse: bool, processes: int):
+    client = network.get_async_client(config, FetchScheduler.from_config(config, processes))
+    async with client:
+        async with anyio.create_task_group() as task_group:
+            for articles in jobs:
+                task_group.start_soon(async_crawl_articles, articles, config, concurrency, parse, client)
+
+
+def crawl_shard(jobs: List[Tuple[str, List[Tuple[str, str]], Configuration]], config: Configuration,
+                concurrency: int, parse: bool, processes: int) -> Tuple[List[List[tuple]], Any]:
+    """Runs in a crawl worker process: crawls all the (source url,
+    [(url, title), ..], source config) jobs of its shard at once, on an
+    event loop, connection pool and fetch scheduler of its own (with its
+    share of the pool's config.pool_concurrency). Returns the articles of
+    each job as records (article_to_record), in order, and the metrics
+    the shard recorded (None unless config.collect_metrics)
+    """
+    for _, _, job_config in jobs:
+        # this is a worker process already, parse on its threads
+        job_config.parse_backend = 'thread'
+    metrics.configure(config)
+    jobs = [[AsyncArticle(url, title=title, source_url=source_url, config=job_config) for url, title in url_titles]
+            for source_url, url_titles, job_config in jobs]
+    anyio.run(_async_crawl_shard, jobs, config, concurrency, parse, processes)
+    records = [[article_to_record(article) for article in articles] for articles in jobs]
+    return records, metrics.registry.collect() if metrics.registry.enabled else None
+
+
 class AsyncNewsPool(object):
 
-    def __init__(self, config=None):
+    def __init__(self, config=None, frontier: CrawlFrontier = None, recorder: TraceRecorder = None):
         """
         Abstraction of a threadpool. A newspool can accept any number of
         source OR article objects together in a list. It allocates one
@@ -87,36 +200,180 @@ class AsyncNewsPool(object):
         # All of your papers should have their articles html all populated now.
         >>> cnn_paper.articles[50].html
         u'<html>blahblah ... '
+
+        With a `frontier` (frontier.CrawlFrontier) the built sources and
+        the crawled articles are checkpointed, running the same crawl
+        again with it resumes where the last one stopped.
+
+        With a `recorder` (tracing.TraceRecorder) every article crawled on
+        this event loop is traced, and the slow ones captured.
         """
-        self.pool = None
+        # crawl worker processes of async_set, see shutdown
+        self.process_pool = None
+        # the fetches of async_set and async_build_sources on this event
+        # loop go through one scheduler, and the articles' through one client
+        self.scheduler = None
+        self.client = None
         self.futures = []
+        self.frontier = frontier
+        self.recorder = recorder
         self.config = config or Configuration()
+        metrics.configure(self.config)
+        Executor.maybe_configure(self.config)
+
+    def get_scheduler(self) -> FetchScheduler:
+        if self.scheduler is None:
+            self.scheduler = FetchScheduler.from_config(self.config)
+        return self.scheduler
+
+    def metrics(self, format: str = None):
+        """What the crawls of the process recorded (see
+        config.collect_metrics and utils/metrics.py), with the queue depths
+        of the executor stages and of the fetch scheduler. A dict, or the
+        text to export with `format` 'json' or 'prometheus'
+        """
+        gauges = metrics.stage_gauges(Executor.metrics())
+        if self.scheduler is not None:
+            gauges['newz_fetch_active'] = [({}, self.scheduler.active)]
+            gauges['newz_fetch_queue_depth'] = [({}, self.scheduler.queued)]
+        return metrics.registry.export(format, gauges=gauges)
+
+    async def async_build_sources(self, sources, limit: int = 5000):
+        """Builds the AsyncSources at once, their category, feed and sitemap
+        fetches share the pool's scheduler with the articles' of async_set
+        """
+        scheduler = self.get_scheduler()
+        if self.frontier is not None:
+            built = self.frontier.completed(source.url for source in sources)
+            for source in sources:
+                if source.url in built:
+                    self._restore_source(source, built[source.url])
+            sources = [source for source in sources if source.url not in built]
+            self.frontier.add((source.url, 'source', source.url) for source in sources)
+        async with anyio.create_task_group() as task_group:
+            for source in sources:
+                source.scheduler = scheduler
+                task_group.start_soon(self._async_build_source, source, limit)
+        if self.frontier is not None:
+            self.frontier.checkpoint()
+
+    async def _async_build_source(self, source, limit: int):
+        await source.async_build(limit)
+        if self.frontier is None:
+            return
+        pages = [(c.url, 'category', source.url) for c in source.categories] + \
+            [(f.url, 'feed', source.url) for f in source.feeds]
+        self.frontier.add(pages)
+        for url, _, _ in pages:
+            self.frontier.mark(url, DONE)
+        self.frontier.mark(source.url, DONE, (
+            [c.url for c in source.categories], [f.url for f in source.feeds],
+            [(a.url, a.title) for a in source.articles]))
+        self.frontier.maybe_checkpoint()
+
+    async def async_work(self, queue, sink, idle_timeout: float = None, **kwargs) -> dict:
+        """Works on the tasks of `queue` (distributed.TaskQueue), shared
+        with the pools of other processes and nodes, and pushes the
+        crawled articles to `sink` (distributed.ResultSink), until the
+        queue has been empty for `idle_timeout` seconds (forever with
+        None). The keyword arguments go to distributed.QueueWorker.
+        Returns the stats of the worker
+        """
+        from .distributed import QueueWorker
+
+        return await QueueWorker(self, queue, sink, **kwargs).run(idle_timeout)
+
+    @staticmethod
+    def _restore_source(source, record):
+        """Puts the categories, feeds and articles of a build checkpointed
+        by the frontier back on `source`, without their pages
+        """
+        from .source import Category, Feed
+
+        category_urls, feed_urls, url_titles = record
+        source.categories = [Category(url) for url in category_urls]
+        source.feeds = [Feed(url) for url in feed_urls]
+        source.articles = [AsyncArticle(url, title=title, source_url=source.url, config=source.config)
+                           for url, title in url_titles]
+        for page in source.categories + source.feeds:
+            page.released = True
+
+    @staticmethod
+    def dedupe_articles(news_list):
+        """Drops articles that another source (or an earlier article) in
+        `news_list` already links to, so a story syndicated across sources
+        is downloaded once per run. Returns the number dropped.
+        """
+        from .source import Source
+
+        scheduled = set()
+        dropped = 0
+        for news_object in news_list:
+            if isinstance(news_object, Source):
+                articles = []
+                for article in news_object.articles:
+                    if article.url in scheduled:
+                        dropped += 1
+                        continue
+                    scheduled.add(article.url)
+                    articles.append(article)
+                news_object.articles = articles
+            else:
+                scheduled.add(news_object.url)
+        if dropped:
+            log.debug('%d articles already scheduled by another source' % dropped)
+        return dropped
 
     async def async_join(self):
         """
         Runs the mtheading and returns when all threads have joined
-        resets the task.
+        resets the task. Cancelling it (or an error in one of the jobs)
+        cancels the jobs left, see shutdown
         """
         if not self.futures:
             raise ConcurrencyException('Call async_set(..) with a list of source objects '
                                        'before calling .async_join(..)')
-        await asyncio.gather(*self.futures)
-        self.futures = []
+        futures, self.futures = self.futures, []
+        try:
+            await asyncio.gather(*futures)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            self.shutdown(wait=False)
+            raise
+        finally:
+            if self.client is not None:
+                client, self.client = self.client, None
+                await client.aclose()
+            if self.frontier is not None:
+                self.frontier.checkpoint()
+
+    def shutdown(self, wait: bool = True):
+        """Stops the crawl worker processes. With wait=False jobs that
+        haven't started are dropped and running ones aren't waited for
+        """
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=wait, cancel_futures=not wait)
+            self.process_pool = None
+
+    async def __aenter__(self):
+        return self
 
+    async def __aexit__(self, *exc):
+        self.shutdown(wait=exc[0] is None)
 
     def join(self):
         """
-        Runs the mtheading and returns when all threads have joined
-        resets the task.
+        Sync async_join, returns when the crawl started by set is done
         """
-        if self.pool is None:
+        if not self.futures:
             raise ConcurrencyException('Call set(..) with a list of source objects '
                                        'before calling .join(..)')
-        self.pool.wait_completion()
-        self.pool = None
+        Executor.run_as_sync(self.async_join)
     
 
-    async def async_set(self, news_list, threads_per_source: int = 1, override_threads=None):
+    async def async_set(self, news_list, threads_per_source: int = 1, override_threads=None,
+                        processes: int = None, parse: bool = False):
         """
         news_list can be a list of `Article`, `Source`, or both.
 
@@ -126,8 +383,164 @@ class AsyncNewsPool(object):
         allocate one thread per `Source` to not spam the host.
 
         If both of the above conditions are not true, default to 1 thread.
+
+        Every source (and the lone articles of each host) is one job, its
+        share of the threads is the number of its articles downloaded at
+        once. All fetches go through a scheduler.FetchScheduler, which
+        shares config.pool_concurrency fairly between the hosts and keeps
+        each one's traffic polite. With `processes`
+        (config.number_crawl_processes by default) the jobs are sharded
+        over that many worker processes, each crawling its shard on an
+        event loop, connection pool and scheduler of its own, otherwise
+        they run on the caller's event loop. With `parse` articles are
+        parsed right after their download, in the worker. Failed articles,
+        and with `parse` those with a too small body, are purged from
+        their source.
+        """
+        jobs, concurrency, processes, _ = self._prepare_jobs(
+            news_list, threads_per_source, override_threads, processes, parse)
+        if not jobs:
+            return
+        if not processes:
+            if self.client is None:
+                self.client = network.get_async_client(self.config, self.get_scheduler())
+            for source, articles in jobs:
+                self.futures.append(asyncio.ensure_future(
+                    self._async_run_job(source, articles, concurrency, parse)))
+            return
+
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        for shard in self._shard_jobs(jobs, processes):
+            self.futures.append(asyncio.ensure_future(
+                self._async_run_shard(shard, concurrency, parse, processes)))
+
+    @contextlib.asynccontextmanager
+    async def async_iter_completed(self, news_list, threads_per_source: int = 1, override_threads=None,
+                                   processes: int = None, parse: bool = False, by_source: bool = False,
+                                   buffer_size: int = None) -> AsyncIterator[MemoryObjectReceiveStream]:
+        """Crawls `news_list` like async_set + async_join, but sends each
+        article as soon as it is downloaded (and with `parse` parsed), in
+        the order they finish. Failed articles are skipped. With
+        `by_source` each source is sent once all its articles are done,
+        purged like async_join does, lone articles still one by one.
+
+        >>> async with pool.async_iter_completed(sources) as results:
+        ...     async for article in results:
+        ...         ...
+
+        At most `buffer_size` (config.pool_concurrency by default) results
+        wait for the consumer, after that the crawl waits too, so memory
+        stays flat however big the crawl. For the same reason sent
+        articles aren't kept on their source, unless `by_source`. With
+        `processes`, results come back a source at a time.
+        The crawl runs in the caller's task, leaving the block early
+        cancels it. The frontier is checkpointed on the way out either way.
+
+        With a frontier, the articles a previous run crawled come first.
+        """
+        jobs, concurrency, processes, restored = self._prepare_jobs(
+            news_list, threads_per_source, override_threads, processes, parse)
+        buffer_size = self.config.pool_concurrency if buffer_size is None else buffer_size
+        send_stream, receive_stream = anyio.create_memory_object_stream(buffer_size)
+
+        try:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(self._async_stream_all, [] if by_source else restored, jobs, concurrency,
+                                      parse, processes, by_source, send_stream)
+                try:
+                    async with receive_stream:
+                        yield receive_stream
+                finally:
+                    # a no-op once everything was received
+                    task_group.cancel_scope.cancel()
+        finally:
+            if self.frontier is not None:
+                self.frontier.checkpoint()
+
+    async def _async_stream_all(self, restored, jobs, concurrency: int, parse: bool, processes: int,
+                                by_source: bool, send_stream):
+        """The restored articles, then those of the jobs
+        """
+        async with send_stream:
+            for article in restored:
+                await send_stream.send(article)
+            if not jobs:
+                return
+            if processes:
+                await self._async_stream_shards(jobs, concurrency, parse, processes, by_source,
+                                                send_stream.clone())
+            else:
+                await self._async_stream_jobs(jobs, concurrency, parse, by_source, send_stream.clone())
+
+    async def _async_send_results(self, source, articles, parse: bool, by_source: bool, send_stream):
+        if by_source and source is not None:
+            self._finish_job(source, articles, parse)
+            await send_stream.send(source)
+            return
+        for article in articles:
+            if is_crawled(article, parse):
+                await send_stream.send(article)
+
+    async def _async_stream_jobs(self, jobs, concurrency: int, parse: bool, by_source: bool, send_stream):
+        client = network.get_async_client(self.config, self.get_scheduler())
+
+        async def run_job(source, articles, send_stream):
+            async with send_stream:
+                if by_source and source is not None:
+                    await async_crawl_articles(articles, self.config, concurrency, parse, client,
+                                               self._checkpointer(parse), self.recorder)
+                    await self._async_send_results(source, articles, parse, by_source, send_stream)
+                    return
+                if source is not None:
+                    source.articles = []
+
+                async def done(article):
+                    self._checkpoint_articles([article], parse)
+                    await self._async_send_results(None, [article], parse, by_source, send_stream)
+                await async_crawl_articles(articles, self.config, concurrency, parse, client, done,
+                                           self.recorder)
+
+        async with send_stream, client:
+            async with anyio.create_task_group() as task_group:
+                for source, articles in jobs:
+                    task_group.start_soon(run_job, source, articles, send_stream.clone())
+
+    async def _async_stream_shards(self, jobs, concurrency: int, parse: bool, processes: int,
+                                   by_source: bool, send_stream):
+        """Every job is a shard of its own here, so it comes back as soon
+        as it's done. No more jobs run than there are processes, so done
+        ones don't pile up while the consumer is busy
         """
-        from .source import AsyncSource, Source
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        limiter = anyio.CapacityLimiter(processes)
+        loop = asyncio.get_running_loop()
+
+        async def run_job(source, articles, send_stream):
+            async with send_stream, limiter:
+                (records,), collected = await loop.run_in_executor(self.process_pool, functools.partial(
+                    crawl_shard, [self._job_payload(source, articles)], self.config, concurrency, parse, processes))
+                metrics.registry.merge(collected)
+                for article, record in zip(articles, records):
+                    apply_record(article, record)
+                self._checkpoint_articles(articles, parse)
+                if source is not None and not by_source:
+                    source.articles = []
+                await self._async_send_results(source, articles, parse, by_source, send_stream)
+
+        async with send_stream:
+            async with anyio.create_task_group() as task_group:
+                for source, articles in jobs:
+                    task_group.start_soon(run_job, source, articles, send_stream.clone())
+
+    def _prepare_jobs(self, news_list, threads_per_source: int, override_threads, processes, parse: bool):
+        """The jobs of news_list, the articles of a job crawled at once,
+        the number of processes and the articles the frontier restored
+        """
+        from .source import AsyncSource
 
         if override_threads is not None:
             num_threads = override_threads
@@ -136,70 +549,144 @@ class AsyncNewsPool(object):
         else:
             num_threads = 1
 
-        timeout = self.config.thread_timeout_seconds
-        #self.pool = ThreadPool(num_threads, timeout)
-        #self.pool = ThreadPoolExecutor(num_threads)
-        # ProcessPool is faster than ThreadPool
-        self.pool = ProcessPoolExecutor(num_threads)
-        
-        loop = asyncio.get_running_loop()
-
-        for news_object in news_list:
-            if isinstance(news_object, AsyncSource):
-                self.futures.append(
-                    loop.run_in_executor(
-                        self.pool.submit(news_object.async_download_articles),
-                    )
-                )
-                #self.pool.add_task(news_object.download_articles)
-            elif isinstance(news_object, Source):
-                self.futures.append(
-                    loop.run_in_executor(
-                        self.pool.submit(news_object.download_articles),
-                    )
-                )
-                #self.pool.add_task(news_object.download_articles)
-            
-            elif isinstance(news_object, AsyncArticle):
-                self.futures.append(
-                    loop.run_in_executor(
-                        self.pool.submit(news_object.async_download),
-                    )
-                )
-                #self.pool.add_task(news_object.async_download)
+        self.dedupe_articles(news_list)
+        jobs = self._make_jobs(news_list)
+        concurrency = max(1, num_threads // max(len(jobs), 1))
+        processes = self.config.number_crawl_processes if processes is None else processes
+        restored = []
+        if self.frontier is not None:
+            jobs, restored = self._resume_jobs(jobs, parse)
+        return jobs, concurrency, processes, restored
+
+    def _resume_jobs(self, jobs, parse: bool):
+        """Restores the articles the frontier has crawled already, and
+        drops them from the jobs. The jobs of sources stay, even if
+        nothing is left to crawl, so their sources are finished
+        """
+        articles = [article for _, job_articles in jobs for article in job_articles]
+        self.frontier.add((a.url, 'article', a.source_url) for a in articles)
+        records = self.frontier.completed(a.url for a in articles)
+        restored = []
+        for article in articles:
+            if article.url in records:
+                apply_record(article, records[article.url])
+                if is_crawled(article, parse):
+                    restored.append(article)
+        if restored:
+            log.debug('%d articles restored from the crawl frontier' % len(restored))
+        skip = set(map(id, restored))
+        jobs = [(source, [a for a in job_articles if id(a) not in skip]) for source, job_articles in jobs]
+        return [(source, job_articles) for source, job_articles in jobs
+                if source is not None or job_articles], restored
+
+    def _checkpointer(self, parse: bool):
+        """The `done` of async_crawl_articles that keeps the articles in
+        the frontier, None without one
+        """
+        if self.frontier is None:
+            return None
+
+        async def done(article):
+            self._checkpoint_articles([article], parse)
+        return done
+
+    def _checkpoint_articles(self, articles, parse: bool):
+        if self.frontier is None:
+            return
+        for article in articles:
+            if is_crawled(article, parse):
+                self.frontier.mark(article.url, DONE, article_to_record(article))
             else:
-                self.futures.append(
-                    loop.run_in_executor(
-                        self.pool.submit(news_object.download),
-                    )
-                )
-                #self.pool.add_task(news_object.download)
+                self.frontier.mark(article.url, FAILED)
+        self.frontier.maybe_checkpoint()
 
-    def set(self, news_list, threads_per_source=1, override_threads=None):
-        """
-        news_list can be a list of `Article`, `Source`, or both.
-
-        If caller wants to decide how many threads to use, they can use
-        `override_threads` which takes precedence over all. Otherwise,
-        this api infers that if the input is all `Source` objects, to
-        allocate one thread per `Source` to not spam the host.
-
-        If both of the above conditions are not true, default to 1 thread.
+    @staticmethod
+    def _make_jobs(news_list) -> List[Tuple[object, list]]:
+        """(source, its articles) for every source, (None, articles) for the
+        lone articles of every host
         """
         from .source import Source
 
-        if override_threads is not None:
-            num_threads = override_threads
-        elif all([isinstance(n, Source) for n in news_list]):
-            num_threads = threads_per_source * len(news_list)
-        else:
-            num_threads = 1
-
-        timeout = self.config.thread_timeout_seconds
-        self.pool = ThreadPool(num_threads, timeout)
-
+        jobs = []
+        hosts = {}
         for news_object in news_list:
             if isinstance(news_object, Source):
-                self.pool.add_task(news_object.download_articles)
+                if news_object.articles:
+                    jobs.append((news_object, list(news_object.articles)))
             else:
-                self.pool.add_task(news_object.download)
+                host = urlparse(news_object.url).netloc
+                if host not in hosts:
+                    hosts[host] = (None, [])
+                    jobs.append(hosts[host])
+                hosts[host][1].append(news_object)
+        return jobs
+
+    @staticmethod
+    def _job_payload(source, articles):
+        """What a worker process gets of a job, see crawl_shard
+        """
+        if source is not None:
+            return source.url, [(a.url, a.title) for a in articles], source.config
+        return '', [(a.url, a.title) for a in articles], articles[0].config
+
+    @staticmethod
+    def _shard_jobs(jobs, shards: int) -> List[list]:
+        """Spreads the jobs over `shards` shards of about the same number of
+        articles, the jobs of a host all in the same shard
+        """
+        buckets = [[] for _ in range(shards)]
+        sizes = [0] * shards
+        host_buckets = {}
+        for source, articles in sorted(jobs, key=lambda job: -len(job[1])):
+            host = urlparse(source.url if source else articles[0].url).netloc
+            if host not in host_buckets:
+                host_buckets[host] = sizes.index(min(sizes))
+            index = host_buckets[host]
+            buckets[index].append((source, articles))
+            sizes[index] += len(articles)
+        return [bucket for bucket in buckets if bucket]
+
+    async def _async_run_job(self, source, articles, concurrency: int, parse: bool):
+        await async_crawl_articles(articles, self.config, concurrency, parse, self.client,
+                                   self._checkpointer(parse), self.recorder)
+        self._finish_job(source, articles, parse)
+
+    async def _async_run_shard(self, shard, concurrency: int, parse: bool, processes: int):
+        loop = asyncio.get_running_loop()
+        jobs = [self._job_payload(source, articles) for source, articles in shard]
+        records, collected = await loop.run_in_executor(self.process_pool, functools.partial(
+            crawl_shard, jobs, self.config, concurrency, parse, processes))
+        metrics.registry.merge(collected)
+        for (source, articles), job_records in zip(shard, records):
+            for article, record in zip(articles, job_records):
+                apply_record(article, record)
+            self._checkpoint_articles(articles, parse)
+            self._finish_job(source, articles, parse)
+
+    @staticmethod
+    def _finish_job(source, articles, parse: bool):
+        """Purges the failed articles of a crawled source, `articles` are
+        those crawled by its job
+        """
+        if source is None:
+            return
+        failed = [a for a in articles if not a.html]
+        if failed:
+            log.warning('The following article urls failed the download: %s' %
+                        ', '.join(a.url for a in failed))
+        source.articles = [a for a in source.articles if is_crawled(a, parse)]
+        source.is_downloaded = True
+        if parse:
+            source.is_parsed = True
+
+    def set(self, news_list, threads_per_source=1, override_threads=None, processes: int = None,
+            parse: bool = False):
+        """
+        news_list can be a list of `Article`, `Source`, or both.
+
+        Sync async_set: the crawl starts on the background event loop of
+        Executor.run_as_sync and goes on while the caller does something
+        else, until join.
+        """
+        Executor.run_as_sync(self.async_set, news_list, threads_per_source, override_threads,
+                             processes, parse)
@@ -4,11 +4,13 @@ All code involving requests and responses over the http network
 must be abstracted in this file.
 """
 
+import asyncio
+import time
 import httpx
 import requests
 import anyio
 
-from typing import List
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 from concurrent import futures
 from newspaper.mthreading import ThreadPool
 #from newspaper.network import (
@@ -17,7 +19,10 @@ from newspaper.mthreading import ThreadPool
 #)
 from .configuration import Configuration
 from .settings import cj
+from .utils.executor import Executor
 from .utils import logger as log
+from .utils import metrics
+from .tracing import span
 
 FAIL_ENCODING = 'ISO-8859-1'
 
@@ -66,20 +71,88 @@ def _get_html_from_response(response: httpx.Response, config: Configuration):
 
     return html or ''
 
-async def async_get_html(url, config=None, response=None):
+
+async def _async_get(client: httpx.AsyncClient, url: str, kwargs: dict) -> httpx.Response:
+    """client.get, counted and timed per phase when metrics are on
+    """
+    trace = metrics.request_trace(url)
+    if trace is None:
+        return await client.get(url, **kwargs)
+    try:
+        response = await client.get(url, extensions={'trace': trace}, **kwargs)
+    except BaseException:
+        trace.finish(None)
+        raise
+    trace.finish(response)
+    return response
+
+
+def get_async_client(config=None, scheduler=None, transport: httpx.AsyncBaseTransport = None) -> httpx.AsyncClient:
+    """A client (and so a connection pool) that several requests of the
+    same source can share. With a `scheduler` (scheduler.FetchScheduler)
+    every request of the client takes one of its slots, those through
+    config.proxies too (proxies from the environment aren't used then).
+    `transport` replaces the network, e.g. with an httpx.MockTransport
+    """
+    config = config or Configuration()
+    kwargs = get_client_init_kwargs(config.request_timeout, config.browser_user_agent, config.proxies, config.headers)
+    if transport is not None:
+        kwargs['transport'] = transport
+    if scheduler is not None:
+        from .scheduler import ScheduledTransport
+
+        # the proxies' transports are built here so they are scheduled too
+        proxies = kwargs.pop('proxies') or {}
+        kwargs['transport'] = ScheduledTransport(transport or httpx.AsyncHTTPTransport(), scheduler)
+        kwargs['mounts'] = {pattern: ScheduledTransport(httpx.AsyncHTTPTransport(proxy=proxy), scheduler)
+                            if proxy else None for pattern, proxy in proxies.items()}
+    return httpx.AsyncClient(**kwargs)
+
+# (user agent, timeout, proxies, headers) -> client, see get_shared_client
+_shared_clients: Dict[tuple, httpx.AsyncClient] = {}
+
+
+def get_shared_client(config=None) -> Optional[httpx.AsyncClient]:
+    """The long lived client, one per client settings, of the background
+    loop of Executor.run_as_sync, so the sync api reuses its connections
+    from call to call. None on any other event loop, callers there open
+    (and close) their own
+    """
+    if asyncio.get_running_loop() is not Executor.loop:
+        return None
+    config = config or Configuration()
+    key = (config.browser_user_agent, config.request_timeout,
+           tuple(sorted((config.proxies or {}).items())), tuple(sorted((config.headers or {}).items())))
+    client = _shared_clients.get(key)
+    if client is None or client.is_closed:
+        client = _shared_clients[key] = get_async_client(config)
+    return client
+
+
+async def aclose_shared_clients():
+    """Closes the clients of get_shared_client, see Executor.shutdown_loop
+    """
+    while _shared_clients:
+        await _shared_clients.popitem()[1].aclose()
+
+
+async def async_get_html(url, config=None, response=None, client: httpx.AsyncClient = None, trace=None):
     """HTTP response code agnostic
     """
     try:
-        return await async_get_html_2XX_only(url, config, response)
-    except requests.exceptions.RequestException as e:
+        return await async_get_html_2XX_only(url, config, response, client, trace)
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
         log.debug('get_html() error. %s on URL: %s' % (e, url))
         return ''
 
-async def async_get_html_2XX_only(url, config=None, response=None):
+async def async_get_html_2XX_only(url, config=None, response=None, client: httpx.AsyncClient = None, trace=None):
     """Consolidated logic for http requests from newspaper. We handle error cases:
     - Attempt to find encoding of the html by using HTTP header. Fallback to
       'ISO-8859-1' if not provided.
     - Error out if a non 2XX HTTP response code is returned.
+
+    The fetch, its redirects and the decoding are spans of `trace`
+    (tracing.ArticleTrace), if given
     """
     config = config or Configuration()
     useragent = config.browser_user_agent
@@ -89,10 +162,19 @@ async def async_get_html_2XX_only(url, config=None, response=None):
 
     if response is not None:
         return _get_html_from_response(response, config)
-    async with httpx.AsyncClient(**get_client_init_kwargs(timeout, useragent, proxies, headers)) as client:
-        response = await client.get(url=url, **get_request_kwargs(timeout, useragent, proxies, headers))
+    with span(trace, 'fetch', url=url) as info:
+        started = time.perf_counter()
+        if client is not None:
+            response = await _async_get(client, url, get_request_kwargs(timeout, useragent, proxies, headers))
+        else:
+            async with httpx.AsyncClient(**get_client_init_kwargs(timeout, useragent, proxies, headers)) as client:
+                response = await _async_get(client, url, get_request_kwargs(timeout, useragent, proxies, headers))
+        info['status'] = response.status_code
+    if trace is not None:
+        trace.add_redirects(response, started)
 
-    html = _get_html_from_response(response, config)
+    with span(trace, 'decode'):
+        html = _get_html_from_response(response, config)
     if config.http_success_only:
         # fail if HTTP sends a non 2XX response
         response.raise_for_status()
@@ -100,13 +182,48 @@ async def async_get_html_2XX_only(url, config=None, response=None):
 
 
 
+async def async_stream(url, config=None, client: httpx.AsyncClient = None, headers: dict = None,
+                       on_response: Callable[[httpx.Response], Any] = None) -> AsyncIterator[bytes]:
+    """Yields the body of a 2XX response in chunks as they arrive, so
+    large documents can be parsed while downloading. Yields nothing for
+    other responses and errors. `headers` are added to the request (e.g.
+    conditional request validators), `on_response` gets the response
+    before its body is read, whatever its status
+    """
+    config = config or Configuration()
+    kwargs = get_request_kwargs(config.request_timeout, config.browser_user_agent, config.proxies, config.headers)
+    if headers:
+        kwargs['headers'] = {**kwargs['headers'], **headers}
+    own_client = client is None
+    client = client or get_async_client(config)
+    trace = metrics.request_trace(url)
+    if trace is not None:
+        kwargs['extensions'] = {'trace': trace}
+    response = None
+    try:
+        async with client.stream('GET', url, **kwargs) as response:
+            if on_response is not None:
+                on_response(response)
+            if response.status_code >= 300:
+                return
+            async for chunk in response.aiter_bytes():
+                yield chunk
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
+        log.debug('async_stream() error. %s on URL: %s' % (e, url))
+    finally:
+        if trace is not None:
+            trace.finish(response)
+        if own_client:
+            await client.aclose()
+
+
 class AsyncMRequest(object):
     """Wrapper for request object for multithreading. If the domain we are
     crawling is under heavy load, the self.resp will be left as None.
     If this is the case, we still want to report the url which has failed
     so (perhaps) we can try again later.
     """
-    def __init__(self, url, config = None, client: httpx.AsyncClient = None):
+    def __init__(self, url, config = None, client: httpx.AsyncClient = None, headers: dict = None):
         self.url = url
         config = config or Configuration()
         self.config = config
@@ -116,24 +233,37 @@ class AsyncMRequest(object):
         self.headers = config.headers
         self.client = client or httpx.AsyncClient(**get_client_init_kwargs(self.timeout, self.useragent, self.proxies, self.headers))
         self.req_args = get_request_kwargs(self.timeout, self.useragent, self.proxies, self.headers)
+        if headers:
+            # per request extras, e.g. conditional request validators
+            self.req_args['headers'] = {**self.req_args['headers'], **headers}
         self.resp = None
 
     async def send(self):
         try:
-            self.resp = await self.client.get(self.url, **self.req_args)
+            self.resp = await _async_get(self.client, self.url, self.req_args)
 
             if self.config.http_success_only:
                 self.resp.raise_for_status()
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, httpx.HTTPError) as e:
             log.critical(f'[REQUEST FAILED] {str(e)}')
 
 
+async def async_request(url: str, config = None, client: httpx.AsyncClient = None,
+                        headers: dict = None) -> AsyncMRequest:
+    """Single url version of async_multithread_request, for callers that
+    schedule their own requests. `headers` are added to the config's
+    """
+    req = AsyncMRequest(url, config=config, client=client, headers=headers)
+    await req.send()
+    return req
+
+
 async def async_multithread_request(urls: List[str], config = None, client: httpx.AsyncClient = None):
     """Request multiple urls via mthreading, order of urls & requests is stable
     returns same requests but with response variables filled.
     """
     config = config or Configuration()
-    client = client or httpx.AsyncClient(**get_client_init_kwargs(config.request_timeout, config.browser_user_agent, config.proxies, config.headers))
+    client = client or get_async_client(config)
     #num_threads = config.number_threads
     #timeout = config.thread_timeout_seconds
     #pool = ThreadPool(num_threads, timeout)
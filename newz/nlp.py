@@ -4,14 +4,13 @@ Anything natural language related should be abstracted into this file.
 """
 import re
 import math
-import nltk
-from os import path
 
 from collections import Counter
 from typing import Dict, List, Any, Set
 
-from . import settings
+from .utils import setup_nltk
 from .utils.executor import Executor
+from .utils.resources import ResourceRegistry
 
 ideal = 20.0
 
@@ -28,35 +27,26 @@ def load_stopwords(language):
     """
     global stopwords, current_stopwords
     if stopwords.get(language): return
-    
-    # stopwords for nlp in English are not the regular stopwords
-    # to pass the tests
-    # can be changed with the tests
-    if language == 'en':
-        stopwordsFile = settings.NLP_STOPWORDS_EN
-    else:
-        stopwordsFile = path.join(settings.STOPWORDS_DIR, 'stopwords-{}.txt'.format(language))
+    stopwords[language] = ResourceRegistry.get_nlp_stopwords(language)
+    current_stopwords.update(stopwords[language])
 
-    with open(stopwordsFile, 'r', encoding='utf-8') as f:
-        stopwords[language] = set([w.strip() for w in f.readlines()])
-        current_stopwords.update(stopwords[language])
-        #stopwords.update(set([w.strip() for w in f.readlines()]))
-        
 
 async def async_summarize(url: str = '', title: str = '', text: str = '', max_sents: int = 5):
+    """summarize on the nlp stage of the Executor
+    """
     if not text or not title or max_sents <= 0: return []
-    summaries = []
-    sentences = await Executor.run_as_async(split_sentences, text)
-    keys = await Executor.run_as_async(keywords, text)
-    titleWords = await Executor.run_as_async(split_words, title)
+    return await Executor.run_in_stage('nlp', summarize, url, title, text, max_sents)
 
-    # Score sentences, and use the top 5 or max_sents sentences
-    scores: Counter = await Executor.run_as_async(score, sentences, titleWords, keys)
-    ranks = scores.most_common(max_sents)
-    for rank in ranks:
-        summaries.append(rank[0])
-    summaries.sort(key=lambda summary: summary[0])
-    return [summary[1] for summary in summaries]
+
+def analyze(title: str, text: str, num_keywords: int, max_sents: int, language: str):
+    """The keywords (of the title and the text) and the summary sentences
+    of an article, in one call so it can run on any worker of the nlp
+    stage, threads or processes
+    """
+    load_stopwords(language)
+    text_keyws = list(keywords(text, num_keywords=num_keywords, language=language).keys())
+    title_keyws = list(keywords(title, num_keywords=num_keywords, language=language).keys())
+    return list(set(title_keyws + text_keyws)), summarize(title=title, text=text, max_sents=max_sents)
 
 def summarize(url='', title='', text='', max_sents=5):
     if not text or not title or max_sents <= 0:
@@ -176,6 +166,8 @@ def split_sentences(text):
     """
     global tokenizers
     if not tokenizers.get('punkt_english'):
+        import nltk
+        setup_nltk.ensure_corpora()
         tokenizers['punkt_english'] = nltk.data.load('tokenizers/punkt/english.pickle')
     #import nltk.data
     #tokenizer = nltk.data.load('tokenizers/punkt/english.pickle')
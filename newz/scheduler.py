@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Fair, host aware scheduling of the fetches of many sources, see
+AsyncNewsPool. Every request waits in the queue of its host until the
+scheduler grants it a slot:
+
+- at most `concurrency` requests are in flight overall and at most
+  `domain_concurrency` per host
+- a host with a token bucket (`domain_rate` requests per second, bursts of
+  `domain_burst`) waits for a token, so its traffic is smooth
+- among the hosts that may go, the next slot goes to the one with the
+  smallest start tag (start-time fair queueing): each host gets its
+  `weight` share of the slots however many requests it queued, so a big
+  source can't starve the small ones
+
+Slots are granted as soon as one frees up, by whichever request releases
+it, so no host waits while another one's queue has work and a slot is
+free.
+"""
+
+import collections
+import math
+import time
+
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import anyio
+import httpx
+
+from .configuration import Configuration
+
+
+class TokenBucket(object):
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is
+        """
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Host(object):
+    __slots__ = ('name', 'weight', 'waiters', 'active', 'finish', 'bucket')
+
+    def __init__(self, name: str, weight: float, bucket: Optional[TokenBucket]):
+        self.name = name
+        self.weight = weight
+        self.waiters = collections.deque()
+        self.active = 0
+        # virtual finish tag of the last slot granted
+        self.finish = 0.0
+        self.bucket = bucket
+
+
+class FetchScheduler(object):
+    """
+    >>> scheduler = FetchScheduler(concurrency=20, domain_rate=2)
+    >>> async with scheduler.slot('cnn.com'):
+    ...     response = await client.get(url)
+
+    or, for every request of a client, network.get_async_client(config, scheduler)
+    """
+    def __init__(self, concurrency: int = 50, domain_concurrency: int = 2,
+                 domain_rate: float = None, domain_burst: float = 1):
+        self.concurrency = concurrency
+        self.domain_concurrency = domain_concurrency
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+        self.hosts: Dict[str, _Host] = {}
+        # hosts with queued requests, in arrival order
+        self.backlogged: Dict[str, _Host] = {}
+        self.weights: Dict[str, float] = {}
+        self.active = 0
+        self.virtual_time = 0.0
+
+    @classmethod
+    def from_config(cls, config: Configuration, processes: int = 1) -> 'FetchScheduler':
+        """The scheduler of one of `processes` processes sharing the
+        configured concurrency
+        """
+        return cls(concurrency=max(1, config.pool_concurrency // max(processes, 1)),
+                   domain_concurrency=config.domain_concurrency,
+                   domain_rate=config.domain_rate, domain_burst=config.domain_burst)
+
+    @property
+    def queued(self) -> int:
+        """Requests waiting for a slot
+        """
+        return sum(len(host.waiters) for host in self.backlogged.values())
+
+    def set_weight(self, host: str, weight: float):
+        """Gives `host` `weight` times the share of a host of weight 1
+        """
+        self.weights[host] = weight
+        if host in self.hosts:
+            self.hosts[host].weight = weight
+
+    def _host(self, name: str) -> _Host:
+        host = self.hosts.get(name)
+        if host is None:
+            bucket = None
+            if self.domain_rate:
+                bucket = TokenBucket(self.domain_rate, self.domain_burst, time.monotonic())
+            host = self.hosts[name] = _Host(name, self.weights.get(name, 1.0), bucket)
+        return host
+
+    def _dispatch(self) -> float:
+        """Grants free slots to the queued requests, returns the seconds
+        until a token bucket lets a waiting host go (inf if none waits
+        for a token)
+        """
+        now = time.monotonic()
+        wakeup = math.inf
+        while self.active < self.concurrency and self.backlogged:
+            best = best_start = None
+            for host in self.backlogged.values():
+                if host.active >= self.domain_concurrency:
+                    continue
+                if host.bucket is not None:
+                    delay = host.bucket.wait_time(now)
+                    if delay > 0:
+                        wakeup = min(wakeup, delay)
+                        continue
+                start = max(host.finish, self.virtual_time)
+                if best is None or start < best_start:
+                    best, best_start = host, start
+            if best is None:
+                break
+            self.virtual_time = best_start
+            best.finish = best_start + 1.0 / best.weight
+            if best.bucket is not None:
+                best.bucket.take(now)
+            best.active += 1
+            self.active += 1
+            best.waiters.popleft().set()
+            if not best.waiters:
+                del self.backlogged[best.name]
+        return wakeup
+
+    async def acquire(self, name: str):
+        """Waits for a slot for a request to host `name`, release it
+        afterwards
+        """
+        host = self._host(name)
+        granted = anyio.Event()
+        host.waiters.append(granted)
+        self.backlogged.setdefault(name, host)
+        try:
+            while True:
+                wakeup = self._dispatch()
+                if granted.is_set():
+                    return
+                with anyio.move_on_after(None if wakeup == math.inf else wakeup):
+                    await granted.wait()
+                if granted.is_set():
+                    return
+        except BaseException:
+            if granted.is_set():
+                self.release(name)
+            else:
+                host.waiters.remove(granted)
+                if not host.waiters:
+                    self.backlogged.pop(name, None)
+            raise
+
+    def release(self, name: str):
+        host = self.hosts[name]
+        host.active -= 1
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, name: str):
+        await self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives the slot back once it's closed
+    """
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            if self.release is not None:
+                self.release, release = None, self.release
+                release()
+
+
+class ScheduledTransport(httpx.AsyncBaseTransport):
+    """Takes a slot of `scheduler` for every request, held until its
+    response is read
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport, scheduler: FetchScheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        await self.scheduler.acquire(host)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.scheduler.release(host)
+            raise
+        if response.is_closed:
+            # already read, e.g. by a mock transport, nothing will close it
+            self.scheduler.release(host)
+        else:
+            response.stream = _ReleasingStream(response.stream, lambda: self.scheduler.release(host))
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -24,6 +24,9 @@ STOPWORDS_DIR = os.path.join(PARENT_DIRECTORY, 'resources/text')
 NLP_STOPWORDS_EN = os.path.join(
     PARENT_DIRECTORY, 'resources/misc/stopwords-nlp-en.txt')
 
+# Prebuilt index of all of the above, see utils/resources.py
+RESOURCE_INDEX = os.path.join(PARENT_DIRECTORY, 'resources/index.pickle')
+
 DATA_DIRECTORY = '.newspaper_scraper'
 
 TOP_DIRECTORY = os.path.join(tempfile.gettempdir(), DATA_DIRECTORY)
@@ -33,18 +36,19 @@ LOGFILE = os.path.join(TOP_DIRECTORY, 'newspaper_errors_%s.log' % __version__)
 MONITOR_LOGFILE = os.path.join(
     TOP_DIRECTORY, 'newspaper_monitors_%s.log' % __version__)
 
+# The directories below are created on first write (utils.memo.SeenStore,
+# utils.bloom.BloomFilter, utils.cache.DiskCache), importing never touches
+# the disk
+
 # Memo directory (same for all concur crawlers)
 MEMO_FILE = 'memoized'
 MEMO_DIR = os.path.join(TOP_DIRECTORY, MEMO_FILE)
 
+# Bloom filter in front of every domain's memo, see utils/bloom.py
+SEEN_FILTER = os.path.join(MEMO_DIR, 'seen_urls.bloom')
+
 # category and feed cache
 CF_CACHE_DIRECTORY = 'feed_category_cache'
 ANCHOR_DIRECTORY = os.path.join(TOP_DIRECTORY, CF_CACHE_DIRECTORY)
 
 TRENDING_URL = 'http://www.google.com/trends/hottrends/atom/feed?pn=p1'
-
-for path in (TOP_DIRECTORY, MEMO_DIR, ANCHOR_DIRECTORY):
-    try:
-        os.mkdir(path)
-    except FileExistsError:
-        pass
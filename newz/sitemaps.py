@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Sitemap based article discovery: robots.txt `Sitemap:` lines, sitemap
+indexes, urlsets and Google News sitemaps. Like feeds.FeedParser the
+parser is incremental, so a sitemap (gzipped or not) is parsed while it
+downloads and only one entry is in memory at a time.
+"""
+import datetime
+import zlib
+
+from typing import Iterator, List, Optional, Union
+
+from lxml import etree
+
+from .feeds import CHUNK_SIZE, FeedParser, _local_name, parse_date
+
+GZIP_MAGIC = b'\x1f\x8b'
+# the sitemap protocol caps a sitemap at 50MB uncompressed, anything
+# bigger is cut off there
+MAX_SITEMAP_SIZE = 50 * 1024 * 1024
+
+# tried in this order when robots.txt doesn't list any sitemap, up to
+# the first that exists
+COMMON_SITEMAP_PATHS = ('/news-sitemap.xml', '/sitemap_news.xml', '/sitemap_index.xml', '/sitemap.xml')
+
+
+class SitemapEntry(object):
+    """One <url> of a urlset, or one <sitemap> of a sitemap index
+    """
+    __slots__ = ('url', 'lastmod', 'published', 'title', 'is_index')
+
+    def __init__(self, url: str = '', lastmod: Optional[datetime.datetime] = None,
+                 published: Optional[datetime.datetime] = None, title: str = '', is_index: bool = False):
+        self.url = url
+        self.lastmod = lastmod
+        # <news:publication_date> of news sitemaps
+        self.published = published
+        self.title = title
+        self.is_index = is_index
+
+    @property
+    def date(self) -> Optional[datetime.datetime]:
+        return self.published or self.lastmod
+
+    def is_older_than(self, max_age: float, now: Optional[datetime.datetime] = None) -> bool:
+        """Entries without a date are never considered stale
+        """
+        if self.date is None or max_age is None:
+            return False
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        return (now - self.date).total_seconds() > max_age
+
+    def __repr__(self):
+        return 'SitemapEntry(url=%r, date=%r, is_index=%r)' % (self.url, self.date, self.is_index)
+
+
+def _entry_from_element(element) -> SitemapEntry:
+    entry = SitemapEntry(is_index=_local_name(element.tag) == 'sitemap')
+    # only direct children, <image:loc> and friends are nested deeper
+    for child in element:
+        name = _local_name(child.tag)
+        if name == 'loc':
+            entry.url = (child.text or '').strip()
+        elif name == 'lastmod':
+            entry.lastmod = parse_date(child.text)
+        elif name == 'news':
+            for news_child in child:
+                news_name = _local_name(news_child.tag)
+                if news_name == 'publication_date':
+                    entry.published = parse_date(news_child.text)
+                elif news_name == 'title':
+                    entry.title = (news_child.text or '').strip()
+    return entry
+
+
+class SitemapParser(FeedParser):
+    """Push parser for sitemaps and sitemap indexes, see FeedParser.
+    Gzipped sitemaps (sitemap.xml.gz) are recognized by their magic bytes
+    and decompressed on the fly.
+    """
+    entry_tags = ('url', 'sitemap')
+
+    def __init__(self, max_size: int = MAX_SITEMAP_SIZE):
+        super().__init__()
+        self.max_size = max_size
+        self.size = 0
+        self.decompressor = None
+        self.head = b''
+
+    def make_entry(self, element) -> SitemapEntry:
+        return _entry_from_element(element)
+
+    def _decompress(self, chunk: bytes) -> bytes:
+        if self.head is not None:
+            # wait for the two magic bytes before deciding
+            self.head += chunk
+            if len(self.head) < len(GZIP_MAGIC):
+                return b''
+            chunk, self.head = self.head, None
+            if chunk.startswith(GZIP_MAGIC):
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.decompressor is None:
+            return chunk
+        try:
+            # never inflate past the size cap, whatever the ratio
+            return self.decompressor.decompress(chunk, max(self.max_size - self.size, 0) + 1)
+        except zlib.error:
+            self.size = self.max_size + 1
+            return b''
+
+    def feed(self, chunk: Union[str, bytes]) -> List[SitemapEntry]:
+        if isinstance(chunk, bytes):
+            chunk = self._decompress(chunk)
+        if self.size > self.max_size:
+            return []
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            chunk = chunk[:len(chunk) - (self.size - self.max_size)]
+        return super().feed(chunk)
+
+    def close(self) -> List[SitemapEntry]:
+        if self.head:
+            # fewer bytes than the magic, can't be gzip
+            entries = super().feed(self.head)
+            self.head = None
+            return entries + super().close()
+        return super().close()
+
+
+def iter_sitemap_entries(content: Union[str, bytes], chunk_size: int = CHUNK_SIZE) -> Iterator[SitemapEntry]:
+    """Streams the entries of an already downloaded sitemap
+    """
+    if not content:
+        return
+    parser = SitemapParser()
+    try:
+        for start in range(0, len(content), chunk_size):
+            yield from parser.feed(content[start:start + chunk_size])
+        yield from parser.close()
+    except etree.XMLSyntaxError:
+        return
+
+
+def parse_robots_sitemaps(robots_txt: str) -> List[str]:
+    """The `Sitemap:` urls of a robots.txt
+    """
+    sitemap_urls = []
+    for line in (robots_txt or '').splitlines():
+        key, _, value = line.partition(':')
+        if key.strip().lower() == 'sitemap' and value.strip():
+            sitemap_urls.append(value.strip())
+    return list(dict.fromkeys(sitemap_urls))
@@ -1,17 +1,31 @@
 
+import os
+import math
+import anyio
+import hashlib
+import contextlib
+import datetime
+
 from urllib.parse import urljoin, urlsplit, urlunsplit
+from anyio.streams.memory import MemoryObjectReceiveStream
+from lxml import etree
 
 from tldextract import tldextract
-from typing import List, Union
+from typing import Any, AsyncIterator, Callable, Dict, List, Union
 
+from . import feeds
 from . import network
+from . import sitemaps
 from .article import Article, AsyncArticle
+from .urls import UrlClassifier
 from .configuration import Configuration
 from .settings import ANCHOR_DIRECTORY
 
 from .utils import logger as log
 from .utils.executor import Executor
 from .utils import helpers as utils
+from .utils.cache import DiskCache
+from .utils import metrics
 
 import newspaper.urls as urls
 from newspaper.extractors import ContentExtractor
@@ -23,17 +37,111 @@ class Category(object):
         self.url = url
         self.html = None
         self.doc = None
+        # set once its links were extracted and its html dropped, see
+        # AsyncSource._release_page
+        self.released = False
+
+    def release(self):
+        self.html = None
+        self.doc = None
+        self.released = True
 
 
 class Feed(object):
     def __init__(self, url):
         self.url = url
         self.rss = None
+        self.released = False
         # TODO self.dom = None, speed up Feedparser
 
+    def release(self):
+        self.rss = None
+        self.released = True
+
+
+class PageState(object):
+    """A category, feed or sitemap page as of its last fetch: its http
+    validators, a hash of its content and the article links found on it,
+    see AsyncSource.async_refresh
+    """
+    __slots__ = ('is_feed', 'etag', 'last_modified', 'content_hash', 'links', 'is_sitemap')
+
+    def __init__(self, is_feed: bool, etag: str = None, last_modified: str = None,
+                 content_hash: str = None, links=frozenset(), is_sitemap: bool = False):
+        self.is_feed = is_feed
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.links = frozenset(links)
+        # last, so the states saved before sitemaps had one still load
+        self.is_sitemap = is_sitemap
+
+    @staticmethod
+    def content_hasher():
+        """For content hashed while it streams, see hash_content
+        """
+        return hashlib.blake2b(digest_size=16)
+
+    @classmethod
+    def hash_content(cls, content: Union[str, bytes]) -> str:
+        if isinstance(content, str):
+            content = content.encode('utf-8', 'surrogatepass')
+        hasher = cls.content_hasher()
+        hasher.update(content or b'')
+        return hasher.hexdigest()
+
+    def update(self, response, content: Union[str, bytes] = None, content_hash: str = None) -> bool:
+        """Takes the validators and content (or its hash) of a new fetch,
+        returns whether the content changed
+        """
+        self.etag = response.headers.get('etag')
+        self.last_modified = response.headers.get('last-modified')
+        if content_hash is None:
+            content_hash = self.hash_content(content)
+        changed = content_hash != self.content_hash
+        self.content_hash = content_hash
+        return changed
+
+    def request_headers(self) -> Dict[str, str]:
+        """Conditional request headers, a server that supports them
+        answers 304 Not Modified when nothing changed
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def to_tuple(self):
+        return (self.is_feed, self.etag, self.last_modified, self.content_hash, self.links, self.is_sitemap)
+
+    @classmethod
+    def from_tuple(cls, values) -> 'PageState':
+        return cls(*values)
+
 
 NUM_THREADS_PER_SOURCE_WARN_LIMIT = 5
 
+# same cap as extractor.get_feed_urls, applied across the whole source
+NUM_FEEDS_PER_SOURCE_LIMIT = 50
+
+FEED_CONTENT_TYPES = ('application/rss+xml', 'application/atom+xml')
+# what a probed feed location may answer with, xhtml pages aren't feeds
+PROBE_CONTENT_TYPES = FEED_CONTENT_TYPES + ('application/xml', 'text/xml')
+
+# sitemaps (including those listed by an index) followed per source
+NUM_SITEMAPS_PER_SOURCE_LIMIT = 50
+# sitemap urls turned into articles at once, so the first articles of a
+# big sitemap come out while the rest still downloads
+SITEMAP_BATCH_SIZE = 500
+
+# seconds the category and feed urls of a source are cached
+CATEGORY_CACHE_SECONDS = 86400
+FEED_CACHE_SECONDS = 86400
+# seconds the page states of async_refresh survive on disk
+PAGE_STATE_CACHE_SECONDS = 86400
+
 
 class AsyncSource(Source):
     """Sources are abstractions of online news vendors like huffpost or cnn.
@@ -41,36 +149,490 @@ class AsyncSource(Source):
     scheme     =  'http'
     categories =  ['http://cnn.com/world', 'http://money.cnn.com']
     feeds      =  ['http://cnn.com/rss.atom', ..]
+    sitemaps   =  ['http://cnn.com/sitemaps/news.xml', ..]
     articles   =  [<article obj>, <article obj>, ..]
     brand      =  'cnn'
     """
     def __init__(self, url: str, config = None, **kwargs):
         config = config or Configuration()
         super().__init__(url = url, config = config, **kwargs)
+        # after the kwargs (collect_metrics=True, ..) are applied
+        metrics.configure(self.config)
+        Executor.maybe_configure(self.config)
+        # category / feed / sitemap url -> PageState, see async_refresh
+        self.page_states: Dict[str, PageState] = {}
+        # urls of the sitemaps followed, see _async_discover_sitemaps
+        self.sitemaps: List[str] = []
+        # scheduler.FetchScheduler the requests of builds go through, set
+        # by AsyncNewsPool.async_build_sources
+        self.scheduler = None
+        # client the builds use instead of one of their own, set by
+        # the sync build
+        self.client = None
+
+    @property
+    def url_classifier(self) -> UrlClassifier:
+        return UrlClassifier.get(self.domain)
+
+    def metrics(self, format: str = None):
+        """What was recorded for the domain of the source and of its
+        articles (see config.collect_metrics and utils/metrics.py), with
+        the queue depths of the executor stages. A dict, or the text to
+        export with `format` 'json' or 'prometheus'
+        """
+        domains = {self.domain} | {metrics.domain_of(article.url) for article in self.articles}
+        return metrics.registry.export(format, domains, metrics.stage_gauges(Executor.metrics()))
     
-    async def async_build(self):
-        """Encapsulates download and basic parsing with lxml. May be a
-        good idea to split this into download() and parse() methods.
+    def build(self, limit: int = 5000):
+        """Sync async_build, on the background event loop of
+        Executor.run_as_sync and over its shared connection pool
+        """
+        Executor.run_as_sync(self._async_build_shared, limit)
+
+    async def _async_build_shared(self, limit: int):
+        self.client = network.get_shared_client(self.config)
+        try:
+            await self.async_build(limit)
+        finally:
+            self.client = None
+
+    def download_articles(self, threads=1):
+        """Sync download of the articles, `threads` at a time, on the
+        background event loop of Executor.run_as_sync and over its shared
+        connection pool. Failed articles are dropped
         """
-        await self.async_download()
-        await self.async_parse()
+        Executor.run_as_sync(self._async_download_articles_shared, threads)
 
-        await self.async_set_categories()
-        await self.async_download_categories()  # mthread
-        await self.async_parse_categories()
-        await self.async_set_feeds()
-        await self.async_download_feeds()  # mthread
-        # self.parse_feeds()
-        await self.async_generate_articles()
+    async def _async_download_articles_shared(self, threads: int):
+        from .mthreading import AsyncNewsPool, async_crawl_articles
 
+        articles = self.articles
+        await async_crawl_articles(articles, self.config, max(threads, 1),
+                                   client=network.get_shared_client(self.config))
+        AsyncNewsPool._finish_job(self, articles, parse=False)
 
-    async def async_set_categories(self):
-        return await Executor.run_as_async(self.set_categories)
+    async def async_build(self, limit: int = 5000):
+        """Encapsulates download and basic parsing with lxml. The stages
+        run as a concurrent discovery graph, see async_iter_articles.
+        """
+        articles = []
+        async with self.async_iter_articles() as batches:
+            async for batch in batches:
+                articles.extend(batch)
+        self.articles: List[AsyncArticle] = articles[:limit]
+        log.debug('%d articles generated and cutoff at %d',
+                  len(articles), limit)
 
-    async def async_set_feeds(self):
-        """Don't need to cache getting feed urls, it's almost
-        instant with xpath
+    @contextlib.asynccontextmanager
+    async def async_iter_articles(self) -> AsyncIterator[MemoryObjectReceiveStream]:
+        """Builds the source and sends the articles of every category
+        and feed as soon as that one is ready, instead of awaiting each
+        stage for all of them:
+
+        - the common feed probes start next to the homepage download
+        - each category is parsed, and its feed links followed, as soon
+          as its own download finishes
+        - each feed is downloaded as soon as it is discovered
+
+        >>> async with source.async_iter_articles() as batches:
+        ...     async for articles in batches:
+        ...         ...
+
+        config.discovery picks the strategies: 'pages' (the above),
+        'sitemaps' (see _async_discover_sitemaps) or 'all'.
+        Urls already sent for another category or feed are dropped.
+        The tasks run in the caller's task, leaving the block early
+        cancels them and the source isn't finished (feed urls and page
+        states aren't saved).
+        """
+        self.categories = []
+        self.feeds = []
+        self.sitemaps = []
+        self._feed_urls = set()
+        self.page_states = {}
+        await self.url_classifier.async_load(DiskCache.open(ANCHOR_DIRECTORY))
+
+        async with self._async_pipeline(self._async_discover_all, self._async_finish_build) as batches:
+            yield batches
+
+    async def _async_finish_build(self):
+        self.categories = [c for c in self.categories if c.doc is not None or c.released]
+        self.feeds = [f for f in self.feeds if f.rss or f.released]
+        await self._async_cache_feed_urls()
+        await self._async_save_page_states()
+
+    @contextlib.asynccontextmanager
+    async def _async_pipeline(self, start, finish=None) -> AsyncIterator[MemoryObjectReceiveStream]:
+        """Runs `start(task_group, client, send_stream)`, which spawns the
+        tasks that send lists of articles, and yields a stream of those
+        lists without the urls already sent. `finish()` is awaited once
+        all of them are done, before the stream ends
+        """
+        send_stream, receive_stream = anyio.create_memory_object_stream(math.inf)
+        fresh_send, fresh_receive = anyio.create_memory_object_stream(math.inf)
+
+        if self.client is not None:
+            client_context = contextlib.nullcontext(self.client)
+        else:
+            client_context = network.get_async_client(self.config, self.scheduler)
+        async with client_context as client:
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(start, task_group, client, send_stream)
+                task_group.start_soon(self._async_drop_seen, receive_stream, fresh_send, finish)
+                try:
+                    async with fresh_receive:
+                        yield fresh_receive
+                finally:
+                    # a no-op once everything was received
+                    task_group.cancel_scope.cancel()
+
+    @staticmethod
+    async def _async_drop_seen(receive_stream, send_stream, finish=None):
+        seen_urls = set()
+        async with send_stream:
+            async with receive_stream:
+                async for articles in receive_stream:
+                    fresh = []
+                    # a page may link the same story twice
+                    for article in articles:
+                        if article.url not in seen_urls:
+                            seen_urls.add(article.url)
+                            fresh.append(article)
+                    if fresh:
+                        await send_stream.send(fresh)
+            if finish is not None:
+                await finish()
+
+    @contextlib.asynccontextmanager
+    async def async_refresh(self) -> AsyncIterator[MemoryObjectReceiveStream]:
+        """Sends only the articles linked since the last build or
+        refresh, for polling a source, like async_iter_articles. Only the
+        categories, feeds and sitemaps found by that build are refetched:
+        with conditional requests (ETag / Last-Modified) when the server
+        supports them, and pages whose content hash didn't change aren't
+        parsed again. The links of changed pages are diffed against the
+        previous ones.
+
+        Page states are kept on the source and on disk (for a day), so a
+        new process can refresh too. Without any state this is a full
+        async_iter_articles. New categories and feeds are only discovered
+        by rebuilding, new sitemaps of a refreshed sitemap index are
+        followed.
+        """
+        if not self.page_states:
+            await self._async_load_page_states()
+        if not self.page_states:
+            async with self.async_iter_articles() as batches:
+                yield batches
+            return
+
+        known_pages = {page.url for page in self.categories + self.feeds} | set(self.sitemaps)
+        for url, state in self.page_states.items():
+            if url in known_pages:
+                continue
+            if state.is_sitemap:
+                self.sitemaps.append(url)
+            elif state.is_feed:
+                self.feeds.append(Feed(url=url))
+            else:
+                self.categories.append(Category(url=url))
+        await self.url_classifier.async_load(DiskCache.open(ANCHOR_DIRECTORY))
+
+        async with self._async_pipeline(self._async_refresh_pages, self._async_save_page_states) as batches:
+            yield batches
+
+    async def _async_refresh_pages(self, task_group, client, send_stream):
+        async with send_stream:
+            for page in self.categories + self.feeds:
+                if page.url in self.page_states:
+                    task_group.start_soon(self._async_refresh_page, page, client, send_stream.clone())
+            for url in list(self.sitemaps):
+                if url in self.page_states:
+                    task_group.start_soon(self._async_build_sitemap, url, task_group, client, send_stream.clone())
+
+    async def _async_refresh_page(self, page, client, send_stream):
+        async with send_stream:
+            state = self.page_states[page.url]
+            req = await network.async_request(page.url, self.config, client, headers=state.request_headers())
+            if req.resp is None or req.resp.status_code == 304 or req.resp.status_code >= 400:
+                return
+            content = await network.async_get_html(page.url, self.config, response=req.resp)
+            if not content or not state.update(req.resp, content):
+                return
+            if isinstance(page, Feed):
+                page.rss = content
+                articles = await Executor.run_as_async(self._feed_to_articles, page)
+            else:
+                page.html = content
+                if not await self._async_parse_page(page):
+                    return
+                articles = await Executor.run_as_async(self._category_to_articles, page)
+            self._release_page(page)
+            await send_stream.send(articles)
+
+    def _release_page(self, page):
+        """Drops the buffers of a category or feed whose links were
+        extracted, in config.lean_source mode. Its PageState keeps what
+        async_refresh needs
+        """
+        if self.config.lean_source:
+            page.release()
+
+    def _remember_page(self, page, response, content):
+        """Starts the PageState of a page fetched by a build
+        """
+        state = PageState(is_feed=isinstance(page, Feed))
+        state.update(response, content)
+        self.page_states[page.url] = state
+
+    def _page_state_cache_key(self):
+        return 'page_states:%s' % self.domain
+
+    async def _async_save_page_states(self):
+        states = {url: state.to_tuple() for url, state in self.page_states.items()}
+        await DiskCache.open(ANCHOR_DIRECTORY).async_set(
+            self._page_state_cache_key(), states, PAGE_STATE_CACHE_SECONDS)
+
+    async def _async_load_page_states(self):
+        states = await DiskCache.open(ANCHOR_DIRECTORY).async_get(self._page_state_cache_key())
+        self.page_states = {url: PageState.from_tuple(values) for url, values in (states or {}).items()}
+
+    def _feed_cache_key(self):
+        return 'feed_urls:%s' % self.domain
+
+    async def _async_cache_feed_urls(self):
+        """Remembers the working feeds, so the next build downloads them
+        right away instead of probing the common feed locations
+        """
+        cache = DiskCache.open(ANCHOR_DIRECTORY)
+        if self.feeds:
+            await cache.async_set(self._feed_cache_key(), [f.url for f in self.feeds], FEED_CACHE_SECONDS)
+        else:
+            await Executor.run_as_async(cache.delete, self._feed_cache_key())
+
+    async def _async_discover_all(self, task_group, client, send_stream):
+        async with send_stream:
+            if self.config.discovery not in ('pages', 'sitemaps', 'all'):
+                raise ValueError('Unknown discovery strategy %r' % self.config.discovery)
+            if self.config.discovery in ('sitemaps', 'all'):
+                task_group.start_soon(self._async_discover_sitemaps, task_group, client, send_stream.clone())
+            if self.config.discovery in ('pages', 'all'):
+                task_group.start_soon(self._async_discover, task_group, client, send_stream.clone())
+
+    async def _async_discover_sitemaps(self, task_group, client, send_stream):
+        """Sitemaps listed in robots.txt, or the first of the common
+        locations that exists if it doesn't list any. Much cheaper than
+        category pages for publishers with (news) sitemaps: no html to
+        download and score
+        """
+        async with send_stream:
+            req = await network.async_request(urljoin(self.url, '/robots.txt'), self.config, client)
+            sitemap_urls = []
+            if req.resp is not None and req.resp.status_code < 300:
+                sitemap_urls = sitemaps.parse_robots_sitemaps(req.resp.text)
+            for url in sitemap_urls:
+                self._add_sitemap(url, task_group, client, send_stream)
+            if sitemap_urls:
+                return
+            # one after the other: an index and the sitemap next to it
+            # usually list the same urls
+            for path in sitemaps.COMMON_SITEMAP_PATHS:
+                url = urljoin(self.url, path)
+                self.sitemaps.append(url)
+                if await self._async_build_sitemap(url, task_group, client, send_stream.clone()):
+                    return
+                self.sitemaps.remove(url)
+
+    def _add_sitemap(self, url, task_group, client, send_stream):
+        if url in self.sitemaps or len(self.sitemaps) >= NUM_SITEMAPS_PER_SOURCE_LIMIT:
+            return
+        self.sitemaps.append(url)
+        task_group.start_soon(self._async_build_sitemap, url, task_group, client, send_stream.clone())
+
+    async def _async_build_sitemap(self, url, task_group, client, send_stream) -> bool:
+        """Parses the sitemap while it downloads. Index entries are
+        followed, urlset entries become articles in batches. Both are
+        skipped when older than config.max_sitemap_entry_age. Returns
+        whether the whole sitemap was read.
+
+        Also refreshes a sitemap: with its PageState the request is
+        conditional and only the links it didn't have before are sent.
+        The state is replaced once the whole sitemap was read
+        """
+        async with send_stream:
+            max_age = self.config.max_sitemap_entry_age
+            now = datetime.datetime.now(datetime.timezone.utc)
+            parser = sitemaps.SitemapParser()
+            state = self.page_states.get(url)
+            responses = []
+            hasher = PageState.content_hasher()
+            # the article links of every batch, see _url_titles_to_articles
+            links = set()
+            url_titles = []
+
+            async def handle(entries):
+                for entry in entries:
+                    if not entry.url or entry.is_older_than(max_age, now):
+                        continue
+                    if entry.is_index:
+                        self._add_sitemap(urljoin(url, entry.url), task_group, client, send_stream)
+                    else:
+                        url_titles.append((entry.url, entry.title))
+                if len(url_titles) >= SITEMAP_BATCH_SIZE:
+                    await send_stream.send(
+                        await Executor.run_as_async(self._url_titles_to_articles, url_titles[:], url, links))
+                    url_titles.clear()
+
+            complete = False
+            try:
+                async for chunk in network.async_stream(url, self.config, client, on_response=responses.append,
+                                                        headers=state.request_headers() if state else None):
+                    hasher.update(chunk)
+                    await handle(parser.feed(chunk))
+                await handle(parser.close())
+                complete = True
+            except etree.XMLSyntaxError as e:
+                log.debug('Sitemap %s is not xml: %s' % (url, e))
+            if url_titles:
+                await send_stream.send(
+                    await Executor.run_as_async(self._url_titles_to_articles, url_titles, url, links))
+            # a 304, a failed or a broken fetch leaves the state as it was
+            if not complete or not responses or responses[0].status_code >= 300:
+                return False
+            state = state or PageState(is_feed=False, is_sitemap=True)
+            state.update(responses[0], content_hash=hasher.hexdigest())
+            state.links = frozenset(links)
+            self.page_states[url] = state
+            return True
+
+    async def _async_discover(self, task_group, client, send_stream):
+        async with send_stream:
+            cached_feed_urls = await DiskCache.open(ANCHOR_DIRECTORY).async_get(self._feed_cache_key())
+            if cached_feed_urls:
+                for url in cached_feed_urls:
+                    self._add_feed(url, task_group, client, send_stream)
+            else:
+                for url in self._get_common_feed_urls():
+                    task_group.start_soon(self._async_probe_feed, url, task_group, client, send_stream.clone())
+
+            await self.async_download(client=client)
+            await self.async_parse()
+            if self.doc is None:
+                return
+            await self.async_set_categories()
+            if self.config.lean_source:
+                # the homepage's tree is only needed for the category urls
+                self.html = ''
+                self.doc = None
+            for category in self.categories:
+                task_group.start_soon(self._async_build_category, category, task_group, client, send_stream.clone())
+
+    async def _async_parse_page(self, page: Category):
+        """Downloaded html -> lxml root, off the event loop
+        """
+        if page.html:
+            page.doc = await Executor.run_as_async(self.config.get_parser().fromstring, page.html)
+        return page.doc is not None
+
+    async def _async_probe_feed(self, url, task_group, client, send_stream):
+        """A common feed location (/feed, /rss, ..) is either a feed
+        itself or a page that links to feeds, like a category
+        """
+        async with send_stream:
+            req = await network.async_request(url, self.config, client)
+            if req.resp is None or req.resp.status_code >= 300:
+                return
+            content_type = req.resp.headers.get('content-type', '').split(';')[0].strip().lower()
+            if content_type in PROBE_CONTENT_TYPES:
+                self._add_feed(url, task_group, client, send_stream, response=req.resp)
+                return
+            probe = Category(url=url)
+            probe.html = await network.async_get_html(req.resp.url, self.config, response=req.resp)
+            if await self._async_parse_page(probe):
+                self._follow_feeds(probe, task_group, client, send_stream)
+
+    async def _async_build_category(self, category, task_group, client, send_stream):
+        async with send_stream:
+            req = await network.async_request(category.url, self.config, client)
+            if req.resp is None:
+                log.warning(('Deleting category %s from source %s due to '
+                             'download error') % (category.url, self.url))
+                return
+            category.html = await network.async_get_html(req.url, self.config, response=req.resp)
+            self._remember_page(category, req.resp, category.html)
+            if not await self._async_parse_page(category):
+                return
+            self._follow_feeds(category, task_group, client, send_stream)
+            articles = await Executor.run_as_async(self._category_to_articles, category)
+            self._release_page(category)
+            await send_stream.send(articles)
+
+    async def _async_build_feed(self, feed, client, send_stream, response = None):
+        async with send_stream:
+            if response is None:
+                response = (await network.async_request(feed.url, self.config, client)).resp
+            if response is None:
+                log.warning(('Deleting feed %s from source %s due to '
+                             'download error') % (feed.url, self.url))
+                return
+            feed.rss = await network.async_get_html(feed.url, self.config, response=response)
+            if not feed.rss:
+                return
+            self._remember_page(feed, response, feed.rss)
+            articles = await Executor.run_as_async(self._feed_to_articles, feed)
+            self._release_page(feed)
+            await send_stream.send(articles)
+
+    def get_feed_urls(self, pages):
+        """Feed urls linked from the <head> of `pages`. newspaper's
+        extractor.get_feed_urls compares against an escaped regex without
+        use_regex, so it never matches anything.
         """
+        parser = self.config.get_parser()
+        feed_urls = []
+        for page in pages:
+            for feed_type in FEED_CONTENT_TYPES:
+                feed_elements = parser.getElementsByTag(page.doc, tag='link', attr='type', value=feed_type)
+                feed_urls.extend(e.get('href') for e in feed_elements if e.get('href'))
+        feed_urls = [urls.prepare_url(f, self.url) for f in feed_urls]
+        return list(dict.fromkeys(feed_urls))[:NUM_FEEDS_PER_SOURCE_LIMIT]
+
+    def _add_feed(self, url, task_group, client, send_stream, response = None):
+        """Starts downloading (unless `response` is already there) and
+        parsing the feed at `url`, if it wasn't seen yet
+        """
+        if url in self._feed_urls or len(self._feed_urls) >= NUM_FEEDS_PER_SOURCE_LIMIT:
+            return None
+        self._feed_urls.add(url)
+        feed = Feed(url=url)
+        self.feeds.append(feed)
+        task_group.start_soon(self._async_build_feed, feed, client, send_stream.clone(), response)
+        return feed
+
+    def _follow_feeds(self, page, task_group, client, send_stream):
+        for url in self.get_feed_urls([page]):
+            self._add_feed(url, task_group, client, send_stream)
+
+    @utils.cache_disk(seconds=CATEGORY_CACHE_SECONDS, cache_folder=ANCHOR_DIRECTORY)
+    def _get_category_urls(self, domain):
+        """The domain param is **necessary**, see utils.cache_disk for
+        reasons. Replaces newspaper's version, whose cache leaks file
+        handles and never evicts.
+        """
+        return self.extractor.get_category_urls(self.url, self.doc)
+
+    @utils.cache_disk(seconds=CATEGORY_CACHE_SECONDS, cache_folder=ANCHOR_DIRECTORY)
+    async def _async_get_category_urls(self, domain):
+        """_get_category_urls, with the cache read and written off the
+        event loop
+        """
+        return await Executor.run_as_async(self.extractor.get_category_urls, self.url, self.doc)
+
+    async def async_set_categories(self):
+        urls = await self._async_get_category_urls(self.domain)
+        self.categories = [Category(url=url) for url in urls]
+
+    def _get_common_feed_urls(self):
         common_feed_urls = ['/feed', '/feeds', '/rss']
         common_feed_urls = [urljoin(self.url, url) for url in common_feed_urls]
 
@@ -81,7 +643,13 @@ class AsyncSource(Source):
                 new_path = '/feed/' + split.path.split('/')[1]
                 new_parts = split.scheme, split.netloc, new_path, '', ''
                 common_feed_urls.append(urlunsplit(new_parts))
+        return common_feed_urls
 
+    async def async_set_feeds(self):
+        """Don't need to cache getting feed urls, it's almost
+        instant with xpath
+        """
+        common_feed_urls = self._get_common_feed_urls()
         common_feed_urls_as_categories = [Category(url=url) for url in common_feed_urls]
 
         category_urls = [c.url for c in common_feed_urls_as_categories]
@@ -100,13 +668,13 @@ class AsyncSource(Source):
                                           c.doc is not None]
 
         categories_and_common_feed_urls = self.categories + common_feed_urls_as_categories
-        urls = self.extractor.get_feed_urls(self.url, categories_and_common_feed_urls)
+        urls = self.get_feed_urls(categories_and_common_feed_urls)
         self.feeds = [Feed(url=url) for url in urls]
 
-    async def async_download(self):
+    async def async_download(self, client = None):
         """Downloads html of source
         """
-        self.html = await network.async_get_html(self.url, self.config)
+        self.html = await network.async_get_html(self.url, self.config, client=client)
     
 
     async def async_download_categories(self):
@@ -151,33 +719,77 @@ class AsyncSource(Source):
         return await Executor.run_as_async(self.parse)
 
 
+    def _feed_to_url_titles(self, feed):
+        """(url, title) of every fresh entry of the feed, streamed out of
+        feeds.FeedParser. Falls back to regex matching the raw text for
+        feeds that aren't parseable xml
+        """
+        max_age = self.config.max_feed_entry_age
+        now = datetime.datetime.now(datetime.timezone.utc)
+        url_titles = []
+        parsed_entries = 0
+        for entry in feeds.iter_feed_entries(feed.rss):
+            parsed_entries += 1
+            if entry.url and not entry.is_older_than(max_age, now):
+                url_titles.append((entry.url, entry.title))
+        if parsed_entries == 0:
+            url_titles = [(url, '') for url in self.extractor.get_urls(feed.rss, regex=True)]
+        elif len(url_titles) < parsed_entries:
+            log.debug('%d of %d entries skipped for %s' %
+                      (parsed_entries - len(url_titles), parsed_entries, feed.url))
+        return url_titles
+
+    def _url_titles_to_articles(self, url_titles, source_url, links: set = None):
+        """Articles for the valid, not yet memoized links of a category or
+        feed. Urls are prepared, validated (purge_articles('url'), through
+        the domain's UrlClassifier) and memoized first, so articles are
+        only built for the new ones. A page sent in batches (a sitemap)
+        collects its links in `links`, its state is left to the caller
+        """
+        before_purge = len(url_titles)
+        url_titles = [(urls.prepare_url(url, source_url), title) for url, title in url_titles]
+        is_article = self.url_classifier.is_article
+        url_titles = [(url, title) for url, title in url_titles if is_article(url)]
+        after_purge = len(url_titles)
+
+        # links the page already had on its last fetch aren't new
+        state = self.page_states.get(source_url)
+        if links is not None:
+            links.update(url for url, _ in url_titles)
+            if state is not None:
+                url_titles = [(url, title) for url, title in url_titles if url not in state.links]
+        elif state is not None:
+            previous, state.links = state.links, frozenset(url for url, _ in url_titles)
+            url_titles = [(url, title) for url, title in url_titles if url not in previous]
+
+        if self.config.memoize_articles:
+            titles = dict(url_titles)
+            url_titles = [(url, titles[url]) for url in utils.memoize_urls(self, titles)]
+        after_memo = len(url_titles)
+
+        log.debug('%d->%d->%d for %s' %
+                  (before_purge, after_purge, after_memo, source_url))
+        return [AsyncArticle(url=url, source_url=source_url, title=title, config=self.config)
+                for url, title in url_titles]
+
+    def _feed_to_articles(self, feed):
+        """Returns articles given the url of a feed
+        """
+        return self._url_titles_to_articles(self._feed_to_url_titles(feed), feed.url)
+
+    def _category_to_articles(self, category):
+        """Returns the articles linked from a parsed category
+        """
+        url_title_tups = self.extractor.get_urls(category.doc, titles=True)
+        return self._url_titles_to_articles(url_title_tups, category.url)
+
     async def async_feeds_to_articles(self):
         """Returns articles given the url of a feed
         """
         articles = []
         for feed in self.feeds:
-            urls = self.extractor.get_urls(feed.rss, regex=True)
-            cur_articles = []
-            before_purge = len(urls)
-
-            for url in urls:
-                article = AsyncArticle(
-                    url=url,
-                    source_url=feed.url,
-                    config=self.config)
-                cur_articles.append(article)
-
-            cur_articles = self.purge_articles('url', cur_articles)
-            after_purge = len(cur_articles)
-
-            if self.config.memoize_articles:
-                cur_articles = utils.memoize_articles(self, cur_articles)
-            after_memo = len(cur_articles)
-
-            articles.extend(cur_articles)
-
-            log.debug('%d->%d->%d for %s' %
-                      (before_purge, after_purge, after_memo, feed.url))
+            articles.extend(self._feed_to_articles(feed))
+            self._release_page(feed)
         return articles
 
     async def async_categories_to_articles(self):
@@ -186,33 +798,8 @@ class AsyncSource(Source):
         """
         articles = []
         for category in self.categories:
-            cur_articles = []
-            url_title_tups = self.extractor.get_urls(category.doc, titles=True)
-            before_purge = len(url_title_tups)
-
-            for tup in url_title_tups:
-                indiv_url = tup[0]
-                indiv_title = tup[1]
-
-                _article = AsyncArticle(
-                    url=indiv_url,
-                    source_url=category.url,
-                    title=indiv_title,
-                    config=self.config
-                )
-                cur_articles.append(_article)
-
-            cur_articles = self.purge_articles('url', cur_articles)
-            after_purge = len(cur_articles)
-
-            if self.config.memoize_articles:
-                cur_articles = utils.memoize_articles(self, cur_articles)
-            after_memo = len(cur_articles)
-
-            articles.extend(cur_articles)
-
-            log.debug('%d->%d->%d for %s' %
-                      (before_purge, after_purge, after_memo, category.url))
+            articles.extend(self._category_to_articles(category))
+            self._release_page(category)
         return articles
 
     async def _async_generate_articles(self):
@@ -266,11 +853,58 @@ class AsyncSource(Source):
             log.warning('The following article urls failed the download: %s' %
                         ', '.join([a.url for a in failed_articles]))
 
-    async def async_parse_articles(self):
-        """Parse all articles, delete if too small
+    async def async_parse_articles(self, limit: int = None, backend: str = None,
+                                   progress: Callable[[int, int], Any] = None):
+        """Parse all articles, delete if too small. Up to `limit` articles
+        (config.number_parse_workers, one per cpu by default) are parsed at
+        once on the `backend` of config.parse_backend. Articles whose parse
+        fails, runs over config.article_deadline or whose body is too
+        small are purged as soon as they are
+        done, `progress(parsed, total)` is called after every article
         """
-        for index, article in enumerate(self.articles):
-            await article.async_parse()
-
-        self.articles = self.purge_articles('body', self.articles)
+        limit = limit or self.config.number_parse_workers or os.cpu_count() or 1
+        backend = backend or self.config.parse_backend
+        articles = self.articles
+        keep = [False] * len(articles)
+        limiter = anyio.CapacityLimiter(limit)
+        parsed = 0
+
+        async def parse(index, article):
+            nonlocal parsed
+            async with limiter:
+                with anyio.move_on_after(self.config.article_deadline) as scope:
+                    try:
+                        await article.async_parse(backend=backend)
+                        keep[index] = article.is_parsed and article.is_valid_body()
+                    except Exception as e:
+                        log.debug('Parsing %s failed: %s' % (article.url, e))
+                if scope.cancelled_caught:
+                    log.debug('Parsing %s ran over the deadline' % article.url)
+            if not keep[index]:
+                self._release_article(article)
+            parsed += 1
+            if progress is not None:
+                progress(parsed, len(articles))
+
+        async with anyio.create_task_group() as task_group:
+            for index, article in enumerate(articles):
+                task_group.start_soon(parse, index, article)
+
+        # teach the classifier which prefixes never have an article body
+        classifier = self.url_classifier
+        for article, kept in zip(articles, keep):
+            if article.is_parsed:
+                classifier.record(article.url, kept)
+        await classifier.async_save(DiskCache.open(ANCHOR_DIRECTORY))
+
+        self.articles = [a for a, kept in zip(articles, keep) if kept]
         self.is_parsed = True
+
+    @staticmethod
+    def _release_article(article):
+        """Frees the html and trees of a purged article right away,
+        instead of once the whole source is parsed
+        """
+        article.html = ''
+        article.doc = article.clean_doc = None
+        article.top_node = article.clean_top_node = None
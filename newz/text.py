@@ -1,12 +1,19 @@
 
-import os
+import functools
+import itertools
 import re
 import string
+import threading
 
-from .utils.helpers import FileHelper
+from collections.abc import Sequence
+
+from .utils.resources import ResourceRegistry
 
 TABSSPACE = re.compile(r'[\s\t]+')
 
+# max number of (word -> stem) pairs memoized for Arabic / Persian
+STEM_CACHE_SIZE = 100000
+
 
 def innerTrim(value):
     if isinstance(value, str):
@@ -48,46 +55,145 @@ class WordStats(object):
         self.word_count = cnt
 
 
+class Segmenters(object):
+    """Segmenters and stemmers are expensive to build, so keep one
+    instance per worker thread (and so per process) instead of building
+    one on every call
+    """
+    _local = threading.local()
+
+    @classmethod
+    def _get_instance(cls, name, factory):
+        instance = getattr(cls._local, name, None)
+        if instance is None:
+            instance = factory()
+            setattr(cls._local, name, instance)
+        return instance
+
+    @classmethod
+    def tinysegmenter(cls):
+        import tinysegmenter
+        return cls._get_instance('tinysegmenter', tinysegmenter.TinySegmenter)
+
+    @classmethod
+    def isri_stemmer(cls):
+        from nltk.stem.isri import ISRIStemmer
+        return cls._get_instance('isri_stemmer', ISRIStemmer)
+
+
+@functools.lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem_arabic(word):
+    return Segmenters.isri_stemmer().stem(word)
+
+
+class SuffixTrie(object):
+    """Trie over the reversed stopwords, so the number of stopwords a
+    word ends with is found in one walk over the word instead of an
+    endswith() per stopword
+    """
+    END = ''
+
+    def __init__(self, words):
+        self.root = {}
+        for word in words:
+            node = self.root
+            for char in reversed(word):
+                node = node.setdefault(char, {})
+            node[self.END] = node.get(self.END, 0) + 1
+
+    def count_suffixes(self, word):
+        node = self.root
+        count = node.get(self.END, 0)
+        for char in reversed(word):
+            node = node.get(char)
+            if node is None:
+                break
+            count += node.get(self.END, 0)
+        return count
+
+
+class RepeatedWords(Sequence):
+    """list(words) * times, without building it: the items are only
+    made when read, the length is known upfront
+    """
+    def __init__(self, words, times):
+        self.words = words
+        self.times = times
+
+    def __len__(self):
+        return len(self.words) * self.times
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('RepeatedWords index out of range')
+        return self.words[index % len(self.words)]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(itertools.repeat(self.words, self.times))
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, RepeatedWords)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return 'RepeatedWords(%r, %d)' % (self.words, self.times)
+
+
 class StopWords(object):
 
-    TRANS_TABLE = str.maketrans('', '')
-    _cached_stop_words = {}
+    TRANS_TABLE = str.maketrans('', '', string.punctuation)
+    # segmenters see lowercased input unless a subclass opts out
+    lowercase = True
 
     def __init__(self, language='en'):
-        if language not in self._cached_stop_words:
-            path = os.path.join('text', 'stopwords-%s.txt' % language)
-            self._cached_stop_words[language] = \
-                set(FileHelper.loadResourceFile(path).splitlines())
-        self.STOP_WORDS = self._cached_stop_words[language]
+        self.language = language
+        self.STOP_WORDS = ResourceRegistry.get_stopwords(language)
 
     def remove_punctuation(self, content):
         # code taken form
         # http://stackoverflow.com/questions/265960/best-way-to-strip-punctuation-from-a-string-in-python
-        content_is_unicode = isinstance(content, str)
-        if content_is_unicode:
-            content = content.encode('utf-8')
-        trans_table = {ord(c): None for c in string.punctuation}
-        stripped_input = content.decode('utf-8').translate(trans_table)
-
-        return stripped_input
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        return content.translate(self.TRANS_TABLE)
 
     def candidate_words(self, stripped_input):
         return stripped_input.split(' ')
 
+    def get_overlapping_stopwords(self, candidate_words):
+        stop_words = self.STOP_WORDS
+        return [w for w in candidate_words if w in stop_words]
+
     def get_stopword_count(self, content):
         if not content:
             return WordStats()
-        ws = WordStats()
         stripped_input = self.remove_punctuation(content)
-        candidate_words = self.candidate_words(stripped_input.lower())
-        overlapping_stopwords = []
-        c = 0
-        for w in candidate_words:
-            c += 1
-            if w in self.STOP_WORDS:
-                overlapping_stopwords.append(w)
-
-        ws.set_word_count(c)
+        if self.lowercase:
+            stripped_input = stripped_input.lower()
+        candidate_words = list(self.candidate_words(stripped_input))
+        return self.get_word_stats(candidate_words)
+
+    def warmup(self):
+        """Builds whatever the segmentation of this language needs ahead
+        of the first count, see api.warmup
+        """
+        pass
+
+    def get_stopword_counts(self, contents):
+        """Counts many node texts in one call, results are in the order
+        of `contents`
+        """
+        get_stopword_count = self.get_stopword_count
+        return [get_stopword_count(content) for content in contents]
+
+    def get_word_stats(self, candidate_words):
+        ws = WordStats()
+        overlapping_stopwords = self.get_overlapping_stopwords(candidate_words)
+        ws.set_word_count(len(candidate_words))
         ws.set_stopword_count(len(overlapping_stopwords))
         ws.set_stop_words(overlapping_stopwords)
         return ws
@@ -99,6 +205,10 @@ class StopWordsChinese(StopWords):
     def __init__(self, language='zh'):
         super(StopWordsChinese, self).__init__(language='zh')
 
+    def warmup(self):
+        import jieba
+        jieba.initialize()
+
     def candidate_words(self, stripped_input):
         # jieba builds a tree that takes a while. avoid building
         # this tree if we don't use the chinese language
@@ -116,64 +226,50 @@ class StopWordsArabic(StopWords):
     def remove_punctuation(self, content):
         return content
 
+    def warmup(self):
+        Segmenters.isri_stemmer()
+
     def candidate_words(self, stripped_input):
-        import nltk
-        s = nltk.stem.isri.ISRIStemmer()
-        words = []
-        for word in nltk.tokenize.wordpunct_tokenize(stripped_input):
-            words.append(s.stem(word))
-        return words
+        from nltk.tokenize import wordpunct_tokenize
+        return [stem_arabic(word) for word in wordpunct_tokenize(stripped_input)]
 
 
 class StopWordsKorean(StopWords):
     """Korean segmentation
     """
+    lowercase = False
+    _suffix_tries = {}
+
     def __init__(self, language='ko'):
         super(StopWordsKorean, self).__init__(language='ko')
+        if self.language not in self._suffix_tries:
+            self._suffix_tries[self.language] = SuffixTrie(self.STOP_WORDS)
+        self.suffix_trie = self._suffix_tries[self.language]
 
-    def get_stopword_count(self, content):
-        if not content:
-            return WordStats()
-        ws = WordStats()
-        stripped_input = self.remove_punctuation(content)
-        candidate_words = self.candidate_words(stripped_input)
+    def get_overlapping_stopwords(self, candidate_words):
+        # a word counts once for every stopword it ends with
+        count_suffixes = self.suffix_trie.count_suffixes
         overlapping_stopwords = []
-        c = 0
         for w in candidate_words:
-            c += 1
-            for s in self.STOP_WORDS:
-                if w.endswith(s):
-                    overlapping_stopwords.append(w)
-
-        ws.set_word_count(c)
-        ws.set_stopword_count(len(overlapping_stopwords))
-        ws.set_stop_words(overlapping_stopwords)
-        return ws
+            matches = count_suffixes(w)
+            if matches:
+                overlapping_stopwords.extend([w] * matches)
+        return overlapping_stopwords
 
 
 class StopWordsHindi(StopWords):
     """Hindi segmentation
     """
+    lowercase = False
+
     def __init__(self, language='hi'):
         super(StopWordsHindi, self).__init__(language='hi')
+        self.stop_words_list = list(self.STOP_WORDS)
 
-    def get_stopword_count(self, content):
-        if not content:
-            return WordStats()
-        ws = WordStats()
-        stripped_input = self.remove_punctuation(content)
-        candidate_words = self.candidate_words(stripped_input)
-        overlapping_stopwords = []
-        c = 0
-        for w in candidate_words:
-            c += 1
-            for stop_word in self.STOP_WORDS:
-                overlapping_stopwords.append(stop_word)
-
-        ws.set_word_count(c)
-        ws.set_stopword_count(len(overlapping_stopwords))
-        ws.set_stop_words(overlapping_stopwords)
-        return ws
+    def get_overlapping_stopwords(self, candidate_words):
+        # every stopword is counted once per candidate word, only the
+        # count is used so the list isn't built
+        return RepeatedWords(self.stop_words_list, len(candidate_words))
 
 
 class StopWordsJapanese(StopWords):
@@ -182,11 +278,11 @@ class StopWordsJapanese(StopWords):
     def __init__(self, language='ja'):
         super(StopWordsJapanese, self).__init__(language='ja')
 
+    def warmup(self):
+        Segmenters.tinysegmenter()
+
     def candidate_words(self, stripped_input):
-        import tinysegmenter
-        segmenter = tinysegmenter.TinySegmenter()
-        tokens = segmenter.tokenize(stripped_input)
-        return tokens
+        return Segmenters.tinysegmenter().tokenize(stripped_input)
 
 
 class StopWordsThai(StopWords):
@@ -195,6 +291,10 @@ class StopWordsThai(StopWords):
     def __init__(self, language='th'):
         super(StopWordsThai, self).__init__(language='th')
 
+    def warmup(self):
+        # the default engine loads its dictionary trie on first use
+        self.candidate_words('ทดสอบ')
+
     def candidate_words(self, stripped_input):
         import pythainlp
         tokens = pythainlp.word_tokenize(stripped_input)
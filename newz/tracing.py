@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Per-article traces of AsyncNewsPool crawls: a timeline of spans for each
+article, one json line per article in a file, for the one article out of
+thousands that took 40s.
+
+- queued: waiting for a slot of its source's job
+- fetch, redirect (a hop of the response's redirects, or a meta refresh)
+  and decode (the body to text)
+- parse, with parse.guard (article.guard_html) and a parse.<method> span
+  for every call of the extractor, e.g. parse.calculate_best_node
+- nlp
+
+Articles slower than `slow_seconds` (not counting the time queued), or
+that grew the traced memory by more than `memory_threshold` bytes, are
+captured to `capture_directory`: their html, and the cProfile stats and
+tracemalloc allocations of parsing it (and the nlp, if it ran) again in
+isolation. Which article will be slow isn't known while it runs, and
+profiling every one of them would cost more than the crawl. Replaying the
+captured html gives the same parse. Replays run one at a time on a thread
+of the recorder, the crawl doesn't wait for them, close() does. The trace
+lines are written in batches on another thread, the last ones by close().
+
+Memory is only tracked with a `memory_threshold`, the recorder then runs
+tracemalloc (which slows python down noticeably). The memory of an article
+is what its parse and nlp spans left allocated, other threads allocating
+at the same time count too, so it's a hint to capture, the replay has the
+exact numbers.
+
+Articles crawled in worker processes (AsyncNewsPool with `processes`)
+aren't traced.
+"""
+
+import contextlib
+import cProfile
+import hashlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+from typing import List, Optional
+
+from .utils.executor import Stage
+from .utils import logger as log
+
+# frames tracemalloc keeps of each allocation, when the recorder starts
+# it. Captures group allocations by line, which only needs the innermost
+TRACEMALLOC_FRAMES = 1
+# allocation sites written to the .memory.txt of a capture
+TOP_ALLOCATIONS = 25
+# trace lines buffered before they're written, off the event loop
+WRITE_BATCH_SIZE = 100
+
+
+class ArticleTrace(object):
+    __slots__ = ('url', 'started_at', 'started', 'finished', 'spans', 'memory')
+
+    def __init__(self, url: str):
+        self.url = url
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.finished = None
+        # (name, start, end, info), start and end as perf_counter
+        self.spans: List[tuple] = []
+        self.memory = 0
+
+    def add(self, name: str, start: float, end: float, **info):
+        self.spans.append((name, start, end, info))
+
+    @contextlib.contextmanager
+    def span(self, name: str, **info):
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.spans.append((name, start, time.perf_counter(), info))
+            if memory is not None and not name.startswith('parse.'):
+                self.memory += max(0, tracemalloc.get_traced_memory()[0] - memory)
+
+    def add_redirects(self, response, start: float):
+        """A redirect span for each hop of an httpx `response` fetched
+        from `start` on. Hops whose response wasn't closed through its
+        stream (e.g. of a mock transport) have no time, their span is empty
+        """
+        for hop in response.history:
+            try:
+                end = start + hop.elapsed.total_seconds()
+            except RuntimeError:
+                end = start
+            self.add('redirect', start, end, url=str(hop.url), status=hop.status_code)
+            start = end
+
+    def stop(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def active_duration(self) -> float:
+        """duration, without the time queued
+        """
+        return self.duration - sum(end - start for name, start, end, _ in self.spans if name == 'queued')
+
+    def to_dict(self) -> dict:
+        return {
+            'url': self.url,
+            'started': self.started_at,
+            'duration': self.duration,
+            'memory': self.memory if tracemalloc.is_tracing() else None,
+            'spans': [dict(info, name=name, start=start - self.started, duration=end - start)
+                      for name, start, end, info in sorted(self.spans, key=lambda s: s[1])],
+        }
+
+
+def span(trace: Optional[ArticleTrace], name: str, **info):
+    """trace.span, or a no-op for an article that isn't traced
+    """
+    if trace is None:
+        return contextlib.nullcontext(info)
+    return trace.span(name, **info)
+
+
+class TimedExtractor(object):
+    """Stands in for the extractor of a traced article while it parses,
+    every call of the extractor is a parse.<method> span
+    """
+    def __init__(self, extractor, trace: ArticleTrace):
+        self.extractor = extractor
+        self.trace = trace
+
+    def __getattr__(self, name):
+        value = getattr(self.extractor, name)
+        if not callable(value):
+            return value
+
+        def timed(*args, **kwargs):
+            with self.trace.span('parse.' + name):
+                return value(*args, **kwargs)
+        return timed
+
+
+class TraceRecorder(object):
+    """
+    >>> recorder = TraceRecorder('/data/traces.jsonl', slow_seconds=10, capture_directory='/data/slow')
+    >>> async with AsyncNewsPool(recorder=recorder) as pool:
+    ...     await pool.async_set(sources, parse=True)
+    ...     await pool.async_join()
+    >>> recorder.close()
+
+    or for an article of your own, start(article) before its download and
+    finish(article) once it's done
+    """
+    def __init__(self, path: str, slow_seconds: float = None, memory_threshold: int = None,
+                 capture_directory: str = None, max_captures: int = 100):
+        self.path = path
+        self.slow_seconds = slow_seconds
+        self.memory_threshold = memory_threshold
+        self.capture_directory = capture_directory or os.path.join(os.path.dirname(os.path.abspath(path)),
+                                                                   'captures')
+        self.max_captures = max_captures
+        self.captures = 0
+        self.lock = threading.Lock()
+        # one replay at a time, they share tracemalloc
+        self.stage = Stage('capture', 1)
+        # one thread, so the batches are written in order
+        self.writer = Stage('trace_writer', 1)
+        self.lines: List[str] = []
+        self.file = None
+        # whether tracemalloc was started here, and so is stopped by close
+        self.started_tracemalloc = False
+        if memory_threshold is not None and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+
+    def start(self, article) -> ArticleTrace:
+        article.trace = ArticleTrace(article.url)
+        return article.trace
+
+    def is_outlier(self, trace: ArticleTrace) -> bool:
+        return ((self.slow_seconds is not None and trace.active_duration > self.slow_seconds)
+                or (self.memory_threshold is not None and trace.memory > self.memory_threshold))
+
+    def finish(self, article) -> dict:
+        """Writes the trace of `article`, detaches it, and if it's an
+        outlier queues its capture. Returns the written item
+        """
+        trace, article.trace = article.trace, None
+        if trace is None:
+            return None
+        trace.stop()
+        item = trace.to_dict()
+        item['source_url'] = article.source_url
+        item['html_length'] = len(article.html or '')
+        if self.is_outlier(trace) and article.html:
+            with self.lock:
+                capture = self.captures < self.max_captures
+                self.captures += capture
+            if capture:
+                item['capture'] = self.capture_paths(article.url)
+                future = self.stage.get_executor().submit(self.capture, article, trace, article.html)
+                future.add_done_callback(self._log_failed_capture)
+        with self.lock:
+            self.lines.append(json.dumps(item, default=str, ensure_ascii=False) + '\n')
+            if len(self.lines) >= WRITE_BATCH_SIZE:
+                self._submit_lines()
+        return item
+
+    def _submit_lines(self):
+        """Hands the buffered lines to the writer, under the lock
+        """
+        lines, self.lines = self.lines, []
+        future = self.writer.get_executor().submit(self._write, lines)
+        future.add_done_callback(self._log_failed_write)
+
+    def _write(self, lines: List[str]):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.writelines(lines)
+        self.file.flush()
+
+    @staticmethod
+    def _log_failed_write(future):
+        if future.exception() is not None:
+            log.warning('Writing traces failed: %r' % future.exception())
+
+    def capture_paths(self, url: str) -> dict:
+        base = os.path.join(self.capture_directory, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16])
+        return {'html': base + '.html', 'profile': base + '.prof', 'memory': base + '.memory.txt'}
+
+    @staticmethod
+    def _log_failed_capture(future):
+        if future.exception() is not None:
+            log.warning('Capture failed: %r' % future.exception())
+
+    def capture(self, article, trace: ArticleTrace, html: str = None) -> dict:
+        """Saves `html` (the article's by default) and profiles parsing it
+        again (and the nlp, if it was part of the trace) with cProfile and
+        tracemalloc. Returns the paths of the files and the peak memory
+        """
+        html = html or article.html
+        os.makedirs(self.capture_directory, exist_ok=True)
+        paths = self.capture_paths(article.url)
+        with open(paths['html'], 'w', encoding='utf-8') as f:
+            f.write(html)
+
+        replay = type(article)(article.url, title=article.title, source_url=article.source_url,
+                               config=article.config)
+        with_nlp = any(name == 'nlp' for name, _, _, _ in trace.spans)
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(self._replay, replay, html, with_nlp)
+        except Exception as e:
+            log.debug('Replaying %s failed: %s' % (article.url, e))
+        peak = tracemalloc.get_traced_memory()[1] - start
+        statistics = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+        if not tracing:
+            tracemalloc.stop()
+        profiler.dump_stats(paths['profile'])
+        with open(paths['memory'], 'w', encoding='utf-8') as f:
+            f.write('%s\npeak %d bytes over the replay\n\n' % (article.url, peak))
+            for statistic in statistics[:TOP_ALLOCATIONS]:
+                f.write('%s\n' % statistic)
+        log.info('Captured %s (%.2fs) to %s' % (article.url, trace.active_duration, paths['html']))
+        return dict(paths, peak_memory=peak)
+
+    @staticmethod
+    def _replay(article, html: str, with_nlp: bool):
+        from . import nlp
+
+        article.set_html(html)
+        article.parse()
+        if with_nlp:
+            nlp.analyze(article.title, article.text, article.num_keywords, article.config.MAX_SUMMARY_SENT,
+                        article.config.get_language())
+
+    def close(self):
+        """Waits for the queued captures, writes the buffered traces and
+        closes the file
+        """
+        self.stage.shutdown()
+        with self.lock:
+            if self.lines:
+                self._submit_lines()
+        self.writer.shutdown()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
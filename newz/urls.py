@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Batch article-url classification. `is_article_url` makes the same decision
+as newspaper's urls.valid_url, with the rules compiled once, the
+tldextract lookup cached per host and the decisions cached per url.
+
+On top of that, `UrlClassifier` learns per domain which path prefixes
+never lead to an article (e.g. /video/ pages that are dated like stories
+but never have a body) from the parse results, and rejects those urls up
+front.
+"""
+
+import functools
+import re
+import threading
+
+from typing import Dict, Iterable, List
+from urllib.parse import urlparse
+
+from newspaper import urls as newspaper_urls
+
+from .utils import logger as log
+
+# url decisions and hosts kept by the lru caches
+URL_CACHE_SIZE = 100000
+HOST_CACHE_SIZE = 10000
+
+# a path prefix is learned as non-article once this many of its urls were
+# parsed without a single valid body
+LEARN_MIN_SAMPLES = 20
+# seconds learned prefixes are kept, see UrlClassifier.async_save
+LEARNED_PREFIXES_TTL = 86400 * 7
+
+DATE_PATTERN = re.compile(newspaper_urls.DATE_REGEX)
+ALLOWED_TYPES = frozenset(newspaper_urls.ALLOWED_TYPES)
+GOOD_PATHS = frozenset(p.lower() for p in newspaper_urls.GOOD_PATHS)
+BAD_CHUNKS = frozenset(newspaper_urls.BAD_CHUNKS)
+BAD_DOMAINS = frozenset(newspaper_urls.BAD_DOMAINS)
+
+
+@functools.lru_cache(maxsize=HOST_CACHE_SIZE)
+def _split_host(netloc: str):
+    """(subdomain, lowercased domain) of a host
+    """
+    tld_dat = newspaper_urls.tldextract.extract(netloc)
+    return tld_dat.subdomain, tld_dat.domain.lower()
+
+
+def _file_type(last_chunk: List[str]):
+    """newspaper's url_to_filetype on an already split last path chunk
+    """
+    if len(last_chunk) < 2:
+        return None
+    file_type = last_chunk[-1]
+    if len(file_type) <= 5 or file_type.lower() in ALLOWED_TYPES:
+        return file_type.lower()
+    return None
+
+
+def _slug_has_domain(url_slug: str, separator: str, domain: str) -> bool:
+    return domain in (x.lower() for x in url_slug.split(separator))
+
+
+@functools.lru_cache(maxsize=URL_CACHE_SIZE)
+def is_article_url(url: str) -> bool:
+    """Is this URL a valid news-article url? Same rules, in the same
+    order, as newspaper.urls.valid_url, see there for the reasoning
+    """
+    # 11 chars is shortest valid url length, eg: http://x.co
+    if url is None or len(url) < 11:
+        return False
+    if 'mailto:' in url or ('http://' not in url and 'https://' not in url):
+        return False
+
+    parsed = urlparse(url)
+    path = parsed.path
+    # input url is not in valid form (scheme, netloc, tld)
+    if not path.startswith('/'):
+        return False
+    if path.endswith('/'):
+        path = path[:-1]
+    path_chunks = [x for x in path.split('/') if x]
+
+    if path_chunks:
+        last_chunk = path_chunks[-1].split('.')
+        file_type = _file_type(last_chunk)
+        if file_type and file_type not in ALLOWED_TYPES:
+            return False
+        if len(last_chunk) > 1:
+            path_chunks[-1] = last_chunk[-2]
+
+    # Index gives us no information
+    if 'index' in path_chunks:
+        path_chunks.remove('index')
+
+    subdomain, domain = _split_host(parsed.netloc)
+    if domain in BAD_DOMAINS:
+        return False
+
+    url_slug = path_chunks[-1] if path_chunks else ''
+    dash_count = url_slug.count('-')
+    underscore_count = url_slug.count('_')
+
+    # If the url has a news slug title
+    if url_slug and (dash_count > 4 or underscore_count > 4):
+        if dash_count >= underscore_count and not _slug_has_domain(url_slug, '-', domain):
+            return True
+        if underscore_count > dash_count and not _slug_has_domain(url_slug, '_', domain):
+            return True
+
+    # There must be at least 2 subpaths
+    if len(path_chunks) <= 1:
+        return False
+
+    # Eg: http://cnn.com/careers.html or careers.cnn.com --> BAD
+    if subdomain in BAD_CHUNKS or not BAD_CHUNKS.isdisjoint(path_chunks):
+        return False
+
+    if DATE_PATTERN.search(url) is not None:
+        return True
+    return not GOOD_PATHS.isdisjoint(p.lower() for p in path_chunks)
+
+
+def path_prefix(url: str) -> str:
+    """'http://cnn.com/video/2022/06/01/x.html' -> '/video/'
+    """
+    path = urlparse(url).path
+    first = path.lstrip('/').split('/', 1)[0]
+    return '/%s/' % first if first and '/' in path.lstrip('/') else ''
+
+
+class UrlClassifier(object):
+    """Article-url decisions for one domain: the rules of is_article_url
+    plus the path prefixes learned to never lead to an article.
+
+    >>> classifier = UrlClassifier.get('cnn.com')
+    >>> classifier.classify_many(urls)         # [True, False, ..]
+    >>> classifier.record(url, is_article)     # after parsing
+    """
+    _classifiers: Dict[str, 'UrlClassifier'] = {}
+    _classifiers_lock = threading.Lock()
+
+    def __init__(self, domain: str, min_samples: int = LEARN_MIN_SAMPLES):
+        self.domain = domain
+        self.min_samples = min_samples
+        # prefix -> [articles, non articles]
+        self.prefix_counts: Dict[str, List[int]] = {}
+        self.non_article_prefixes = set()
+        self.saved_prefixes = frozenset()
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, domain: str) -> 'UrlClassifier':
+        """One classifier per domain per process
+        """
+        with cls._classifiers_lock:
+            if domain not in cls._classifiers:
+                cls._classifiers[domain] = cls(domain)
+            return cls._classifiers[domain]
+
+    def is_article(self, url: str) -> bool:
+        if self.non_article_prefixes and path_prefix(url) in self.non_article_prefixes:
+            return False
+        return is_article_url(url)
+
+    def classify_many(self, urls: Iterable[str]) -> List[bool]:
+        return [self.is_article(url) for url in urls]
+
+    def filter(self, urls: Iterable[str]) -> List[str]:
+        return [url for url in urls if self.is_article(url)]
+
+    def record(self, url: str, is_article: bool):
+        """Feeds back whether a url accepted by the rules turned out to
+        be an article once parsed
+        """
+        prefix = path_prefix(url)
+        if not prefix:
+            return
+        with self._lock:
+            counts = self.prefix_counts.setdefault(prefix, [0, 0])
+            counts[0 if is_article else 1] += 1
+            if not is_article and counts[0] == 0 and counts[1] >= self.min_samples \
+                    and self._has_articles_elsewhere(prefix):
+                if prefix not in self.non_article_prefixes:
+                    log.debug('Learned %s%s as a non-article prefix' % (self.domain, prefix))
+                self.non_article_prefixes.add(prefix)
+            elif is_article:
+                self.non_article_prefixes.discard(prefix)
+
+    def _has_articles_elsewhere(self, prefix: str) -> bool:
+        """A domain whose pages all fail to parse (blocked, broken
+        extraction) teaches nothing about its urls
+        """
+        return any(counts[0] for p, counts in self.prefix_counts.items() if p != prefix)
+
+    def _cache_key(self) -> str:
+        return 'non_article_prefixes:%s' % self.domain
+
+    async def async_load(self, cache):
+        """Restores the prefixes learned by earlier runs from a
+        utils.cache.DiskCache
+        """
+        if self.loaded:
+            return
+        prefixes = await cache.async_get(self._cache_key())
+        with self._lock:
+            self.non_article_prefixes.update(prefixes or ())
+            self.saved_prefixes = frozenset(self.non_article_prefixes)
+            self.loaded = True
+
+    async def async_save(self, cache):
+        """Stores the learned prefixes, if they changed
+        """
+        with self._lock:
+            prefixes = frozenset(self.non_article_prefixes)
+        if prefixes == self.saved_prefixes:
+            return
+        await cache.async_set(self._cache_key(), sorted(prefixes), LEARNED_PREFIXES_TTL)
+        self.saved_prefixes = prefixes
@@ -1,3 +1 @@
 from .logs import default_logger as logger
-
-from . import setup_nltk
\ No newline at end of file
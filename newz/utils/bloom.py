@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped Bloom filter shared by every source and process on a host.
+It sits in front of the exact per-domain seen-stores (utils/memo.py): a
+miss means a url was definitely never recorded, so only hits need an
+exact lookup.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import uuid
+
+from typing import Dict, Iterable, List
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+
+MAGIC = b'NEWZBLM1'
+# magic, num_bits, num_hashes, capacity, count, error_rate, filter_id
+HEADER = struct.Struct('<8sQQQQd16s')
+COUNT_OFFSET = struct.calcsize('<8sQQQ')
+_DIGEST = struct.Struct('<QQ')
+
+
+class BloomFilter(object):
+    _filters: Dict[str, 'BloomFilter'] = {}
+    _filters_lock = threading.Lock()
+
+    def __init__(self, path: str, capacity: int = 10000000, error_rate: float = 0.001):
+        self.path = path
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            self._create(path, capacity, error_rate)
+        self._file = open(path, 'r+b')
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        magic, self.num_bits, self.num_hashes, self.capacity, _, self.error_rate, self.filter_id = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a newz bloom filter' % path)
+
+    @classmethod
+    def get(cls, path: str, capacity: int = 10000000, error_rate: float = 0.001) -> 'BloomFilter':
+        """One mapping per file per process. capacity / error_rate only
+        apply when the file doesn't exist yet
+        """
+        with cls._filters_lock:
+            if path not in cls._filters:
+                cls._filters[path] = cls(path, capacity, error_rate)
+            return cls._filters[path]
+
+    @staticmethod
+    def optimal_size(capacity: int, error_rate: float):
+        """(bits, hash functions) for `capacity` items at `error_rate`
+        """
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return num_bits, num_hashes
+
+    @classmethod
+    def _create(cls, path: str, capacity: int, error_rate: float):
+        """Writes an empty filter to a temp file and links it into place,
+        so concurrent creators end up sharing whichever file won
+        """
+        num_bits, num_hashes = cls.optimal_size(capacity, error_rate)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, num_bits, num_hashes, capacity, 0, error_rate, uuid.uuid4().bytes))
+            # sparse on most filesystems, pages are only allocated once set
+            f.truncate(HEADER.size + (num_bits + 7) // 8)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def _positions(self, item: str) -> List[int]:
+        # Kirsch-Mitzenmacher double hashing over one 128 bit digest
+        h1, h2 = _DIGEST.unpack(hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest())
+        h2 |= 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, item: str) -> bool:
+        return bool(self.contains_many([item]))
+
+    def contains_many(self, items: Iterable[str]) -> List[str]:
+        """The items that may have been added, every other item
+        definitely was not
+        """
+        # inlined _positions: most urls are new and miss on the first
+        # probe or two, so positions are only computed until one misses
+        data, offset = self._mmap, HEADER.size
+        num_bits, num_hashes = self.num_bits, self.num_hashes
+        blake2b, unpack = hashlib.blake2b, _DIGEST.unpack
+        hits = []
+        for item in items:
+            h1, h2 = unpack(blake2b(item.encode('utf-8'), digest_size=16).digest())
+            h2 |= 1
+            for i in range(num_hashes):
+                pos = (h1 + i * h2) % num_bits
+                if not data[offset + (pos >> 3)] >> (pos & 7) & 1:
+                    break
+            else:
+                hits.append(item)
+        return hits
+
+    def add_many(self, items: Iterable[str]) -> List[str]:
+        """Adds `items` and returns those that may have been added
+        before, i.e. contains_many and add in a single pass
+        """
+        data, offset = self._mmap, HEADER.size
+        num_bits, num_hashes = self.num_bits, self.num_hashes
+        blake2b, unpack = hashlib.blake2b, _DIGEST.unpack
+        hits = []
+        with self._lock, self._file_lock():
+            added = 0
+            for item in items:
+                h1, h2 = unpack(blake2b(item.encode('utf-8'), digest_size=16).digest())
+                h2 |= 1
+                present = True
+                for i in range(num_hashes):
+                    pos = (h1 + i * h2) % num_bits
+                    index = offset + (pos >> 3)
+                    byte = data[index]
+                    if not byte >> (pos & 7) & 1:
+                        data[index] = byte | 1 << (pos & 7)
+                        present = False
+                if present:
+                    hits.append(item)
+                else:
+                    added += 1
+            if added:
+                count = struct.unpack_from('<Q', data, COUNT_OFFSET)[0] + added
+                struct.pack_into('<Q', data, COUNT_OFFSET, count)
+        return hits
+
+    def add(self, item: str):
+        self.add_many([item])
+
+    def _file_lock(self):
+        """Bits are set with a read-modify-write of their byte, so writers
+        in other processes have to be kept out too
+        """
+        return _FileLock(self._file)
+
+    @property
+    def count(self) -> int:
+        """Number of items added so far, items the filter already
+        reported as present aren't counted again
+        """
+        return struct.unpack_from('<Q', self._mmap, COUNT_OFFSET)[0]
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.count > self.capacity
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+class _FileLock(object):
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Size bounded on-disk cache behind helpers.cache_disk (category urls, feed
+urls). Several crawler processes can share a directory:
+
+- entries are written to a temp file and renamed into place, readers
+  never see half an entry and need no lock
+- eviction (expired entries first, then least recently used until the
+  directory fits in max_size) runs under an flock on the directory, by
+  one process at a time
+- builtin values are serialized with marshal, anything else with pickle
+"""
+
+import hashlib
+import marshal
+import os
+import pickle
+import struct
+import threading
+import time
+import uuid
+
+from typing import Any, Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+
+MAGIC = b'NZC1'
+# magic, serializer, expires at
+HEADER = struct.Struct('<4scd')
+MARSHAL, PICKLE = b'M', b'P'
+
+SUFFIX = '.nzc'
+LOCK_FILE = '.nzc.lock'
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+# seconds between two eviction passes of a process
+EVICT_INTERVAL = 60
+# seconds before a hit bumps an entry's recency again
+TOUCH_INTERVAL = 60
+# temp files older than this were left behind by a dead writer
+STALE_TMP_AGE = 3600
+
+MISSING = object()
+
+
+def dumps(value: Any) -> Tuple[bytes, bytes]:
+    try:
+        return MARSHAL, marshal.dumps(value)
+    except ValueError:
+        return PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(kind: bytes, data: bytes) -> Any:
+    if kind == MARSHAL:
+        return marshal.loads(data)
+    return pickle.loads(data)
+
+
+class DiskCache(object):
+    _caches: Dict[str, 'DiskCache'] = {}
+    _caches_lock = threading.Lock()
+
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.last_evicted = 0.0
+
+    @classmethod
+    def open(cls, directory: str, max_size: int = DEFAULT_MAX_SIZE) -> 'DiskCache':
+        """One cache object per directory per process
+        """
+        with cls._caches_lock:
+            if directory not in cls._caches:
+                cls._caches[directory] = cls(directory, max_size)
+            return cls._caches[directory]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + SUFFIX)
+
+    def lookup(self, key: str) -> Any:
+        """The cached value, or MISSING (None is a valid value)
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            magic, kind, expires = HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return MISSING
+        now = time.time()
+        if magic != MAGIC or expires < now:
+            self._remove(path)
+            return MISSING
+        try:
+            value = loads(kind, data[HEADER.size:])
+        except Exception:
+            self._remove(path)
+            return MISSING
+        self._touch(path, now)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.lookup(key)
+        return default if value is MISSING else value
+
+    def set(self, key: str, value: Any, ttl: float):
+        kind, data = dumps(value)
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, kind, time.time() + ttl))
+            f.write(data)
+        os.replace(tmp_path, path)
+        if time.time() - self.last_evicted >= EVICT_INTERVAL:
+            self.evict()
+
+    def delete(self, key: str):
+        self._remove(self._path(key))
+
+    async def async_lookup(self, key: str) -> Any:
+        from .executor import Executor
+        return await Executor.run_as_async(self.lookup, key)
+
+    async def async_get(self, key: str, default: Any = None) -> Any:
+        value = await self.async_lookup(key)
+        return default if value is MISSING else value
+
+    async def async_set(self, key: str, value: Any, ttl: float):
+        from .executor import Executor
+        return await Executor.run_as_async(self.set, key, value, ttl)
+
+    def _touch(self, path: str, now: float):
+        """The mtime of an entry is its last use, for LRU eviction
+        """
+        try:
+            if now - os.path.getmtime(path) >= TOUCH_INTERVAL:
+                os.utime(path, (now, now))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self) -> int:
+        """Drops expired entries, then the least recently used ones until
+        the cache fits in max_size. Skipped if another process is already
+        at it. Returns the number of entries removed
+        """
+        self.last_evicted = time.time()
+        with _DirectoryLock(self.directory) as locked:
+            if not locked:
+                return 0
+            return self._evict(self.last_evicted)
+
+    def _evict(self, now: float) -> int:
+        entries = []
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp') and SUFFIX in entry.name:
+                try:
+                    if now - entry.stat().st_mtime > STALE_TMP_AGE:
+                        self._remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            if not entry.name.endswith(SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+                with open(entry.path, 'rb') as f:
+                    magic, _, expires = HEADER.unpack(f.read(HEADER.size))
+            except (OSError, struct.error):
+                continue
+            if magic != MAGIC or expires < now:
+                self._remove(entry.path)
+                removed += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if SUFFIX in entry.name:
+                self._remove(entry.path)
+
+
+class _DirectoryLock(object):
+    """Non-blocking exclusive flock on the cache directory's lock file,
+    entering gives whether the lock was taken
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.f = None
+
+    def __enter__(self) -> bool:
+        if not os.path.isdir(self.directory):
+            return False
+        self.f = open(os.path.join(self.directory, LOCK_FILE), 'a')
+        if fcntl is None:
+            return True
+        try:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.f.close()
+            self.f = None
+            return False
+        return True
+
+    def __exit__(self, *exc):
+        if self.f is not None:
+            if fcntl is not None:
+                fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            self.f.close()
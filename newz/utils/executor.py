@@ -1,32 +1,297 @@
 
 import anyio
 import asyncio
+import atexit
 import functools
+import math
+import multiprocessing
+import os
+import signal
+import threading
+import time
 
 from concurrent import futures
 from anyio._core._eventloop import threadlocals
-from typing import List, Union, Callable, Coroutine, Any
+from typing import Dict, List, Union, Callable, Coroutine, Any
 
 from .helpers import is_coro_func
+from .logs import default_logger as log
+
+# stage -> (Configuration attribute of its size, of its backend), see
+# Executor.configure
+STAGE_SETTINGS = {
+    'io': ('number_threads', None),
+    'parse': ('number_parse_workers', 'parse_backend'),
+    'nlp': ('number_nlp_workers', 'nlp_backend'),
+}
+
+
+# seconds a process worker gets to stop after its deadline before its
+# pool is killed, see Stage.run
+KILL_GRACE = 1.0
+
+
+def _on_deadline(signum, frame):
+    raise TimeoutError('Ran over the deadline of the call')
+
+
+def _timed_call(func: Callable, args, kwargs, timeout: float = None):
+    """Runs in the stage's worker, returns when it started (wall clock,
+    so it means the same in a worker process) and the result. With a
+    `timeout`, in the main thread of a worker process, `func` is
+    interrupted by a TimeoutError once it's over
+    """
+    started = time.time()
+    if timeout is None or threading.current_thread() is not threading.main_thread():
+        return started, func(*args, **kwargs)
+    previous = signal.signal(signal.SIGALRM, _on_deadline)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return started, func(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class Stage(object):
+    """A named pool of `workers` threads or processes (`backend`) for one
+    kind of work, so a slow stage only queues its own calls. Counts its
+    calls, how many wait for a worker and how long they waited
+    """
+    def __init__(self, name: str, workers: int, backend: str = 'thread'):
+        if backend not in ('thread', 'process'):
+            raise ValueError('Unknown backend %r of stage %s' % (backend, name))
+        self.name = name
+        self.workers = workers
+        self.backend = backend
+        self.executor: futures.Executor = None
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.killed = 0
+
+    def get_executor(self) -> futures.Executor:
+        with self.lock:
+            if self.executor is None:
+                if self.backend == 'process':
+                    # spawned, not forked, since the thread pools may be busy
+                    self.executor = futures.ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    Executor._register_exit_hook()
+                else:
+                    self.executor = futures.ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='newz-%s' % self.name)
+            return self.executor
+
+    @property
+    def pending(self) -> int:
+        """Calls submitted and not done, running or waiting
+        """
+        return self.submitted - self.completed - self.failed
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a worker
+        """
+        return max(0, self.pending - self.workers)
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Runs `func` on a worker of the stage, it has to be picklable
+        with the process backend.
+
+        Cancelling the call (e.g. the deadline of an anyio.fail_after
+        around it) only stops waiting for a thread, a thread can't be
+        stopped. A worker process gets the time left until the deadline
+        and is interrupted once it's over. If it doesn't stop within
+        KILL_GRACE seconds the pool's processes are killed, failing the
+        other calls they run too, and the stage starts new ones
+        """
+        executor = self.get_executor()
+        timeout = None
+        if self.backend == 'process' and hasattr(signal, 'setitimer'):
+            deadline = anyio.current_effective_deadline()
+            if deadline != math.inf:
+                timeout = max(deadline - anyio.current_time(), 0.001)
+        with self.lock:
+            self.submitted += 1
+        submitted = time.time()
+        future = executor.submit(_timed_call, func, args, kwargs, timeout)
+        try:
+            started, result = await asyncio.wrap_future(future)
+        except BaseException:
+            with self.lock:
+                self.failed += 1
+            if self.backend == 'process' and not future.done() and not future.cancel():
+                asyncio.get_running_loop().call_later(KILL_GRACE, self._kill, executor, future)
+            raise
+        done = time.time()
+        with self.lock:
+            self.completed += 1
+            wait = max(0.0, started - submitted)
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.run_total += done - started
+        return result
+
+    def _kill(self, executor: futures.ProcessPoolExecutor, future: futures.Future):
+        """Kills the processes of `executor` if the cancelled call is
+        still running
+        """
+        if future.done():
+            return
+        log.warning('A call of stage %s ran past its deadline, killing its worker processes' % self.name)
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+            self.killed += 1
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        with self.lock:
+            completed = max(self.completed, 1)
+            return {
+                'backend': self.backend, 'workers': self.workers,
+                'submitted': self.submitted, 'completed': self.completed, 'failed': self.failed,
+                'pending': self.pending, 'queue_depth': self.queue_depth,
+                'wait_avg': self.wait_total / completed, 'wait_max': self.wait_max,
+                'run_avg': self.run_total / completed, 'killed': self.killed,
+            }
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = None):
+        """Stops the workers, the stage starts new ones if used again.
+        Calls that haven't started are cancelled, by default only with
+        wait=False
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait if cancel_futures is None else cancel_futures)
+
 
 class Executor:
-    pool: futures.ThreadPoolExecutor = None
-    #pool: futures.ProcessPoolExecutor = None
+    # named pools of the kinds of work, see configure
+    stages: Dict[str, Stage] = {}
+    stages_lock = threading.Lock()
+    # event loop sync callers submit to, see run_as_sync
+    loop: asyncio.AbstractEventLoop = None
+    loop_thread: threading.Thread = None
+    loop_lock = threading.Lock()
+    # see _register_exit_hook
+    exit_hook_registered = False
+    exit_hook_lock = threading.Lock()
 
     @staticmethod
     def is_coro(func: Union[Callable, Coroutine, Any], func_name: str = None) -> bool:
         return is_coro_func(func, func_name)
 
     @classmethod
-    def init_pool(cls):
-        if cls.pool: return
-        #cls.pool = futures.ProcessPoolExecutor(max_workers = 8)
-        cls.pool = futures.ThreadPoolExecutor(max_workers = 8)
-    
+    def configure(cls, config=None):
+        """Sizes the stages (io, parse, nlp) and picks their backends from
+        `config`, a default Configuration on first use otherwise. Stages
+        whose settings change are replaced, the calls already submitted to
+        the old workers still run to the end. Stages of other names, e.g. 'parse_process'
+        for a call that asks for another backend, take the size of the
+        stage their name starts with
+        """
+        from ..configuration import Configuration
+
+        config = config or Configuration()
+        cpus = os.cpu_count() or 1
+        for name, (size_attribute, backend_attribute) in STAGE_SETTINGS.items():
+            workers = getattr(config, size_attribute, None) or cpus
+            backend = getattr(config, backend_attribute, 'thread') if backend_attribute else 'thread'
+            cls._set_stage(name, workers, backend)
+
+    @classmethod
+    def maybe_configure(cls, config):
+        """configure(config), only if `config` sets one of the stage
+        settings (STAGE_SETTINGS) to other than its default: the stages
+        are process wide, the config of any source or pool shouldn't
+        undo another's sizing
+        """
+        from ..configuration import Configuration
+
+        default = Configuration()
+        for attributes in STAGE_SETTINGS.values():
+            for attribute in filter(None, attributes):
+                if getattr(config, attribute, None) != getattr(default, attribute, None):
+                    cls.configure(config)
+                    return
+
+    @classmethod
+    def _set_stage(cls, name: str, workers: int, backend: str) -> Stage:
+        with cls.stages_lock:
+            stage = cls.stages.get(name)
+            if stage is not None and (stage.workers, stage.backend) == (workers, backend):
+                return stage
+            cls.stages[name] = Stage(name, workers, backend)
+        if stage is not None:
+            # other callers' calls are queued on it
+            stage.shutdown(wait=False, cancel_futures=False)
+        return cls.stages[name]
+
     @classmethod
-    def get_pool(cls) -> futures.ThreadPoolExecutor: # futures.ProcessPoolExecutor: # futures.ThreadPoolExecutor:
-        cls.init_pool()
-        return cls.pool
+    def get_stage(cls, name: str, backend: str = None) -> Stage:
+        """The stage `name`, or with a `backend` other than its own a
+        stage of that backend and size of its own ('<name>_<backend>')
+        """
+        if not cls.stages:
+            cls.configure()
+        stage = cls.stages.get(name)
+        if stage is None:
+            base = cls.get_stage(name.split('_')[0]) if name.split('_')[0] in STAGE_SETTINGS else None
+            stage = cls._set_stage(name, base.workers if base else os.cpu_count() or 1, backend or 'thread')
+        if backend is not None and backend != stage.backend:
+            return cls.get_stage('%s_%s' % (name, backend), backend)
+        return stage
+
+    @classmethod
+    async def run_in_stage(cls, name: str, func: Callable, *args, **kwargs):
+        """Runs the sync `func` on the workers of stage `name`
+        """
+        return await cls.get_stage(name).run(func, *args, **kwargs)
+
+    @classmethod
+    def metrics(cls) -> Dict[str, dict]:
+        """Calls, queue depth, wait and run times of every stage
+        """
+        return {name: stage.metrics() for name, stage in list(cls.stages.items())}
+
+    @classmethod
+    def shutdown(cls, wait: bool = True):
+        """Stops the workers of every stage
+        """
+        for stage in list(cls.stages.values()):
+            stage.shutdown(wait=wait)
+
+    @classmethod
+    def get_pool(cls) -> futures.Executor:
+        """The pool of the io stage
+        """
+        return cls.get_stage('io').get_executor()
+
+    @classmethod
+    def get_process_pool(cls, max_workers: int = None) -> futures.ProcessPoolExecutor:
+        """The process pool of the parse stage (for cpu bound work),
+        `max_workers` only applies if it isn't running yet
+        """
+        stage = cls.get_stage('parse', 'process')
+        if max_workers and stage.executor is None:
+            stage.workers = max_workers
+        return stage.get_executor()
+
+    @classmethod
+    async def run_in_process(cls, func: Callable, *args, **kwargs):
+        """
+        Runs a picklable Sync Function in the process pool of the parse stage
+        """
+        return await cls.get_stage('parse', 'process').run(func, *args, **kwargs)
 
     @classmethod
     def get_async_module(cls):
@@ -35,19 +300,87 @@ class Executor:
     @classmethod
     async def run_as_async(cls, sync_func: Callable, *args, **kwargs):
         """
-        Turns a Sync Function into an Async Function        
+        Turns a Sync Function into an Async Function, run on the io stage
         """
-        blocking = functools.partial(sync_func, *args, **kwargs)
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(cls.get_pool(), blocking)
+        return await cls.get_stage('io').run(sync_func, *args, **kwargs)
     
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        """The long lived event loop of run_as_sync, running in a daemon
+        thread from first use until exit (or shutdown_loop). Clients made
+        on it keep their connections between calls, see
+        network.get_shared_client
+        """
+        with cls.loop_lock:
+            if cls.loop is None:
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(started.set)
+                    loop.run_forever()
+
+                cls.loop_thread = threading.Thread(target=run, name='newz-event-loop', daemon=True)
+                cls.loop_thread.start()
+                started.wait()
+                cls.loop = loop
+                cls._register_exit_hook()
+            return cls.loop
+
+    @classmethod
+    def _register_exit_hook(cls):
+        """Once per process, on first use of the loop or of a process
+        stage: they outlive their callers, see shutdown_at_exit
+        """
+        with cls.exit_hook_lock:
+            if not cls.exit_hook_registered:
+                atexit.register(cls.shutdown_at_exit)
+                cls.exit_hook_registered = True
+
+    @classmethod
+    def shutdown_at_exit(cls):
+        """Stops the loop of run_as_sync and the workers of the process
+        stages, their calls that haven't started are cancelled
+        """
+        cls.shutdown_loop()
+        for stage in list(cls.stages.values()):
+            if stage.backend == 'process':
+                stage.shutdown(wait=True, cancel_futures=True)
+
+    @classmethod
+    def shutdown_loop(cls, timeout: float = 5):
+        """Closes the shared clients and stops the loop of run_as_sync,
+        the next sync call starts a new one
+        """
+        with cls.loop_lock:
+            loop, thread = cls.loop, cls.loop_thread
+            cls.loop = cls.loop_thread = None
+        if loop is None:
+            return
+        from .. import network
+        try:
+            asyncio.run_coroutine_threadsafe(network.aclose_shared_clients(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        if not thread.is_alive():
+            loop.close()
+
     @classmethod
     def run_as_sync(cls, async_func: Coroutine, *args, **kwargs):
         """
-        Turns an Async Function into a Sync Function
+        Turns an Async Function into a Sync Function. From a thread that
+        anyio started it runs on that thread's event loop, otherwise on
+        the background loop of get_loop, so no loop is started per call
         """
         current_async_module = cls.get_async_module()
         partial_f = functools.partial(async_func, *args, **kwargs)
-        if current_async_module is None:
-            return anyio.run(partial_f)
-        return anyio.from_thread.run(partial_f)
+        if current_async_module is not None:
+            return anyio.from_thread.run(partial_f)
+        loop = cls.get_loop()
+        if threading.current_thread() is cls.loop_thread:
+            raise RuntimeError('run_as_sync would block the event loop it has to run on, '
+                               'await %r instead' % async_func)
+        return asyncio.run_coroutine_threadsafe(partial_f(), loop).result()
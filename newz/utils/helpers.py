@@ -4,10 +4,11 @@ Holds misc. utility methods which prove to be
 useful throughout this library.
 """
 
+import builtins
 import codecs
+import functools
 import hashlib
 import os
-import pickle
 import random
 import re
 import inspect
@@ -17,12 +18,13 @@ import threading
 import time
 import pathlib
 
-from hashlib import sha1
-
-from bs4 import BeautifulSoup
-
 from newz import settings
 from .logs import default_logger as log
+from .bloom import BloomFilter
+from .cache import DiskCache, DEFAULT_MAX_SIZE as DEFAULT_CACHE_SIZE, MISSING as CACHE_MISSING
+from .memo import SeenStore
+from . import metrics
+from .resources import ResourceRegistry
 
 root_dir = pathlib.Path(os.path.dirname(__file__)).parent
 
@@ -108,35 +110,39 @@ class ReplaceSequence(object):
         return mutatedString
 
 
-class TimeoutError(Exception):
+class TimeoutError(builtins.TimeoutError):
     pass
 
 
 def timelimit(timeout):
     """Borrowed from web.py, rip Aaron Swartz
+
+    Raises TimeoutError if the function takes more than `timeout`
+    seconds. It runs in a daemon thread of its own, which is left running
+    (a thread can't be stopped), so only use this for work that ends;
+    the async api has config.article_deadline instead
     """
     def _1(function):
+        @functools.wraps(function)
         def _2(*args, **kw):
             class Dispatch(threading.Thread):
                 def __init__(self):
-                    threading.Thread.__init__(self)
+                    threading.Thread.__init__(self, daemon=True)
                     self.result = None
                     self.error = None
-
-                    self.setDaemon(True)
                     self.start()
 
                 def run(self):
                     try:
                         self.result = function(*args, **kw)
-                    except:
-                        self.error = sys.exc_info()
+                    except BaseException as e:
+                        self.error = e
             c = Dispatch()
             c.join(timeout)
-            if c.isAlive():
+            if c.is_alive():
                 raise TimeoutError()
-            if c.error:
-                raise c.error[0](c.error[1])
+            if c.error is not None:
+                raise c.error
             return c.result
         return _2
     return _1
@@ -179,6 +185,7 @@ def extract_meta_refresh(html):
     Example can be found at: https://www.google.com/url?rct=j&sa=t&url=http://sfbay.craigslist.org/eby/cto/
     5617800926.html&ct=ga&cd=CAAYATIaYTc4ZTgzYjAwOTAwY2M4Yjpjb206ZW46VVM&usg=AFQjCNF7zAl6JPuEsV4PbEzBomJTUpX4Lg
     """
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html, 'html.parser')
     element = soup.find('meta', attrs={'http-equiv': 'refresh'})
     if element:
@@ -204,31 +211,49 @@ def to_valid_filename(s):
     return ''.join(c for c in s if c in valid_chars)
 
 
-def cache_disk(seconds=(86400 * 5), cache_folder="/tmp"):
-    """Caching extracting category locations & rss feeds for 5 days
+def cache_disk(seconds=(86400 * 5), cache_folder="/tmp", max_size=DEFAULT_CACHE_SIZE):
+    """Caching extracting category locations & rss feeds for 5 days.
+    Works on functions and coroutine functions, entries live in a
+    utils/cache.py DiskCache, so the folder is bounded by `max_size` and
+    safe to share between crawler processes
     """
+    cache = DiskCache.open(cache_folder, max_size=max_size)
+
     def do_cache(function):
-        def inner_function(*args, **kwargs):
+        def cache_key(args, kwargs):
             """Calculate a cache key based on the decorated method signature
             args[1] indicates the domain of the inputs, we hash on domain!
             """
-            key = sha1((str(args[1]) +
-                        str(kwargs)).encode('utf-8')).hexdigest()
-            filepath = os.path.join(cache_folder, key)
-
-            # verify that the cached object exists and is less than
-            # X seconds old
-            if os.path.exists(filepath):
-                modified = os.path.getmtime(filepath)
-                age_seconds = time.time() - modified
-                if age_seconds < seconds:
-                    return pickle.load(open(filepath, "rb"))
-
-            # call the decorated function...
-            result = function(*args, **kwargs)
-            # ... and save the cached object for next time
-            pickle.dump(result, open(filepath, "wb"))
+            return '%s:%s%s' % (function.__qualname__, args[1], kwargs)
+
+        def count_lookup(args, result):
+            if metrics.registry.enabled:
+                metrics.registry.inc('newz_cache_lookups_total', cache=function.__name__.strip('_'),
+                                     domain=str(args[1]), result='miss' if result is CACHE_MISSING else 'hit')
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_inner_function(*args, **kwargs):
+                key = cache_key(args, kwargs)
+                result = await cache.async_lookup(key)
+                count_lookup(args, result)
+                if result is CACHE_MISSING:
+                    result = await function(*args, **kwargs)
+                    await cache.async_set(key, result, seconds)
+                return result
+            async_inner_function.cache = cache
+            return async_inner_function
+
+        @functools.wraps(function)
+        def inner_function(*args, **kwargs):
+            key = cache_key(args, kwargs)
+            result = cache.lookup(key)
+            count_lookup(args, result)
+            if result is CACHE_MISSING:
+                result = function(*args, **kwargs)
+                cache.set(key, result, seconds)
             return result
+        inner_function.cache = cache
         return inner_function
     return do_cache
 
@@ -262,81 +287,90 @@ def purge(fn, pattern):
             os.remove(os.path.join(fn, f))
 
 
+def get_seen_filter(config=None):
+    """The Bloom filter shared by the memos of all domains, None when
+    the config turns it off
+    """
+    if config is None or not config.use_seen_filter:
+        return None
+    return BloomFilter.get(settings.SEEN_FILTER, capacity=config.SEEN_FILTER_CAPACITY,
+                           error_rate=config.SEEN_FILTER_ERROR_RATE)
+
+
+def get_seen_store(domain, config=None):
+    """The persistent store of urls already seen on `domain`, see
+    utils/memo.py. A memo text file from older versions is imported
+    into it the first time it is opened.
+    """
+    legacy_path = os.path.join(settings.MEMO_DIR, domain_to_filename(domain))
+    return SeenStore.get(legacy_path[:-len('.txt')] + '.sqlite', legacy_path,
+                         bloom=get_seen_filter(config))
+
+
 def clear_memo_cache(source):
     """Clears the memoization cache for this specific news domain
     """
-    d_pth = os.path.join(settings.MEMO_DIR, domain_to_filename(source.domain))
-    if os.path.exists(d_pth):
-        os.remove(d_pth)
+    store = get_seen_store(source.domain, source.config)
+    if os.path.exists(store.path) or os.path.exists(store.legacy_path):
+        store.clear()
+        if os.path.exists(store.legacy_path):
+            os.remove(store.legacy_path)
     else:
         print('memo file for', source.domain, 'has already been deleted!')
 
 
-def memoize_articles(source, articles):
-    """When we parse the <a> links in an <html> page, on the 2nd run
-    and later, check the <a> links of previous runs. If they match,
-    it means the link must not be an article, because article urls
-    change as time passes. This method also uniquifies articles.
+def memoize_urls(source, urls):
+    """memoize_articles on plain urls, so links can be filtered before
+    any article object is built for them. Returns the unique new urls,
+    in order.
     """
-    source_domain = source.domain
     config = source.config
 
-    if len(articles) == 0:
+    cur_urls = dict.fromkeys(urls)
+    if not cur_urls:
         return []
 
-    memo = {}
-    cur_articles = {article.url: article for article in articles}
-    d_pth = os.path.join(settings.MEMO_DIR, domain_to_filename(source_domain))
-
-    if os.path.exists(d_pth):
-        f = codecs.open(d_pth, 'r', 'utf8')
-        urls = f.readlines()
-        f.close()
-        urls = [u.strip() for u in urls]
-
-        memo = {url: True for url in urls}
-        # prev_length = len(memo)
-        for url, article in list(cur_articles.items()):
-            if memo.get(url):
-                del cur_articles[url]
-
-        valid_urls = list(memo.keys()) + list(cur_articles.keys())
-
-        memo_text = '\r\n'.join(
-            [href.strip() for href in (valid_urls)])
-    # Our first run with memoization, save every url as valid
-    else:
-        memo_text = '\r\n'.join(
-            [href.strip() for href in list(cur_articles.keys())])
+    store = get_seen_store(source.domain, config)
+    seen = store.add_many(cur_urls)
+    for url in seen:
+        del cur_urls[url]
+    if metrics.registry.enabled:
+        metrics.registry.inc('newz_cache_lookups_total', len(seen), cache='seen_urls', domain=source.domain,
+                             result='hit')
+        metrics.registry.inc('newz_cache_lookups_total', len(cur_urls), cache='seen_urls', domain=source.domain,
+                             result='miss')
+
+    # urls seen long ago are forgotten one by one, MAX_FILE_MEMO only
+    # trims the oldest ones instead of dumping everything
+    removed = store.maintain(ttl=config.MEMO_TTL, max_size=config.MAX_FILE_MEMO)
+    if removed:
+        log.debug('%d urls expired from the memo of %s' % (removed, source.domain))
+    if store.bloom is not None and store.bloom.is_saturated:
+        log.warning('Seen-url filter %s is over capacity, delete it to rebuild a bigger one '
+                    '(see Configuration.SEEN_FILTER_CAPACITY)' % store.bloom.path)
+    return list(cur_urls)
 
-    # new_length = len(cur_articles)
-    if len(memo) > config.MAX_FILE_MEMO:
-        # We still keep current batch of articles though!
-        log.critical('memo overflow, dumping')
-        memo_text = ''
 
-    # TODO if source: source.write_upload_times(prev_length, new_length)
-    ff = codecs.open(d_pth, 'w', 'utf-8')
-    ff.write(memo_text)
-    ff.close()
-    return list(cur_articles.values())
+def memoize_articles(source, articles):
+    """When we parse the <a> links in an <html> page, on the 2nd run
+    and later, check the <a> links of previous runs. If they match,
+    it means the link must not be an article, because article urls
+    change as time passes. This method also uniquifies articles.
+    """
+    cur_articles = {article.url: article for article in articles}
+    return [cur_articles[url] for url in memoize_urls(source, cur_articles)]
 
 
 def get_useragent():
-    """Uses generator to return next useragent in saved file
+    """Returns a random useragent from the saved list
     """
-    with open(settings.USERAGENTS, 'r') as f:
-        agents = f.readlines()
-        selection = random.randint(0, len(agents) - 1)
-        agent = agents[selection]
-        return agent.strip()
+    return random.choice(ResourceRegistry.get_useragents())
 
 
 def get_available_languages():
     """Returns a list of available languages and their 2 char input codes
     """
-    stopword_files = os.listdir(os.path.join(settings.STOPWORDS_DIR))
-    two_dig_codes = [f.split('-')[1].split('.')[0] for f in stopword_files]
+    two_dig_codes = ResourceRegistry.get_languages()
     for d in two_dig_codes:
         assert len(d) == 2
     two_dig_codes.sort()
@@ -1,6 +1,7 @@
 import sys
 import json
 import logging
+import threading
 from pathlib import Path
 from loguru import logger
 from typing import Optional
@@ -145,4 +146,25 @@ class CustomizeLogger:
         return config
 
 get_logger = CustomizeLogger.make_default_logger
-default_logger = CustomizeLogger.make_default_logger('kops')
\ No newline at end of file
+
+
+class LazyLogger:
+    """
+    Builds the logger on first use, so importing the package doesn't
+    reset the loguru / logging handlers or start the enqueue thread
+    """
+    def __init__(self, module_name: str, **kwargs):
+        self.module_name = module_name
+        self.kwargs = kwargs
+        self._logger = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    self._logger = get_logger(self.module_name, **self.kwargs)
+        return getattr(self._logger, name)
+
+
+default_logger = LazyLogger('kops')
\ No newline at end of file
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent per-domain set of already seen article urls, used by
+helpers.memoize_articles. Each domain gets its own SQLite database in
+WAL mode, so lookups are batched index queries, writes only touch the new
+rows, and several crawlers can write the same domain concurrently.
+Urls expire individually once they haven't been seen for a TTL, instead of
+the whole memo being dumped when it grows too big.
+
+Stores can share a BloomFilter (utils/bloom.py) as a front: urls that
+miss it are new without touching the database. Expired urls stay in the
+filter, they only cost an exact lookup.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from typing import Dict, Iterable, Set
+
+from .bloom import BloomFilter
+
+# SQLite's default SQLITE_MAX_VARIABLE_NUMBER on older builds is 999
+QUERY_BATCH_SIZE = 500
+# seconds a writer waits for another crawler's transaction
+BUSY_TIMEOUT = 30
+# seconds between two expiry passes over the same store, per process
+EXPIRE_INTERVAL = 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS seen (
+    url TEXT PRIMARY KEY,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_last_seen ON seen (last_seen);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+UPSERT = ('INSERT INTO seen (url, first_seen, last_seen) VALUES (?, ?, ?) '
+          'ON CONFLICT(url) DO UPDATE SET last_seen = excluded.last_seen')
+
+
+class _Connection(sqlite3.Connection):
+    """sqlite3.Connection can't be weakly referenced, a subclass can
+    """
+
+
+def _batches(items, size=QUERY_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class SeenStore(object):
+    _stores: Dict[str, 'SeenStore'] = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, path: str, legacy_path: str = None, bloom: BloomFilter = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.bloom = bloom
+        self.last_expired = 0.0
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        # the filter the stored urls were last added to, see _sync_bloom
+        self._synced_bloom: BloomFilter = None
+        # every thread's connection, so clear() can close them all. A
+        # connection of an older generation was closed by clear()
+        self._connections = weakref.WeakSet()
+        self._generation = 0
+
+    @classmethod
+    def get(cls, path: str, legacy_path: str = None, bloom: BloomFilter = None) -> 'SeenStore':
+        """One store object per database per process, the connections
+        underneath are per thread. The store takes the caller's `bloom`
+        (or none), a new filter is synced on the next use
+        """
+        with cls._stores_lock:
+            store = cls._stores.get(path)
+            if store is None:
+                store = cls._stores[path] = cls(path, legacy_path, bloom)
+            store.bloom = bloom
+            return store
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.generation != self._generation:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # only used by this thread, but clear() may close it from another
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False, factory=_Connection)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._import_legacy(conn)
+                    self._initialized = True
+                self._connections.add(conn)
+                self._local.generation = self._generation
+            self._local.conn = conn
+        if self._synced_bloom is not self.bloom:
+            with self._init_lock:
+                if self._synced_bloom is not self.bloom:
+                    self._sync_bloom(conn)
+                    self._synced_bloom = self.bloom
+        return conn
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        """Moves the urls of an old memo text file into the store
+        """
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            urls = [u.strip() for u in f.read().splitlines() if u.strip()]
+        self._insert(conn, urls, time.time())
+        os.remove(self.legacy_path)
+
+    def _sync_bloom(self, conn: sqlite3.Connection):
+        """Adds the stored urls to the filter, once per filter file: the
+        id of the filter they went into is kept in the store, until a
+        write without a filter (see _forget_bloom)
+        """
+        if self.bloom is None:
+            return
+        filter_id = self.bloom.filter_id.hex()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'bloom_id'").fetchone()
+        if row is not None and row[0] == filter_id:
+            return
+        cursor = conn.execute('SELECT url FROM seen')
+        while True:
+            rows = cursor.fetchmany(QUERY_BATCH_SIZE)
+            if not rows:
+                break
+            self.bloom.add_many(row[0] for row in rows)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('bloom_id', ?)", (filter_id,))
+
+    def _forget_bloom(self, conn: sqlite3.Connection):
+        """In a write transaction without a filter: the rows written
+        aren't in any filter, the next store with one backfills again
+        """
+        if self.bloom is None:
+            conn.execute("DELETE FROM meta WHERE key = 'bloom_id'")
+
+    def _maybe_seen(self, urls):
+        """Urls that need an exact lookup, everything the filter
+        rules out is new
+        """
+        if self.bloom is None:
+            return urls
+        return self.bloom.contains_many(urls)
+
+    def _select_seen(self, conn: sqlite3.Connection, urls) -> Set[str]:
+        seen = set()
+        for batch in _batches(urls):
+            query = 'SELECT url FROM seen WHERE url IN (%s)' % ','.join('?' * len(batch))
+            seen.update(row[0] for row in conn.execute(query, batch))
+        return seen
+
+    def _insert(self, conn: sqlite3.Connection, urls, now: float):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(UPSERT, ((url, now, now) for url in urls))
+            if self.bloom is not None:
+                self.bloom.add_many(urls)
+            self._forget_bloom(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def contains_many(self, urls: Iterable[str]) -> Set[str]:
+        """The subset of `urls` that is already in the store
+        """
+        conn = self._connect()
+        return self._select_seen(conn, self._maybe_seen(list(urls)))
+
+    def add_many(self, urls: Iterable[str]) -> Set[str]:
+        """Marks `urls` as seen now and returns those that had been seen
+        before. Check and insert happen in one write transaction, so two
+        crawlers can't both claim a url as new. The filter is read and
+        updated inside that transaction too.
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return set()
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # urls missing from the filter are new, only the rest needs an
+            # exact lookup. A rollback leaves their bits set, which only
+            # costs lookups later
+            maybe_seen = urls if self.bloom is None else self.bloom.add_many(urls)
+            seen = self._select_seen(conn, maybe_seen)
+            conn.executemany(UPSERT, ((url, now, now) for url in urls))
+            self._forget_bloom(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return seen
+
+    def expire(self, ttl: float) -> int:
+        """Forgets urls that haven't been seen for `ttl` seconds
+        """
+        self.last_expired = time.time()
+        cursor = self._connect().execute(
+            'DELETE FROM seen WHERE last_seen < ?', (self.last_expired - ttl,))
+        return cursor.rowcount
+
+    def maintain(self, ttl: float = None, max_size: int = None) -> int:
+        """Expiry and size trimming, at most once per EXPIRE_INTERVAL
+        per process
+        """
+        if time.time() - self.last_expired < EXPIRE_INTERVAL:
+            return 0
+        self.last_expired = time.time()
+        removed = 0
+        if ttl is not None:
+            removed += self.expire(ttl)
+        if max_size is not None:
+            removed += self.trim(max_size)
+        return removed
+
+    def trim(self, max_size: int) -> int:
+        """Keeps only the `max_size` most recently seen urls
+        """
+        cursor = self._connect().execute(
+            'DELETE FROM seen WHERE url IN '
+            '(SELECT url FROM seen ORDER BY last_seen DESC LIMIT -1 OFFSET ?)', (max_size,))
+        return cursor.rowcount
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+
+    def close(self):
+        """Closes this thread's connection
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._init_lock:
+                self._connections.discard(conn)
+            conn.close()
+            self._local.conn = None
+
+    def clear(self):
+        """Deletes the database, the store recreates it on next use.
+        Every thread's connection is closed first, the threads reconnect
+        """
+        with self._init_lock:
+            for conn in list(self._connections):
+                conn.close()
+            self._connections.clear()
+            self._generation += 1
+            self._initialized = False
+            self._synced_bloom = None
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Counters and latency histograms of the crawl pipeline, labelled by stage
+and domain, exported as Prometheus text or JSON snapshots (see
+AsyncNewsPool.metrics and AsyncSource.metrics):
+
+- newz_stage_seconds{stage, domain}: request (a whole fetch), connect
+  (dns included, httpcore resolves while it connects), tls, ttfb (request
+  sent to response headers), download (the body), parse and nlp
+- newz_requests_total{domain, status} and newz_response_bytes_total{domain}
+- newz_cache_lookups_total{cache, domain, result}: the disk cache of
+  category and feed urls, and the memo of seen urls
+
+One registry per process, off until a Configuration with collect_metrics
+(or `enable`) turns it on. Off, an instrumented call site costs one
+attribute check: the registry's methods return right away and `timed`
+hands out a shared no-op context manager. Crawl worker processes send
+what they recorded back with their results, see Metrics.collect / merge.
+"""
+
+import bisect
+import contextlib
+import json
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# upper bounds (seconds) of the buckets of every histogram, +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+DESCRIPTIONS = {
+    'newz_stage_seconds': 'Seconds spent per article or request in each stage of the pipeline',
+    'newz_requests_total': 'HTTP requests by response status (error when none came back)',
+    'newz_response_bytes_total': 'Bytes of the response bodies downloaded',
+    'newz_cache_lookups_total': 'Cache lookups by result (hit or miss)',
+    'newz_executor_workers': 'Workers of each executor stage',
+    'newz_executor_pending': 'Calls running or waiting on each executor stage',
+    'newz_executor_queue_depth': 'Calls waiting for a worker of each executor stage',
+    'newz_fetch_active': 'Requests holding a slot of the fetch scheduler',
+    'newz_fetch_queue_depth': 'Requests waiting for a slot of the fetch scheduler',
+}
+
+# (name, sorted label items)
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def domain_of(url: str) -> str:
+    return urlparse(url).netloc if url else ''
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        # per bucket, not cumulative, the last one is +Inf
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def add(self, counts: List[int], count: int, total: float):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.count += count
+        self.sum += total
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations up to it), as Prometheus buckets
+        """
+        result, running = [], 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket the `q` quantile falls in
+        """
+        rank = q * self.count
+        for bound, running in self.cumulative():
+            if running >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics(object):
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def collect(self) -> tuple:
+        """Takes what was recorded so far, as plain data to merge into
+        another process's registry
+        """
+        with self.lock:
+            counters, histograms = self.counters, self.histograms
+            self.counters, self.histograms = {}, {}
+        return (list(counters.items()),
+                [(key, h.counts, h.count, h.sum) for key, h in histograms.items()])
+
+    def merge(self, collected: Optional[tuple]):
+        if not collected:
+            return
+        counters, histograms = collected
+        with self.lock:
+            for key, value in counters:
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, counts, count, total in histograms:
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.add(counts, count, total)
+
+    def snapshot(self, domains: Iterable[str] = None, gauges: Dict[str, list] = None) -> dict:
+        """Everything recorded (with `domains`, only the series of those
+        domains and those without a domain) plus the `gauges` of the
+        caller, {name: [(labels, value), ..]}, as JSON ready data
+        """
+        domains = None if domains is None else set(domains)
+
+        def wanted(labels):
+            labels = dict(labels)
+            return domains is None or 'domain' not in labels or labels['domain'] in domains
+
+        with self.lock:
+            counters = sorted((key, value) for key, value in self.counters.items() if wanted(key[1]))
+            histograms = sorted(((key, h) for key, h in self.histograms.items() if wanted(key[1])),
+                                key=lambda item: item[0])
+            histograms = [(key, h.cumulative(), h.count, h.sum) for key, h in histograms]
+        snapshot = {'time': time.time(), 'counters': {}, 'gauges': {}, 'histograms': {}}
+        for (name, labels), value in counters:
+            snapshot['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for name, series in sorted((gauges or {}).items()):
+            snapshot['gauges'][name] = [{'labels': dict(labels), 'value': value} for labels, value in series]
+        for (name, labels), buckets, count, total in histograms:
+            snapshot['histograms'].setdefault(name, []).append({
+                'labels': dict(labels), 'count': count, 'sum': total,
+                'buckets': [['+Inf' if bound == float('inf') else bound, running] for bound, running in buckets],
+            })
+        return snapshot
+
+    def export(self, format: str = None, domains: Iterable[str] = None, gauges: Dict[str, list] = None):
+        """The snapshot as a dict (format None), JSON text ('json') or
+        Prometheus text ('prometheus')
+        """
+        snapshot = self.snapshot(domains, gauges)
+        if format is None:
+            return snapshot
+        if format == 'json':
+            return json.dumps(snapshot)
+        if format == 'prometheus':
+            return to_prometheus(snapshot)
+        raise ValueError('Unknown metrics format %r' % format)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict, **extra) -> str:
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value)) for name, value in items)
+
+
+def to_prometheus(snapshot: dict) -> str:
+    """Prometheus text exposition format (0.0.4) of a snapshot
+    """
+    lines = []
+    for kind, type_name in (('counters', 'counter'), ('gauges', 'gauge')):
+        for name, series in snapshot[kind].items():
+            lines.append('# HELP %s %s' % (name, DESCRIPTIONS.get(name, name)))
+            lines.append('# TYPE %s %s' % (name, type_name))
+            lines.extend('%s%s %r' % (name, _labels(s['labels']), s['value']) for s in series)
+    for name, series in snapshot['histograms'].items():
+        lines.append('# HELP %s %s' % (name, DESCRIPTIONS.get(name, name)))
+        lines.append('# TYPE %s histogram' % name)
+        for s in series:
+            for bound, running in s['buckets']:
+                lines.append('%s_bucket%s %d' % (name, _labels(s['labels'], le=bound), running))
+            lines.append('%s_sum%s %r' % (name, _labels(s['labels']), s['sum']))
+            lines.append('%s_count%s %d' % (name, _labels(s['labels']), s['count']))
+    return '\n'.join(lines) + '\n'
+
+
+registry = Metrics()
+
+
+def stage_gauges(stages: Dict[str, dict]) -> Dict[str, list]:
+    """Gauges of the executor stages, from Executor.metrics()
+    """
+    return {
+        'newz_executor_%s' % name: [({'stage': stage}, values[name]) for stage, values in sorted(stages.items())]
+        for name in ('workers', 'pending', 'queue_depth')
+    }
+
+
+def enable():
+    registry.enabled = True
+
+
+def disable():
+    registry.enabled = False
+
+
+def configure(config):
+    """Turns the registry on for a config with collect_metrics, never
+    off: other crawls of the process may be collecting
+    """
+    if getattr(config, 'collect_metrics', False):
+        registry.enabled = True
+
+
+class _Timer(object):
+    __slots__ = ('stage', 'url', 'started')
+
+    def __init__(self, stage: str, url: str):
+        self.stage = stage
+        self.url = url
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe('newz_stage_seconds', time.perf_counter() - self.started,
+                         stage=self.stage, domain=domain_of(self.url))
+
+
+_NOT_TIMED = contextlib.nullcontext()
+
+
+def timed(stage: str, url: str):
+    """Times the block into newz_stage_seconds of `stage` and the domain
+    of `url`
+    """
+    if not registry.enabled:
+        return _NOT_TIMED
+    return _Timer(stage, url)
+
+
+# httpcore trace event (without its connection / http11 / http2 prefix)
+# that ends a phase -> the event that starts it, the stage of the phase
+TRACED_PHASES = {
+    'connect_tcp': ('connect_tcp', 'connect'),
+    'connect_unix_socket': ('connect_unix_socket', 'connect'),
+    'start_tls': ('start_tls', 'tls'),
+    'receive_response_headers': ('send_request_headers', 'ttfb'),
+    'receive_response_body': ('receive_response_body', 'download'),
+}
+
+
+class RequestTrace(object):
+    """httpx 'trace' extension of one request: times its phases from
+    httpcore's events (mock transports send none) and counts it once
+    `finish`ed
+    """
+    __slots__ = ('domain', 'started', 'phases')
+
+    def __init__(self, url: str):
+        self.domain = domain_of(url)
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    async def __call__(self, event: str, info: dict):
+        name, _, state = event.partition('.')[2].rpartition('.')
+        if state == 'started':
+            self.phases[name] = time.perf_counter()
+        elif state == 'complete' and name in TRACED_PHASES:
+            start, stage = TRACED_PHASES[name]
+            started = self.phases.pop(start, None)
+            if started is not None:
+                registry.observe('newz_stage_seconds', time.perf_counter() - started,
+                                 stage=stage, domain=self.domain)
+
+    def finish(self, response):
+        """Counts the request, by the status of its `response` (an
+        httpx.Response, None if the request failed)
+        """
+        registry.observe('newz_stage_seconds', time.perf_counter() - self.started,
+                         stage='request', domain=self.domain)
+        registry.inc('newz_requests_total', domain=self.domain,
+                     status='error' if response is None else str(response.status_code))
+        if response is not None and response.num_bytes_downloaded:
+            registry.inc('newz_response_bytes_total', response.num_bytes_downloaded, domain=self.domain)
+
+
+def request_trace(url: str) -> Optional[RequestTrace]:
+    """A RequestTrace for `url`, None when metrics are off
+    """
+    if not registry.enabled:
+        return None
+    return RequestTrace(url)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Registry for the static resources shipped in newz/resources.
+
+Stopwords, user agents and popular sources are compiled into a single
+prebuilt index (frozensets / tuples, pickled) by the build step:
+
+    python -m newz.utils.resources
+
+Every consumer (text.StopWords, nlp, helpers.get_useragent,
+api.popular_urls) reads through `ResourceRegistry`, which loads the index
+once, lazily and under a lock. If no index has been built, or it was built
+for another version, the text files are compiled in memory instead.
+"""
+
+import os
+import pickle
+import threading
+
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from newz import settings
+from ..version import __version__
+from .logs import default_logger as log
+
+INDEX_FORMAT = 1
+
+
+def _read_lines(path: str) -> List[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def compile_resources() -> Dict:
+    """Reads every resource text file into the index layout
+    """
+    stopwords = {}
+    for filename in sorted(os.listdir(settings.STOPWORDS_DIR)):
+        if not (filename.startswith('stopwords-') and filename.endswith('.txt')):
+            continue
+        language = filename[len('stopwords-'):-len('.txt')]
+        stopwords[language] = frozenset(
+            _read_lines(os.path.join(settings.STOPWORDS_DIR, filename)))
+
+    return {
+        'format': INDEX_FORMAT,
+        'version': __version__,
+        'stopwords': stopwords,
+        'nlp_stopwords_en': frozenset(
+            w.strip() for w in _read_lines(settings.NLP_STOPWORDS_EN)),
+        'useragents': tuple(
+            a.strip() for a in _read_lines(settings.USERAGENTS)),
+        'popular_sources': tuple(
+            u.strip() for u in _read_lines(settings.POPULAR_URLS)),
+    }
+
+
+def build_index(path: str = None) -> str:
+    """Compiles newz/resources into the prebuilt index at `path`.
+    The file is written to a temp name and renamed, so readers never
+    see a partial index.
+    """
+    path = path or settings.RESOURCE_INDEX
+    index = compile_resources()
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ResourceRegistry:
+    index: Optional[Dict] = None
+    nlp_stopwords: Dict[str, FrozenSet[str]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _load_index(cls) -> Dict:
+        try:
+            with open(settings.RESOURCE_INDEX, 'rb') as f:
+                index = pickle.load(f)
+            if index.get('format') == INDEX_FORMAT and index.get('version') == __version__:
+                return index
+            log.debug('Resource index at %s is stale, recompiling' % settings.RESOURCE_INDEX)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            log.debug('No resource index at %s, compiling from text files' % settings.RESOURCE_INDEX)
+        return compile_resources()
+
+    @classmethod
+    def get_index(cls) -> Dict:
+        if cls.index is not None:
+            return cls.index
+        with cls._lock:
+            if cls.index is None:
+                cls.index = cls._load_index()
+        return cls.index
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.index = None
+            cls.nlp_stopwords = {}
+
+    @classmethod
+    def get_stopwords(cls, language: str) -> FrozenSet[str]:
+        """Stopwords used for content extraction (text.StopWords)
+        """
+        stopwords = cls.get_index()['stopwords']
+        if language not in stopwords:
+            path = os.path.join(settings.STOPWORDS_DIR, 'stopwords-%s.txt' % language)
+            raise IOError("Couldn't open file %s" % path)
+        return stopwords[language]
+
+    @classmethod
+    def get_nlp_stopwords(cls, language: str) -> FrozenSet[str]:
+        """Stopwords used for keyword selection (nlp)
+        """
+        if language in cls.nlp_stopwords:
+            return cls.nlp_stopwords[language]
+        # stopwords for nlp in English are not the regular stopwords
+        # to pass the tests
+        # can be changed with the tests
+        if language == 'en':
+            words = cls.get_index()['nlp_stopwords_en']
+        else:
+            words = frozenset(w.strip() for w in cls.get_stopwords(language))
+        return cls.nlp_stopwords.setdefault(language, words)
+
+    @classmethod
+    def get_useragents(cls) -> Tuple[str, ...]:
+        return cls.get_index()['useragents']
+
+    @classmethod
+    def get_popular_sources(cls) -> Tuple[str, ...]:
+        return cls.get_index()['popular_sources']
+
+    @classmethod
+    def get_languages(cls) -> List[str]:
+        return sorted(cls.get_index()['stopwords'])
+
+
+if __name__ == '__main__':
+    print('Resource index written to %s' % build_index())
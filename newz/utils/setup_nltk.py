@@ -1,4 +1,3 @@
-import nltk
 from pathlib import Path
 
 root = Path(__file__).parent
@@ -13,10 +12,17 @@ REQUIRED_CORPORA = [
 ]
 
 complete_file = root.joinpath('.nltk_complete')
-if not complete_file.exists():
+
+
+def ensure_corpora():
+    """Downloads the nltk corpora on first use rather than at import
+    """
+    if complete_file.exists():
+        return
+    import nltk
     for each in REQUIRED_CORPORA:
         try:
             nltk.data.find(each)
         except LookupError:
             nltk.download(each)
-    complete_file.touch()
\ No newline at end of file
+    complete_file.touch()
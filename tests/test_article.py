@@ -1,6 +1,18 @@
 import anyio
 from newz import AsyncArticle
 
+
+def test_valid_body_is_recomputed_for_new_html():
+    article = AsyncArticle('http://a.test/2022/06/01/a-story.html')
+    # the verdict of an earlier crawl
+    article.valid_body = True
+    article.set_html('<html><body><p>Too short to be a story.</p></body></html>')
+    assert article.valid_body is None
+    article.valid_body = True
+    article.parse()
+    assert not article.is_valid_body()
+
+
 async def run_test():
     url = 'https://blog.finxter.com/python-__aenter__-magic-method/'
     article = AsyncArticle(url)
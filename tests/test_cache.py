@@ -0,0 +1,58 @@
+import os
+import time
+
+import anyio
+
+from newz.utils import cache as cache_module
+from newz.utils.cache import DiskCache, MISSING
+from newz.utils.helpers import cache_disk
+
+
+class Point(object):
+    def __init__(self, x):
+        self.x = x
+
+
+def test_set_lookup_and_expiry(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.set('urls', ['http://a.test/world', 'http://a.test/sports'], ttl=60)
+    cache.set('none', None, ttl=60)
+    cache.set('point', Point(3), ttl=60)
+    assert cache.get('urls') == ['http://a.test/world', 'http://a.test/sports']
+    assert cache.lookup('none') is None
+    assert cache.get('point').x == 3
+    assert cache.lookup('missing') is MISSING
+
+    cache.set('stale', 1, ttl=-1)
+    assert cache.lookup('stale') is MISSING
+    assert not any(name.endswith('.tmp') for name in os.listdir(str(tmp_path)))
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, 'EVICT_INTERVAL', 3600)
+    cache = DiskCache(str(tmp_path), max_size=3000)
+    for i in range(5):
+        cache.set('key%d' % i, 'x' * 1000, ttl=60)
+        # recency has a one second resolution on some filesystems
+        os.utime(cache._path('key%d' % i), (time.time() - 100 + i, time.time() - 100 + i))
+    cache._touch(cache._path('key0'), time.time())
+
+    assert cache.evict() == 3
+    assert [cache.lookup('key%d' % i) is not MISSING for i in range(5)] == [True, False, False, False, True]
+
+
+def test_cache_disk_wraps_coroutines(tmp_path):
+    calls = []
+
+    class Site(object):
+        @cache_disk(seconds=60, cache_folder=str(tmp_path))
+        async def category_urls(self, domain):
+            calls.append(domain)
+            return ['http://%s/world' % domain]
+
+    async def run_test():
+        assert await Site().category_urls('a.test') == ['http://a.test/world']
+        assert await Site().category_urls('a.test') == ['http://a.test/world']
+
+    anyio.run(run_test)
+    assert calls == ['a.test']
@@ -0,0 +1,85 @@
+import functools
+import json
+import time
+
+import anyio
+import httpx
+
+from newz import network
+from newz import source as source_module
+from newz.configuration import Configuration
+from newz.distributed import DONE, FAILED, JsonLinesSink, LEASED, QUEUED, SQLiteTaskQueue, Task
+from newz.mthreading import AsyncNewsPool
+from newz.source import AsyncSource
+
+from test_pool import make_article_html
+from test_source import SITE, make_site
+
+
+def test_leases_expire_and_failed_tasks_are_retried(tmp_path):
+    queue = SQLiteTaskQueue(str(tmp_path / 'crawl.queue'), max_attempts=2)
+    queue.put([Task(None, 'articles', ('http://a.test', [('http://a.test/%d' % i, '')], None)) for i in range(3)])
+
+    first = queue.lease('a', 2, lease_seconds=0.05)
+    assert [t.payload[1][0][0] for t in first] == ['http://a.test/0', 'http://a.test/1']
+    assert [t.id for t in queue.lease('b', 5, lease_seconds=60)] == [3]
+    assert queue.heartbeat('a', [first[0].id, first[1].id], lease_seconds=0.05) == [1, 2]
+    time.sleep(0.1)
+    # a stopped heartbeating, b takes over its tasks
+    taken = queue.lease('b', 5, lease_seconds=60)
+    assert [t.id for t in taken] == [1, 2] and all(t.attempts == 1 for t in taken)
+    assert queue.heartbeat('a', [1, 2], lease_seconds=60) == []
+    queue.complete('a', [1])
+    assert queue.counts() == {LEASED: 3}
+
+    queue.complete('b', [1, 3])
+    queue.fail('b', 2, 'boom')
+    assert queue.counts() == {DONE: 2, FAILED: 1}
+
+
+def test_workers_share_a_queue(monkeypatch, tmp_path):
+    site = make_site()
+
+    def handler(request: httpx.Request):
+        if request.url.host == 'down.test':
+            return httpx.Response(404, text='not found')
+        if request.url.path.startswith('/2022/'):
+            return httpx.Response(200, text=make_article_html(len(request.url.path)),
+                                  headers={'content-type': 'text/html; charset=utf-8'})
+        return site(request)
+
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(AsyncSource._async_get_category_urls.cache, 'directory', str(tmp_path))
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+
+    config = Configuration()
+    config.memoize_articles = False
+    queue = SQLiteTaskQueue(str(tmp_path / 'crawl.queue'))
+    queue.put_sources([SITE, 'http://down.test'], config)
+    sink = JsonLinesSink(str(tmp_path / 'results'))
+
+    async def main():
+        stats = []
+
+        async def work(worker_id):
+            stats.append(await AsyncNewsPool().async_work(
+                queue, sink, idle_timeout=0.2, worker_id=worker_id, poll_interval=0.02, articles_per_task=3,
+                tasks_at_once=1))
+
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(work, 'node1')
+            task_group.start_soon(work, 'node2')
+        return stats
+
+    stats = anyio.run(main)
+    # 11 articles in tasks of 3, and the two sources
+    assert sum(s['tasks'] for s in stats) == 6 and all(s['tasks'] for s in stats)
+    assert queue.counts() == {DONE: 6}
+    urls = []
+    for path in (tmp_path / 'results').iterdir():
+        with open(path) as f:
+            items = [json.loads(line) for line in f]
+        assert all(item['source_url'] == SITE and 'Sentence 59' in item['html'] for item in items)
+        urls.extend(item['url'] for item in items)
+    assert len(urls) == len(set(urls)) == 11
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import anyio
+import pytest
+
+from newz.configuration import Configuration
+from newz.mthreading import AsyncNewsPool
+from newz.source import AsyncSource
+from newz.utils.executor import Executor, Stage
+
+
+def test_stages_are_isolated():
+    config = Configuration()
+    config.number_threads = 2
+    config.number_nlp_workers = 1
+    Executor.configure(config)
+    try:
+        assert Executor.get_stage('io').workers == 2 and Executor.get_stage('nlp').workers == 1
+        release = threading.Event()
+
+        async def main():
+            async with anyio.create_task_group() as task_group:
+                for _ in range(3):
+                    task_group.start_soon(Executor.run_in_stage, 'nlp', release.wait)
+                await anyio.sleep(0.05)
+                # nlp is full and has a queue, io still goes right away
+                assert Executor.get_stage('nlp').queue_depth == 2
+                assert await Executor.run_as_async(lambda: 'io') == 'io'
+                release.set()
+
+        anyio.run(main)
+        nlp = Executor.metrics()['nlp']
+        assert nlp['completed'] == 3 and nlp['queue_depth'] == 0 and nlp['wait_max'] >= 0.04
+        assert Executor.metrics()['io']['wait_max'] < 0.04
+
+        # a new size replaces the stage
+        stage = Executor.get_stage('nlp')
+        config.number_nlp_workers = 3
+        Executor.configure(config)
+        assert Executor.get_stage('nlp') is not stage and stage.executor is None
+        # asking for another backend gets a stage of its own
+        assert Executor.get_stage('nlp', 'process').name == 'nlp_process'
+    finally:
+        Executor.shutdown()
+        Executor.configure()
+
+
+def test_process_stage():
+    stage = Stage('test', 1, 'process')
+    try:
+        assert anyio.run(stage.run, pow, 2, 10) == 1024
+        with pytest.raises(ZeroDivisionError):
+            anyio.run(stage.run, divmod, 1, 0)
+        assert stage.metrics()['completed'] == 1 and stage.metrics()['failed'] == 1
+    finally:
+        stage.shutdown()
+    with pytest.raises(ValueError):
+        Stage('test', 1, 'fiber')
+
+
+def test_process_pool_is_shut_down_at_exit():
+    pool = Executor.get_process_pool()
+    assert Executor.exit_hook_registered
+    Executor.shutdown_at_exit()
+    assert Executor.get_stage('parse', 'process').executor is None
+    with pytest.raises(RuntimeError):
+        pool.submit(pow, 2, 10)
+
+
+def test_resizing_a_stage_finishes_its_queued_calls():
+    config = Configuration()
+    config.number_threads = 2
+    Executor.configure(config)
+    try:
+        async def main():
+            results = []
+
+            async def call(i):
+                results.append(await Executor.run_as_async(lambda: time.sleep(0.02) or i))
+
+            async with anyio.create_task_group() as task_group:
+                for i in range(10):
+                    task_group.start_soon(call, i)
+                await anyio.sleep(0)
+                # a pool with another config resizes io, 8 calls still wait
+                config.number_threads = 3
+                AsyncNewsPool(config)
+            return results
+
+        assert sorted(anyio.run(main)) == list(range(10))
+        assert Executor.get_stage('io').workers == 3
+    finally:
+        Executor.shutdown()
+        Executor.configure()
+
+
+def test_only_stage_settings_resize_the_stages():
+    config = Configuration()
+    config.number_threads = 2
+    Executor.configure(config)
+    try:
+        io = Executor.get_stage('io')
+        AsyncSource('http://a.test', memoize_articles=False)
+        AsyncSource('http://a.test', language='de')
+        AsyncNewsPool(Configuration())
+        assert Executor.get_stage('io') is io and io.workers == 2
+
+        AsyncSource('http://a.test', number_threads=3)
+        assert Executor.get_stage('io').workers == 3
+    finally:
+        Executor.shutdown()
+        Executor.configure()
@@ -0,0 +1,90 @@
+import datetime
+import gzip
+
+from newz.feeds import FeedParser, iter_feed_entries, parse_date
+from newz.sitemaps import SitemapParser, iter_sitemap_entries, parse_robots_sitemaps
+
+RSS = '''<?xml version="1.0" encoding="ISO-8859-1"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/">
+<channel><title>News</title><link>http://news.test/</link>
+<item><title>First é</title><link>http://news.test/2022/06/01/first.html</link>
+<guid>first-guid</guid><pubDate>Wed, 01 Jun 2022 10:00:00 GMT</pubDate>
+<content:encoded><![CDATA[<p>hello</p>]]></content:encoded></item>
+<item><title>Second</title><guid isPermaLink="true">http://news.test/2022/06/02/second.html</guid></item>
+</channel></rss>'''
+
+ATOM = b'''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom"><title>Atom</title>
+<entry><title>Atom entry</title><id>urn:1</id>
+<link rel="self" href="http://news.test/self"/><link href="http://news.test/atom-entry"/>
+<updated>2022-06-03T00:00:00Z</updated><published>2022-06-02T00:00:00Z</published>
+<summary>abc</summary></entry>
+</feed>'''
+
+
+def test_rss_entries():
+    first, second = list(iter_feed_entries(RSS, chunk_size=50))
+    assert first.url == 'http://news.test/2022/06/01/first.html'
+    assert first.title == 'First é'
+    assert first.guid == 'first-guid'
+    assert first.published == datetime.datetime(2022, 6, 1, 10, tzinfo=datetime.timezone.utc)
+    assert first.content_length == len('<p>hello</p>')
+    assert second.url == 'http://news.test/2022/06/02/second.html'
+    assert second.published is None
+
+
+def test_atom_entries_and_staleness():
+    entry, = list(iter_feed_entries(ATOM))
+    assert entry.url == 'http://news.test/atom-entry'
+    assert entry.guid == 'urn:1'
+    assert entry.published == parse_date('2022-06-02T00:00:00Z')
+    now = datetime.datetime(2022, 6, 3, tzinfo=datetime.timezone.utc)
+    assert entry.is_older_than(3600, now)
+    assert not entry.is_older_than(2 * 86400, now)
+    assert not entry.is_older_than(None, now)
+
+
+def test_push_parser_and_broken_input():
+    parser = FeedParser()
+    entries = []
+    for i in range(0, len(ATOM), 7):
+        entries.extend(parser.feed(ATOM[i:i + 7]))
+    entries.extend(parser.close())
+    assert [e.title for e in entries] == ['Atom entry']
+
+    truncated = RSS[:RSS.index('<item><title>Second')]
+    assert [e.title for e in iter_feed_entries(truncated)] == ['First é']
+    assert list(iter_feed_entries('')) == []
+    assert list(iter_feed_entries('not xml at all')) == []
+
+
+def test_sitemap_parser_streams_gzip_and_news_entries():
+    urlset = ('<?xml version="1.0" encoding="UTF-8"?>'
+              '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+              'xmlns:news="http://www.google.com/schemas/sitemap-news/0.9" '
+              'xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">'
+              '<url><loc>http://a.test/2022/06/01/one.html</loc>'
+              '<image:image><image:loc>http://a.test/one.jpg</image:loc></image:image>'
+              '<news:news><news:publication_date>2022-06-01T10:00:00Z</news:publication_date>'
+              '<news:title>One</news:title></news:news></url>'
+              '<url><loc>http://a.test/2022/05/01/two.html</loc><lastmod>2022-05-01</lastmod></url>'
+              '</urlset>')
+    compressed = gzip.compress(urlset.encode('utf-8'))
+    parser = SitemapParser()
+    entries = []
+    # one byte at a time, including a first chunk shorter than the magic
+    for i in range(len(compressed)):
+        entries.extend(parser.feed(compressed[i:i + 1]))
+    entries.extend(parser.close())
+
+    assert [e.url for e in entries] == ['http://a.test/2022/06/01/one.html', 'http://a.test/2022/05/01/two.html']
+    assert entries[0].title == 'One' and entries[0].date.day == 1 and entries[0].date.month == 6
+    now = entries[0].date + datetime.timedelta(days=2)
+    assert [e.is_older_than(86400 * 7, now) for e in entries] == [False, True]
+
+    index = ('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+             '<sitemap><loc>http://a.test/news.xml.gz</loc><lastmod>2022-06-01</lastmod></sitemap></sitemapindex>')
+    assert [(e.url, e.is_index) for e in iter_sitemap_entries(index)] == [('http://a.test/news.xml.gz', True)]
+    assert list(iter_sitemap_entries(b'x')) == []
+    assert parse_robots_sitemaps('User-agent: *\nDisallow: /x\nSitemap: http://a.test/s.xml\nsitemap:http://a.test/n.xml') \
+        == ['http://a.test/s.xml', 'http://a.test/n.xml']
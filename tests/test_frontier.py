@@ -0,0 +1,118 @@
+import functools
+
+import anyio
+import httpx
+
+from newz import network
+from newz.frontier import CrawlFrontier, DONE, FAILED
+from newz.mthreading import AsyncNewsPool
+from newz.source import AsyncSource
+
+from test_pool import article_body, check_sources, make_sources
+
+
+def test_checkpoints_are_buffered(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / 'crawl.frontier'), checkpoint_interval=60)
+    frontier.add([('http://a.test/1', 'article', 'http://a.test'), ('http://a.test/2', 'article', 'http://a.test')])
+    frontier.mark('http://a.test/1', DONE, ('record',))
+    assert not frontier.maybe_checkpoint()
+    assert frontier.counts() == {}
+    # not written yet, but already known
+    assert frontier.completed(['http://a.test/1', 'http://a.test/2']) == {'http://a.test/1': ('record',)}
+
+    frontier.checkpoint_interval = 0
+    assert frontier.maybe_checkpoint()
+    frontier.mark('http://a.test/2', FAILED)
+    frontier.close()
+
+    frontier = CrawlFrontier(frontier.path)
+    assert frontier.counts() == {('article', DONE): 1, ('article', FAILED): 1}
+    assert frontier.pending() == ['http://a.test/2']
+    frontier.add([('http://a.test/1', 'article', 'http://a.test')])
+    frontier.checkpoint()
+    assert frontier.completed(['http://a.test/1']) == {'http://a.test/1': ('record',)}
+    frontier.clear()
+    assert frontier.counts() == {}
+
+
+def test_crawl_resumes_from_the_frontier(monkeypatch, tmp_path):
+    requested = []
+    down = {'/story-2.html'}
+
+    def handler(request: httpx.Request):
+        requested.append(request.url.path)
+        body = article_body(request.url.path)
+        if body is None or request.url.path in down:
+            return httpx.Response(404, text='not found')
+        return httpx.Response(200, text=body, headers={'content-type': 'text/html; charset=utf-8'})
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    path = str(tmp_path / 'crawl.frontier')
+
+    async def crawl(sources):
+        pool = AsyncNewsPool(frontier=CrawlFrontier(path))
+        await pool.async_set(sources, parse=True)
+        await pool.async_join()
+        pool.frontier.close()
+
+    anyio.run(crawl, make_sources('http://a.test'))
+    assert sorted(requested) == ['/missing-3.html', '/short-4.html', '/story-1.html', '/story-2.html']
+
+    # the next run only fetches what failed, and has all the articles
+    requested.clear()
+    down.clear()
+    sources = make_sources('http://a.test')
+    anyio.run(crawl, sources)
+    assert sorted(requested) == ['/missing-3.html', '/short-4.html', '/story-2.html']
+    check_sources(sources, parse=True)
+
+    async def stream():
+        pool = AsyncNewsPool(frontier=CrawlFrontier(path))
+        async with pool.async_iter_completed(make_sources('http://a.test'), parse=True) as stream:
+            return [a async for a in stream]
+
+    requested.clear()
+    assert sorted(a.url for a in anyio.run(stream)) == ['http://a.test/story-1.html', 'http://a.test/story-2.html']
+    assert sorted(requested) == ['/missing-3.html', '/short-4.html']
+
+
+def test_leaving_the_stream_early_checkpoints(monkeypatch, tmp_path):
+    async def handler(request: httpx.Request):
+        # never answers, only a cancel gets past it
+        if request.url.path != '/story-1.html':
+            await anyio.Event().wait()
+        return httpx.Response(200, text=article_body(request.url.path),
+                              headers={'content-type': 'text/html; charset=utf-8'})
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    path = str(tmp_path / 'crawl.frontier')
+
+    async def first_article():
+        pool = AsyncNewsPool(frontier=CrawlFrontier(path, checkpoint_interval=60))
+        with anyio.fail_after(5):
+            async with pool.async_iter_completed(make_sources('http://a.test'), parse=True) as stream:
+                async for article in stream:
+                    return article
+
+    assert anyio.run(first_article).url == 'http://a.test/story-1.html'
+    assert CrawlFrontier(path).completed(['http://a.test/story-1.html'])
+
+
+def test_built_sources_are_restored(monkeypatch, tmp_path):
+    def handler(request: httpx.Request):
+        raise AssertionError('restored sources are not fetched')
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    frontier = CrawlFrontier(str(tmp_path / 'crawl.frontier'))
+    frontier.add([('http://a.test', 'source', 'http://a.test')])
+    frontier.mark('http://a.test', DONE, (['http://a.test/world'], ['http://a.test/rss'],
+                                          [('http://a.test/story-1.html', 'Story 1')]))
+    source = AsyncSource('http://a.test', memoize_articles=False)
+    anyio.run(AsyncNewsPool(frontier=frontier).async_build_sources, [source])
+    assert [c.url for c in source.categories] == ['http://a.test/world']
+    assert [f.url for f in source.feeds] == ['http://a.test/rss']
+    assert [(a.url, a.title) for a in source.articles] == [('http://a.test/story-1.html', 'Story 1')]
+    assert frontier.counts() == {('source', DONE): 1}
@@ -0,0 +1,110 @@
+import functools
+import time
+
+import anyio
+import httpx
+import pytest
+
+from newz import network
+from newz.article import AsyncArticle, guard_html
+from newz.configuration import Configuration
+from newz.mthreading import async_crawl_articles
+from newz.utils.executor import Stage
+from newz.utils.helpers import timelimit
+
+from test_pool import make_article_html
+
+
+def test_guard_html_truncates():
+    config = Configuration()
+    html = make_article_html(1)
+    assert guard_html(html, config) == (html, [])
+
+    config.MAX_HTML_BYTES = 1000
+    cut, truncated = guard_html(html, config)
+    assert truncated == ['bytes'] and len(cut) <= 1000 and html.startswith(cut) and cut.endswith('>')
+
+    config = Configuration()
+    config.MAX_DOM_NODES = 100
+    many = '<html><body>%s</body></html>' % ''.join('<p>paragraph %d</p>' % i for i in range(1000))
+    cut, truncated = guard_html(many, config)
+    assert truncated == ['nodes'] and 'paragraph 97' in cut and 'paragraph 98' not in cut
+
+    config = Configuration()
+    deep = '<html><body>%s<p>%s</p>%s</body></html>' % ('<div>' * 2000, 'deep text', '</div>' * 2000)
+    cut, truncated = guard_html(deep, config)
+    assert truncated == ['depth'] and 'deep text' not in cut and cut.count('<div>') < 300
+
+    article = AsyncArticle('http://a.test/deep.html', config=config)
+    article.set_html(deep)
+    article.parse()
+    assert article.is_parsed and article.truncated == ['depth']
+
+
+def test_timelimit():
+    @timelimit(0.5)
+    def quick(value):
+        return value
+
+    @timelimit(0.05)
+    def slow():
+        time.sleep(1)
+
+    @timelimit(0.5)
+    def broken():
+        raise KeyError('broken')
+
+    assert quick(3) == 3
+    with pytest.raises(TimeoutError):
+        slow()
+    with pytest.raises(KeyError):
+        broken()
+
+
+def test_crawl_drops_articles_over_their_deadline(monkeypatch):
+    async def handler(request: httpx.Request):
+        if 'slow' in request.url.path:
+            await anyio.sleep(5)
+        return httpx.Response(200, text=make_article_html(1), headers={'content-type': 'text/html'})
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    config = Configuration()
+    config.article_deadline = 0.2
+    articles = [AsyncArticle('http://a.test/%s.html' % name, config=config) for name in ('quick', 'slow')]
+    start = time.monotonic()
+    anyio.run(async_crawl_articles, articles, config, 2, True)
+    assert time.monotonic() - start < 2
+    assert articles[0].valid_body and not articles[1].html and articles[1].valid_body is False
+    assert 'deadline' in articles[1].download_exception_msg
+
+
+def stubborn(seconds):
+    """Ignores the first interruption"""
+    try:
+        time.sleep(seconds)
+    except TimeoutError:
+        time.sleep(seconds)
+
+
+def test_process_calls_over_the_deadline_are_stopped():
+    stage = Stage('test', 1, 'process')
+
+    async def call(func, seconds):
+        with anyio.move_on_after(0.3):
+            await stage.run(func, seconds)
+        # the call keeps the worker until it is interrupted or killed
+        await anyio.sleep(1.5)
+
+    try:
+        # warm up the worker process
+        assert anyio.run(stage.run, pow, 2, 3) == 8
+        executor = stage.executor
+        anyio.run(call, time.sleep, 10)
+        assert stage.executor is executor and stage.killed == 0
+        anyio.run(call, stubborn, 10)
+        assert stage.executor is None and stage.killed == 1
+        assert anyio.run(stage.run, pow, 2, 3) == 8
+        assert stage.metrics()['failed'] == 2
+    finally:
+        stage.shutdown()
@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ('newspaper', 'nltk', 'bs4', 'httpx', 'feedparser', 'anyio', 'lxml')
+
+
+def test_import_is_lazy_and_side_effect_free(tmp_path):
+    code = 'import sys, newz; print(",".join(m for m in %r if m in sys.modules))' % (HEAVY_MODULES,)
+    env = dict(os.environ, TMPDIR=str(tmp_path))
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
+    assert os.listdir(tmp_path) == []
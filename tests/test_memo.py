@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from newz import settings
+from newz.configuration import Configuration
+from newz.utils import helpers
+from newz.utils.bloom import BloomFilter
+from newz.utils.memo import SeenStore
+
+
+class FakeArticle(object):
+    def __init__(self, url):
+        self.url = url
+
+
+class FakeSource(object):
+    def __init__(self, domain):
+        self.domain = domain
+        self.config = Configuration()
+
+
+def test_add_many_and_expiry(tmp_path):
+    store = SeenStore(str(tmp_path.joinpath('a.sqlite')))
+    assert store.add_many(['u1', 'u2', 'u2']) == set()
+    assert store.add_many(['u2', 'u3']) == {'u2'}
+    assert store.contains_many(['u1', 'u3', 'u4']) == {'u1', 'u3'}
+    assert len(store) == 3
+
+    store.trim(2)
+    assert len(store) == 2
+    assert store.expire(-1) == 2
+    assert len(store) == 0
+
+
+def test_concurrent_writers_claim_each_url_once(tmp_path):
+    path = str(tmp_path.joinpath('b.sqlite'))
+    urls = ['http://x.test/%d' % i for i in range(200)]
+    claimed = []
+
+    def crawl():
+        store = SeenStore(path)
+        seen = store.add_many(urls)
+        claimed.extend(u for u in urls if u not in seen)
+        store.close()
+
+    threads = [threading.Thread(target=crawl) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(claimed) == sorted(urls)
+
+
+def test_clear_closes_every_thread_connection(tmp_path):
+    path = str(tmp_path.joinpath('c.sqlite'))
+    store = SeenStore(path)
+    store.add_many(['u1'])
+    cleared, done = threading.Event(), threading.Event()
+    results = {}
+
+    def crawl():
+        store.add_many(['u2'])
+        results['conn'] = store._local.conn
+        cleared.wait(5)
+        # reconnects to the new database
+        results['seen'] = store.add_many(['u1', 'u2'])
+        done.set()
+
+    thread = threading.Thread(target=crawl)
+    thread.start()
+    while 'conn' not in results:
+        thread.join(0.01)
+    store.clear()
+    assert not any(os.path.exists(path + suffix) for suffix in ('', '-wal', '-shm'))
+    cleared.set()
+    thread.join()
+    assert done.is_set() and results['seen'] == set()
+    with pytest.raises(sqlite3.ProgrammingError):
+        results['conn'].execute('SELECT 1')
+    assert len(store) == 2
+
+
+def test_memoize_articles_imports_legacy_memo(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'MEMO_DIR', str(tmp_path))
+    monkeypatch.setattr(settings, 'SEEN_FILTER', str(tmp_path.joinpath('seen.bloom')))
+    source = FakeSource('legacy.test')
+    legacy_path = tmp_path.joinpath(helpers.domain_to_filename(source.domain))
+    legacy_path.write_text('http://legacy.test/old\r\nhttp://legacy.test/nav')
+
+    articles = [FakeArticle(u) for u in ('http://legacy.test/nav', 'http://legacy.test/new')]
+    assert [a.url for a in helpers.memoize_articles(source, articles)] == ['http://legacy.test/new']
+    assert not os.path.exists(legacy_path)
+    assert helpers.memoize_articles(source, articles) == []
+
+    helpers.clear_memo_cache(source)
+    assert len(helpers.memoize_articles(source, articles)) == 2
+
+
+def test_bloom_filter_has_no_false_negatives(tmp_path):
+    path = str(tmp_path.joinpath('f.bloom'))
+    bloom = BloomFilter(path, capacity=1000, error_rate=0.01)
+    added = ['http://x.test/%d' % i for i in range(1000)]
+    assert len(bloom.add_many(added)) < 30
+    assert bloom.contains_many(added) == added
+    assert bloom.add_many(added) == added
+    # items that were false positives on the way in aren't counted
+    assert 970 < bloom.count <= 1000 and not bloom.is_saturated
+
+    false_positives = bloom.contains_many('http://y.test/%d' % i for i in range(10000))
+    assert len(false_positives) < 300
+
+    # a second mapping of the same file sees the same bits
+    reopened = BloomFilter(path)
+    assert reopened.filter_id == bloom.filter_id and reopened.num_bits == bloom.num_bits
+    assert 'http://x.test/999' in reopened
+
+
+def test_store_backfills_and_uses_bloom_front(tmp_path):
+    path = str(tmp_path.joinpath('c.sqlite'))
+    plain = SeenStore(path)
+    plain.add_many(['u1', 'u2'])
+    plain.close()
+
+    bloom = BloomFilter(str(tmp_path.joinpath('c.bloom')), capacity=1000, error_rate=0.01)
+    store = SeenStore(path, bloom=bloom)
+    assert store.add_many(['u1', 'u3']) == {'u1'}
+    assert bloom.contains_many(['u1', 'u2', 'u3']) == ['u1', 'u2', 'u3']
+    assert store.contains_many(['u2', 'u4']) == {'u2'}
+    store.close()
+
+    # already synced with this filter, nothing is added again
+    count = bloom.count
+    assert SeenStore(path, bloom=bloom).contains_many(['u3']) == {'u3'}
+    assert bloom.count == count
+
+
+def test_unfiltered_writes_are_backfilled_into_the_filter(tmp_path):
+    path = str(tmp_path.joinpath('d.sqlite'))
+    bloom = BloomFilter(str(tmp_path.joinpath('d.bloom')), capacity=1000, error_rate=0.01)
+    try:
+        store = SeenStore.get(path, bloom=bloom)
+        assert store.add_many(['u1']) == set()
+
+        # a run without the filter takes the same store object
+        assert SeenStore.get(path) is store and store.bloom is None
+        assert store.add_many(['u2']) == set()
+
+        # the filter is attached again, and backfilled with u2
+        assert SeenStore.get(path, bloom=bloom).add_many(['u2', 'u3']) == {'u2'}
+        store.close()
+
+        # the same across processes: fresh store objects
+        plain = SeenStore(path)
+        plain.add_many(['u4'])
+        plain.close()
+        assert SeenStore(path, bloom=bloom).contains_many(['u4', 'u5']) == {'u4'}
+    finally:
+        SeenStore._stores.pop(path, None)
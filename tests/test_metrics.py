@@ -0,0 +1,128 @@
+import functools
+import json
+import threading
+
+from http.server import ThreadingHTTPServer
+
+import anyio
+import httpx
+import pytest
+
+from newz import network, nlp
+from newz import source as source_module
+from newz.configuration import Configuration
+from newz.mthreading import AsyncNewsPool
+from newz.source import AsyncSource
+from newz.utils import metrics
+from newz.utils.metrics import Metrics, to_prometheus
+
+from test_pool import ArticleHandler, make_sources
+from test_source import SITE, make_site
+
+
+@pytest.fixture
+def registry():
+    metrics.registry.reset()
+    yield metrics.registry
+    metrics.disable()
+    metrics.registry.reset()
+
+
+def series(snapshot, kind, name, **labels):
+    return [s for s in snapshot[kind].get(name, []) if labels.items() <= s['labels'].items()]
+
+
+def test_registry():
+    registry = Metrics()
+    registry.inc('newz_requests_total', domain='a.test', status='200')
+    registry.observe('newz_stage_seconds', 0.02, stage='parse', domain='a.test')
+    assert registry.counters == {} and registry.histograms == {}
+
+    registry.enabled = True
+    for seconds in (0.002, 0.02, 0.02, 40):
+        registry.observe('newz_stage_seconds', seconds, stage='parse', domain='a.test')
+    registry.inc('newz_requests_total', domain='a.test', status='200')
+    registry.inc('newz_requests_total', domain='b.test', status='404')
+    other = Metrics()
+    other.enabled = True
+    other.inc('newz_requests_total', 2, domain='a.test', status='200')
+    registry.merge(other.collect())
+    assert other.counters == {}
+
+    snapshot = registry.snapshot(domains=['a.test'], gauges={'newz_fetch_active': [({}, 3)]})
+    assert snapshot['counters']['newz_requests_total'] == [
+        {'labels': {'domain': 'a.test', 'status': '200'}, 'value': 3}]
+    parse, = snapshot['histograms']['newz_stage_seconds']
+    assert parse['count'] == 4 and dict(map(tuple, parse['buckets']))[0.025] == 3
+    assert parse['buckets'][-1] == ['+Inf', 4]
+    assert json.loads(registry.export('json'))['counters']['newz_requests_total'][1]['value'] == 1
+
+    text = to_prometheus(snapshot).splitlines()
+    assert '# TYPE newz_stage_seconds histogram' in text and 'newz_fetch_active 3' in text
+    assert 'newz_requests_total{domain="a.test",status="200"} 3' in text
+    assert 'newz_stage_seconds_bucket{domain="a.test",stage="parse",le="0.025"} 3' in text
+    assert 'newz_stage_seconds_count{domain="a.test",stage="parse"} 4' in text
+    with pytest.raises(ValueError):
+        registry.export('xml')
+
+
+def test_pool_and_source_metrics(registry, monkeypatch):
+    # keywords and summary need the nltk data, only the timing matters here
+    monkeypatch.setattr(nlp, 'analyze', lambda *args: ([], []))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ArticleHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    site = 'http://127.0.0.1:%d' % server.server_address[1]
+    domain = metrics.domain_of(site)
+    try:
+        AsyncNewsPool()
+        make_sources(site + '/a')
+        # off until a config asks for it
+        assert not registry.enabled and registry.counters == {}
+
+        config = Configuration()
+        config.collect_metrics = True
+        pool = AsyncNewsPool(config)
+        assert registry.enabled
+
+        async def crawl(sources, processes):
+            await pool.async_set(sources, processes=processes, parse=True)
+            await pool.async_join()
+            await sources[0].articles[0].async_nlp()
+
+        sources = make_sources(site + '/a')
+        anyio.run(crawl, sources, 0)
+        # and the same from a worker process
+        anyio.run(crawl, make_sources(site + '/b'), 1)
+        pool.shutdown()
+
+        snapshot = pool.metrics()
+        assert series(snapshot, 'counters', 'newz_requests_total', status='200')[0]['value'] == 6
+        assert series(snapshot, 'counters', 'newz_requests_total', status='404')[0]['value'] == 2
+        assert series(snapshot, 'counters', 'newz_response_bytes_total', domain=domain)[0]['value'] > 4 * 7000
+        stages = {s['labels']['stage']: s['count'] for s in snapshot['histograms']['newz_stage_seconds']}
+        assert stages['request'] == stages['ttfb'] == stages['download'] == 8
+        assert stages['parse'] == 6 and stages['nlp'] == 2 and 1 <= stages['connect'] <= 8
+        assert {s['labels']['stage'] for s in snapshot['gauges']['newz_executor_queue_depth']} >= {'io', 'parse'}
+        assert 'newz_fetch_queue_depth 0' in pool.metrics('prometheus').splitlines()
+
+        assert sources[0].metrics()['counters'] == snapshot['counters']
+        other = AsyncSource('http://other.test')
+        assert json.loads(other.metrics('json'))['counters'] == {}
+    finally:
+        server.shutdown()
+
+
+def test_source_cache_metrics(registry, monkeypatch, tmp_path):
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(AsyncSource._async_get_category_urls.cache, 'directory', str(tmp_path))
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(make_site())))
+
+    for _ in range(2):
+        source = AsyncSource(SITE, memoize_articles=False, collect_metrics=True)
+        anyio.run(source.async_build)
+    lookups = {(s['labels']['cache'], s['labels']['result']): s['value']
+               for s in source.metrics()['counters']['newz_cache_lookups_total']}
+    # the first build misses, the second one hits
+    assert lookups[('async_get_category_urls', 'miss')] == lookups[('async_get_category_urls', 'hit')] == 1
+    assert source.metrics()['counters']['newz_requests_total']
@@ -0,0 +1,218 @@
+import asyncio
+import functools
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import anyio
+import httpx
+import pytest
+
+from newz import network
+from newz.article import AsyncArticle
+from newz.configuration import Configuration
+from newz.mthreading import AsyncNewsPool, ConcurrencyException, _async_crawl_article, is_crawled
+from newz.source import AsyncSource
+from newz.utils.executor import Executor
+
+
+def make_article_html(index):
+    sentences = ' '.join('Sentence %d of story %d tells the readers about an important event.' % (i, index)
+                         for i in range(60))
+    return ('<html><head><title>Story %d</title></head><body><article><h1>Story %d</h1>'
+            '<p>%s</p><p>%s</p></article></body></html>' % (index, index, sentences, sentences))
+
+
+def article_body(path):
+    """Story pages for /story-<n>.html, a 404 for /missing-..., a page
+    without a body for /short-...
+    """
+    name = path.rsplit('/', 1)[1]
+    if name.startswith('missing'):
+        return None
+    if name.startswith('short'):
+        return '<html><body>too short</body></html>'
+    return make_article_html(int(name.split('-')[1].split('.')[0]))
+
+
+def make_sources(*sites):
+    sources = []
+    for site in sites:
+        source = AsyncSource(site, memoize_articles=False, fetch_images=False, http_success_only=True)
+        source.articles = [AsyncArticle(site + path, source_url=site, config=source.config)
+                           for path in ('/story-1.html', '/story-2.html', '/missing-3.html', '/short-4.html')]
+        sources.append(source)
+    return sources
+
+
+def check_sources(sources, parse):
+    for source in sources:
+        expected = ['/story-1.html', '/story-2.html'] + ([] if parse else ['/short-4.html'])
+        assert [a.url for a in source.articles] == [source.url + path for path in expected]
+        assert source.is_downloaded
+        if parse:
+            assert all('Sentence 59 of story' in a.text for a in source.articles)
+
+
+def test_pool_crawls_on_the_event_loop(monkeypatch):
+    def handler(request: httpx.Request):
+        body = article_body(request.url.path)
+        if body is None:
+            return httpx.Response(404, text='not found')
+        return httpx.Response(200, text=body, headers={'content-type': 'text/html; charset=utf-8'})
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    pool = AsyncNewsPool()
+    with pytest.raises(ConcurrencyException):
+        anyio.run(pool.async_join)
+
+    for parse in (False, True):
+        sources = make_sources('http://a.test', 'http://b.test')
+        lone = AsyncArticle('http://c.test/story-7.html')
+
+        async def run_test():
+            await pool.async_set(sources + [lone], override_threads=4, parse=parse)
+            await pool.async_join()
+
+        anyio.run(run_test)
+        check_sources(sources, parse)
+        assert 'Story 7' in lone.html
+
+
+
+def test_plain_articles_that_fail_to_parse_are_not_crawled():
+    class BrokenArticle(object):
+        url = 'http://a.test/broken.html'
+        config = Configuration()
+        html = '<html><body>broken</body></html>'
+
+        def download(self):
+            pass
+
+        def parse(self):
+            raise ValueError('broken')
+
+    assert not is_crawled(BrokenArticle(), parse=True)
+    article = BrokenArticle()
+    anyio.run(_async_crawl_article, article, None, True)
+    assert article.valid_body is False and not is_crawled(article, parse=True)
+
+
+def test_sync_api_runs_on_one_background_loop(monkeypatch):
+    clients = []
+
+    def handler(request: httpx.Request):
+        body = article_body(request.url.path)
+        if body is None:
+            return httpx.Response(404, text='not found')
+        return httpx.Response(200, text=body, headers={'content-type': 'text/html; charset=utf-8'})
+
+    make_client = network.get_async_client
+
+    def get_async_client(config=None, scheduler=None):
+        clients.append(make_client(config, scheduler, transport=httpx.MockTransport(handler)))
+        return clients[-1]
+
+    monkeypatch.setattr(network, 'get_async_client', get_async_client)
+    Executor.shutdown_loop()
+
+    async def where():
+        return threading.current_thread(), asyncio.get_running_loop()
+
+    assert len({Executor.run_as_sync(where) for _ in range(3)}) == 1
+    assert Executor.run_as_sync(where)[0] is not threading.current_thread()
+
+    for index in (1, 2):
+        article = AsyncArticle('http://c.test/story-%d.html' % index)
+        article.download()
+        assert 'Story %d' % index in article.html
+    sources = make_sources('http://a.test', 'http://b.test')
+    sources[0].download_articles(threads=2)
+    pool = AsyncNewsPool()
+    pool.set(sources[1:])
+    pool.join()
+    check_sources(sources, parse=False)
+    # the downloads shared one client, the pool used its own
+    assert len(clients) == 2 and not clients[0].is_closed and clients[1].is_closed
+
+    Executor.shutdown_loop()
+    assert clients[0].is_closed and Executor.loop is None
+
+def test_pool_streams_completed_articles(monkeypatch):
+    requested = []
+
+    def handler(request: httpx.Request):
+        requested.append(request.url.path)
+        body = article_body(request.url.path)
+        if body is None:
+            return httpx.Response(404, text='not found')
+        return httpx.Response(200, text=body, headers={'content-type': 'text/html; charset=utf-8'})
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    pool = AsyncNewsPool()
+
+    async def collect(**kwargs):
+        results = []
+        async with pool.async_iter_completed(**kwargs) as stream:
+            async for result in stream:
+                # never more stories downloaded than consumed, buffered and in flight
+                assert sum('story' in path for path in requested) <= len(results) + 1 + 2 + 1
+                results.append(result)
+                await anyio.sleep(0.01)
+        return results
+
+    sources = make_sources('http://a.test', 'http://b.test')
+    articles = anyio.run(lambda: collect(news_list=sources, parse=True, buffer_size=1))
+    assert sorted(a.url for a in articles) == sorted(
+        site + path for site in ('http://a.test', 'http://b.test') for path in ('/story-1.html', '/story-2.html'))
+    # handed to the consumer, not kept
+    assert all(s.articles == [] for s in sources)
+
+    requested.clear()
+    sources = make_sources('http://a.test', 'http://b.test')
+    assert anyio.run(lambda: collect(news_list=sources, by_source=True, buffer_size=1)) in (sources, sources[::-1])
+    check_sources(sources, parse=False)
+
+
+class ArticleHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = article_body(self.path)
+        self.send_response(404 if body is None else 200)
+        self.send_header('content-type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write((body or 'not found').encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def test_pool_crawls_in_worker_processes():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ArticleHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    site = 'http://127.0.0.1:%d' % server.server_address[1]
+    try:
+        sources = make_sources(site + '/a', site + '/b')
+
+        async def run_test():
+            async with AsyncNewsPool() as pool:
+                await pool.async_set(sources, processes=2, parse=True)
+                await pool.async_join()
+                assert pool.process_pool is not None
+            assert pool.process_pool is None
+
+        anyio.run(run_test)
+        check_sources(sources, parse=True)
+        # parsed in the worker, only the records came back
+        assert all(a.doc is None and a.valid_body for s in sources for a in s.articles)
+
+        async def stream():
+            async with AsyncNewsPool() as pool:
+                async with pool.async_iter_completed(make_sources(site + '/c'), processes=1) as stream:
+                    return [a async for a in stream]
+
+        assert sorted(a.url.rsplit('/', 1)[1] for a in anyio.run(stream)) == [
+            'short-4.html', 'story-1.html', 'story-2.html']
+    finally:
+        server.shutdown()
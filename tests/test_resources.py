@@ -0,0 +1,24 @@
+import os
+import pickle
+
+from newz import settings
+from newz.text import StopWords
+from newz.utils.resources import ResourceRegistry, build_index, compile_resources
+
+
+def test_index_matches_text_files(tmp_path):
+    path = build_index(str(tmp_path.joinpath('index.pickle')))
+    with open(path, 'rb') as f:
+        index = pickle.load(f)
+    assert index == compile_resources()
+
+    with open(os.path.join(settings.STOPWORDS_DIR, 'stopwords-de.txt'), encoding='utf-8') as f:
+        assert index['stopwords']['de'] == set(f.read().splitlines())
+    with open(settings.NLP_STOPWORDS_EN, encoding='utf-8') as f:
+        assert index['nlp_stopwords_en'] == set(w.strip() for w in f.readlines())
+
+
+def test_registry_is_shared():
+    assert StopWords('en').STOP_WORDS is StopWords('en').STOP_WORDS
+    assert StopWords('en').STOP_WORDS is ResourceRegistry.get_stopwords('en')
+    assert 'en' in ResourceRegistry.get_languages()
@@ -0,0 +1,117 @@
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import anyio
+import httpx
+
+from newz import network
+from newz.scheduler import FetchScheduler
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b'x' * 1000
+        self.send_response(200)
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_requests(scheduler, requests, duration=0.01):
+    """Runs (host, index) requests through `scheduler`, in that order,
+    returns the order they were granted in and the peak concurrency
+    overall and per host
+    """
+    granted = []
+    active = {}
+    peaks = {'all': 0}
+
+    async def request(host, index):
+        async with scheduler.slot(host):
+            granted.append((host, index, time.monotonic()))
+            active[host] = active.get(host, 0) + 1
+            peaks[host] = max(peaks.get(host, 0), active[host])
+            peaks['all'] = max(peaks['all'], sum(active.values()))
+            await anyio.sleep(duration)
+            active[host] -= 1
+
+    async def main():
+        async with anyio.create_task_group() as task_group:
+            for host, index in requests:
+                task_group.start_soon(request, host, index)
+                # keep the submission order
+                await anyio.sleep(0)
+
+    anyio.run(main)
+    return granted, peaks
+
+
+def test_small_hosts_are_not_starved():
+    scheduler = FetchScheduler(concurrency=3, domain_concurrency=2)
+    requests = [('big.test', i) for i in range(30)] + [('small.test', i) for i in range(3)]
+    granted, peaks = run_requests(scheduler, requests)
+    order = [host for host, _, _ in granted]
+    # the small host takes every other slot as soon as it queues
+    assert max(i for i, host in enumerate(order) if host == 'small.test') < 10
+    assert peaks['all'] == 3 and peaks['big.test'] == 2 and peaks['small.test'] <= 2
+    assert scheduler.active == 0 and not scheduler.backlogged
+
+
+def test_weights_and_rate_limits():
+    scheduler = FetchScheduler(concurrency=2, domain_concurrency=2)
+    scheduler.set_weight('heavy.test', 3)
+    requests = [('light.test', i) for i in range(20)] + [('heavy.test', i) for i in range(20)]
+    order = [host for host, _, _ in run_requests(scheduler, requests)[0]]
+    first = order[len(order) // 4:len(order) // 2]
+    assert first.count('heavy.test') >= 2 * first.count('light.test')
+
+    scheduler = FetchScheduler(concurrency=10, domain_concurrency=10, domain_rate=50)
+    granted, _ = run_requests(scheduler, [('polite.test', i) for i in range(6)], duration=0)
+    times = [t for _, _, t in granted]
+    # one request per 20ms, not all at once
+    assert times[-1] - times[0] >= 0.09
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.015
+
+
+def test_cancelled_requests_leave_the_queue():
+    scheduler = FetchScheduler(concurrency=1)
+
+    async def main():
+        async with scheduler.slot('a.test'):
+            with anyio.move_on_after(0.01):
+                await scheduler.acquire('a.test')
+            assert len(scheduler.hosts['a.test'].waiters) == 0
+        async with scheduler.slot('a.test'):
+            pass
+
+    anyio.run(main)
+    assert scheduler.active == 0
+
+
+def test_scheduled_client_releases_slots():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d/' % server.server_address[1]
+    scheduler = FetchScheduler(concurrency=2)
+
+    async def main():
+        mock = httpx.MockTransport(lambda request: httpx.Response(200, text='read'))
+        async with network.get_async_client(None, scheduler, transport=mock) as client:
+            assert (await client.get('http://a.test/')).text == 'read'
+            assert scheduler.active == 0
+        async with network.get_async_client(None, scheduler) as client:
+            async with client.stream('GET', url) as response:
+                # held until the body is read
+                assert scheduler.active == 1
+                await response.aread()
+            assert scheduler.active == 0
+
+    try:
+        anyio.run(main)
+    finally:
+        server.shutdown()
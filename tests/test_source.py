@@ -0,0 +1,302 @@
+import datetime
+import functools
+import gzip
+
+import anyio
+import httpx
+
+from newz import network
+from newz import source as source_module
+from newz.article import AsyncArticle
+from newz.source import AsyncSource
+
+SITE = 'http://pipeline.test'
+ARTICLE = SITE + '/2022/06/%02d/%s-story-about-something-important.html'
+
+
+def make_site():
+    pages = {
+        '/': '<html><head><title>Pipeline</title></head><body>'
+             '<a href="/world">World</a><a href="/sports">Sports</a></body></html>',
+        '/world': '<html><head><link rel="alternate" type="application/rss+xml" href="/world/rss.xml">'
+                  '</head><body>%s</body></html>' % ''.join(
+                      '<a href="%s">A world story number %d</a>' % (ARTICLE % (i, 'world'), i) for i in range(1, 6)),
+        # the top story is linked twice
+        '/sports': '<html><body><a href="%s">Top story</a>%s</body></html>' % (ARTICLE % (1, 'sports'), ''.join(
+            '<a href="%s">A sports story number %d</a>' % (ARTICLE % (i, 'sports'), i) for i in range(1, 4))),
+        '/rss': '<rss><channel><item><link>%s</link></item></channel></rss>' % (ARTICLE % (9, 'science')),
+        '/world/rss.xml': '<rss><channel>%s</channel></rss>' % ''.join(
+            '<item><link>%s</link></item>' % (ARTICLE % (i, 'economy')) for i in range(1, 3)),
+    }
+
+    def handler(request: httpx.Request):
+        handler.requested.append(request.url.path)
+        body = pages.get(request.url.path)
+        if body is None:
+            return httpx.Response(404, text='not found')
+        content_type = 'application/rss+xml' if body.startswith('<rss') else 'text/html'
+        return httpx.Response(200, text=body, headers={'content-type': content_type + '; charset=utf-8'})
+    handler.requested = []
+    handler.pages = pages
+    return handler
+
+
+def test_pipelined_build(monkeypatch, tmp_path):
+    handler = make_site()
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(AsyncSource._async_get_category_urls.cache, 'directory', str(tmp_path))
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+
+    source = AsyncSource(SITE, memoize_articles=False)
+    batches = []
+
+    async def run_test():
+        async with source.async_iter_articles() as stream:
+            async for batch in stream:
+                batches.append(batch)
+
+    anyio.run(run_test)
+    urls = [a.url for batch in batches for a in batch]
+    assert len(urls) == len(set(urls))
+    assert {ARTICLE % (1, 'world'), ARTICLE % (3, 'sports'), ARTICLE % (2, 'economy')} <= set(urls)
+    assert ARTICLE % (9, 'science') in urls
+    assert sorted(f.url for f in source.feeds) == [SITE + '/rss', SITE + '/world/rss.xml']
+    assert all(c.doc is not None for c in source.categories)
+
+    # the second build starts from the cached feed urls, without probing
+    handler.requested.clear()
+    rebuilt = AsyncSource(SITE, memoize_articles=False)
+    anyio.run(rebuilt.async_build)
+    assert sorted(a.url for a in rebuilt.articles) == sorted(urls)
+    assert '/feed' not in handler.requested and '/world/rss.xml' in handler.requested
+
+
+def test_leaving_the_stream_early_cancels_discovery(monkeypatch, tmp_path):
+    handler = make_site()
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(AsyncSource._async_get_category_urls.cache, 'directory', str(tmp_path))
+
+    async def stalled_handler(request: httpx.Request):
+        # never answers, only a cancel gets past it
+        if request.url.path == '/sports':
+            await anyio.Event().wait()
+        return handler(request)
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(stalled_handler)))
+    source = AsyncSource(SITE, memoize_articles=False)
+
+    async def first_batch():
+        with anyio.fail_after(5):
+            async with source.async_iter_articles() as stream:
+                async for batch in stream:
+                    return batch
+
+    async def until_timeout():
+        with anyio.fail_after(5):
+            with anyio.move_on_after(0.2) as scope:
+                async with source.async_iter_articles() as stream:
+                    async for _ in stream:
+                        pass
+        return scope.cancelled_caught
+
+    assert anyio.run(first_batch)
+    assert anyio.run(until_timeout)
+
+
+def test_xhtml_pages_are_not_probed_as_feeds(monkeypatch, tmp_path):
+    handler = make_site()
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(AsyncSource._async_get_category_urls.cache, 'directory', str(tmp_path))
+
+    def xhtml_handler(request: httpx.Request):
+        if request.url.path == '/feed':
+            return httpx.Response(200, text='<html><body><a href="/world">World</a></body></html>',
+                                  headers={'content-type': 'application/xhtml+xml; charset=utf-8'})
+        return handler(request)
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(xhtml_handler)))
+    source = AsyncSource(SITE, memoize_articles=False)
+    anyio.run(source.async_build)
+    assert sorted(f.url for f in source.feeds) == [SITE + '/rss', SITE + '/world/rss.xml']
+
+
+def test_lean_build_drops_page_buffers(monkeypatch, tmp_path):
+    handler = make_site()
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(AsyncSource._async_get_category_urls.cache, 'directory', str(tmp_path))
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+
+    source = AsyncSource(SITE, memoize_articles=False, lean_source=True)
+    anyio.run(source.async_build)
+    assert len(source.articles) == 11
+    assert sorted(f.url for f in source.feeds) == [SITE + '/rss', SITE + '/world/rss.xml']
+    assert len(source.categories) == 3
+    assert source.doc is None
+    assert all(c.released and c.html is None and c.doc is None for c in source.categories)
+    assert all(f.released and f.rss is None for f in source.feeds)
+
+
+def make_article_html(index):
+    sentences = ' '.join('Sentence %d of story %d tells the readers about an important event.' % (i, index)
+                         for i in range(60))
+    return ('<html><head><title>Story %d</title><meta property="og:type" content="article"></head>'
+            '<body><article><h1>Story %d</h1><p>%s</p><p>%s</p></article></body></html>'
+            % (index, index, sentences, sentences))
+
+
+def test_parse_articles_concurrently_and_purges(monkeypatch, tmp_path):
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    for backend in ('thread', 'process'):
+        source = AsyncSource(SITE, memoize_articles=False, fetch_images=False)
+        source.articles = []
+        for i in range(6):
+            article = AsyncArticle(ARTICLE % (i + 1, 'world'), source_url=SITE, config=source.config)
+            article.set_html(make_article_html(i) if i % 3 else '<html><body>too short</body></html>')
+            source.articles.append(article)
+        progress = []
+
+        anyio.run(lambda: source.async_parse_articles(limit=3, backend=backend,
+                                                      progress=lambda done, total: progress.append((done, total))))
+        assert [a.url for a in source.articles] == [ARTICLE % (i + 1, 'world') for i in (1, 2, 4, 5)]
+        assert all('Sentence 59 of story' in a.text for a in source.articles)
+        assert progress[-1] == (6, 6) and len(progress) == 6
+
+
+def test_refresh_only_yields_new_links(monkeypatch, tmp_path):
+    handler = make_site()
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(AsyncSource._async_get_category_urls.cache, 'directory', str(tmp_path))
+
+    def conditional_handler(request: httpx.Request):
+        response = handler(request)
+        # the feeds support conditional requests, the categories don't
+        if request.url.path.endswith(('rss', '.xml')):
+            etag = '"%d"' % hash(response.text)
+            if request.headers.get('if-none-match') == etag:
+                return httpx.Response(304)
+            response.headers['etag'] = etag
+        return response
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(conditional_handler)))
+
+    async def collect(context):
+        async with context as stream:
+            return [a.url for batch in [b async for b in stream] for a in batch]
+
+    source = AsyncSource(SITE, memoize_articles=False)
+    built = anyio.run(collect, source.async_iter_articles())
+    assert len(built) == 11
+
+    handler.requested.clear()
+    assert anyio.run(collect, source.async_refresh()) == []
+    # the homepage is a category too
+    assert sorted(handler.requested) == ['/', '/rss', '/sports', '/world', '/world/rss.xml']
+
+    new_url = ARTICLE % (7, 'world')
+    world = handler.pages['/world']
+    handler.pages['/world'] = world.replace('</body>', '<a href="%s">A new world story</a></body>' % new_url)
+    assert anyio.run(collect, source.async_refresh()) == [new_url]
+
+    # a new process picks the page states up from disk
+    assert anyio.run(collect, AsyncSource(SITE, memoize_articles=False).async_refresh()) == []
+
+
+def test_sitemap_discovery(monkeypatch, tmp_path):
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    today = datetime.date.today().isoformat()
+    fresh = [ARTICLE % (i, 'sitemap') for i in range(1, 4)]
+    urlset = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">%s%s</urlset>' % (
+        ''.join('<url><loc>%s</loc><lastmod>%s</lastmod></url>' % (url, today) for url in fresh),
+        '<url><loc>%s</loc><lastmod>2001-01-01</lastmod></url>' % (ARTICLE % (9, 'archived')))
+    files = {
+        '/robots.txt': b'User-agent: *\nSitemap: ' + SITE.encode() + b'/sitemap_index.xml\n',
+        '/sitemap_index.xml': ('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                               '<sitemap><loc>%s/news.xml.gz</loc><lastmod>%s</lastmod></sitemap>'
+                               '<sitemap><loc>%s/2001.xml</loc><lastmod>2001-01-31</lastmod></sitemap>'
+                               '</sitemapindex>' % (SITE, today, SITE)).encode(),
+        '/news.xml.gz': gzip.compress(urlset.encode()),
+    }
+    requested = []
+
+    def handler(request: httpx.Request):
+        requested.append(request.url.path)
+        if request.url.path not in files:
+            return httpx.Response(404, text='not found')
+        return httpx.Response(200, content=files[request.url.path])
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    source = AsyncSource(SITE, memoize_articles=False, discovery='sitemaps')
+    anyio.run(source.async_build)
+    assert sorted(a.url for a in source.articles) == fresh
+    assert source.sitemaps == [SITE + '/sitemap_index.xml', SITE + '/news.xml.gz']
+    assert sorted(requested) == ['/news.xml.gz', '/robots.txt', '/sitemap_index.xml']
+
+
+def test_refresh_refetches_sitemaps(monkeypatch, tmp_path):
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    entries = [ARTICLE % (i, 'sitemap') for i in range(1, 3)]
+    requested = []
+
+    def handler(request: httpx.Request):
+        requested.append(request.url.path)
+        if request.url.path != '/sitemap.xml':
+            return httpx.Response(404, text='not found')
+        body = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">%s</urlset>' % ''.join(
+            '<url><loc>%s</loc></url>' % url for url in entries)
+        etag = '"%d"' % len(entries)
+        if request.headers.get('if-none-match') == etag:
+            return httpx.Response(304)
+        return httpx.Response(200, text=body, headers={'etag': etag, 'content-type': 'application/xml'})
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+
+    async def collect(context):
+        async with context as stream:
+            return [a.url for batch in [b async for b in stream] for a in batch]
+
+    source = AsyncSource(SITE, memoize_articles=False, discovery='sitemaps')
+    assert sorted(anyio.run(collect, source.async_iter_articles())) == entries
+    assert source.page_states[SITE + '/sitemap.xml'].is_sitemap
+    # no sitemap in robots.txt, the common locations are probed in order
+    assert requested == ['/robots.txt', '/news-sitemap.xml', '/sitemap_news.xml', '/sitemap_index.xml',
+                         '/sitemap.xml']
+
+    # unchanged, answered with a 304
+    requested.clear()
+    assert anyio.run(collect, source.async_refresh()) == []
+    assert requested == ['/sitemap.xml']
+
+    entries.append(ARTICLE % (3, 'sitemap'))
+    assert anyio.run(collect, source.async_refresh()) == [ARTICLE % (3, 'sitemap')]
+    # a new process picks the sitemap up from disk
+    fresh = AsyncSource(SITE, memoize_articles=False, discovery='sitemaps')
+    assert anyio.run(collect, fresh.async_refresh()) == []
+    assert fresh.sitemaps == [SITE + '/sitemap.xml']
+
+
+def test_sitemap_probes_stop_at_the_first_sitemap(monkeypatch, tmp_path):
+    monkeypatch.setattr(source_module, 'ANCHOR_DIRECTORY', str(tmp_path))
+    urlset = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"><url><loc>%s</loc></url></urlset>'
+    files = {'/sitemap_news.xml': urlset % (ARTICLE % (1, 'news')), '/sitemap.xml': urlset % (ARTICLE % (2, 'all'))}
+    requested = []
+
+    def handler(request: httpx.Request):
+        requested.append(request.url.path)
+        if request.url.path not in files:
+            return httpx.Response(404, text='not found')
+        return httpx.Response(200, text=files[request.url.path])
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    source = AsyncSource(SITE, memoize_articles=False, discovery='sitemaps')
+    anyio.run(source.async_build)
+    assert [a.url for a in source.articles] == [ARTICLE % (1, 'news')]
+    assert source.sitemaps == [SITE + '/sitemap_news.xml']
+    assert requested == ['/robots.txt', '/news-sitemap.xml', '/sitemap_news.xml']
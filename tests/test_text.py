@@ -0,0 +1,61 @@
+from newz.configuration import Configuration
+from newz.text import RepeatedWords, StopWords, StopWordsHindi, StopWordsKorean, SuffixTrie
+
+
+def test_punctuation_and_case():
+    ws = StopWords('en').get_stopword_count('The cat, AND the hat!')
+    assert ws.get_word_count() == 5
+    assert ws.get_stopword_count() == 3
+    assert ws.get_stop_words() == ['the', 'and', 'the']
+    assert StopWords('en').get_stopword_count('').get_word_count() == 0
+
+
+def test_suffix_trie_counts_every_matching_suffix():
+    trie = SuffixTrie({'a', 'ba', 'cba', 'x'})
+    assert trie.count_suffixes('dcba') == 3
+    assert trie.count_suffixes('ab') == 0
+    assert SuffixTrie({''}).count_suffixes('anything') == 1
+
+
+def test_korean_and_hindi_match_legacy_counts():
+    ko = StopWordsKorean()
+    text = ' '.join('가%s' % w for w in sorted(ko.STOP_WORDS)[:20]) + ' 없음'
+    expected = sum(1 for w in text.split(' ') for s in ko.STOP_WORDS if w.endswith(s))
+    assert ko.get_stopword_count(text).get_stopword_count() == expected
+
+    hi = StopWordsHindi()
+    ws = hi.get_stopword_count('एक दो तीन')
+    assert ws.get_stopword_count() == 3 * len(hi.STOP_WORDS)
+    assert ws.get_stop_words() == list(hi.STOP_WORDS) * 3
+
+
+def test_repeated_words_read_like_the_list():
+    repeated, expected = RepeatedWords(['a', 'b', 'c'], 3), ['a', 'b', 'c'] * 3
+    assert repeated == expected and list(repeated) == expected
+    assert [repeated[i] for i in range(-9, 9)] == [expected[i] for i in range(-9, 9)]
+    assert repeated[2:8:2] == expected[2:8:2]
+    assert repeated.count('b') == 3 and 'c' in repeated and RepeatedWords(['a'], 0) == []
+
+
+def test_batch_counts():
+    stopwords = Configuration.get_stopwords_class('ko')()
+    contents = ['', '나는 학교에 간다', '그리고 그래서']
+    batch = stopwords.get_stopword_counts(contents)
+    assert [ws.get_stopword_count() for ws in batch] == \
+        [stopwords.get_stopword_count(c).get_stopword_count() for c in contents]
+
+
+def test_segmenters_are_reused_per_thread():
+    import threading
+    from newz.text import Segmenters, StopWordsArabic, stem_arabic
+
+    assert Segmenters.isri_stemmer() is Segmenters.isri_stemmer()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(Segmenters.isri_stemmer()))
+    thread.start()
+    thread.join()
+    assert other[0] is not Segmenters.isri_stemmer()
+
+    words = StopWordsArabic().candidate_words('الكتاب والقلم')
+    assert words == [Segmenters.isri_stemmer().stem(w) for w in ('الكتاب', 'والقلم')]
+    assert stem_arabic.cache_info().hits + stem_arabic.cache_info().misses >= 2
@@ -0,0 +1,116 @@
+import functools
+import json
+import pstats
+import tracemalloc
+
+import anyio
+import httpx
+
+from newz import network
+from newz.configuration import Configuration
+from newz.mthreading import AsyncNewsPool, async_crawl_articles
+from newz.tracing import TraceRecorder
+
+from test_pool import article_body, check_sources, make_sources
+
+
+def handler_with_redirect(slow: str):
+    async def handler(request: httpx.Request):
+        if request.url.path.endswith('/story-2.html'):
+            return httpx.Response(302, headers={'location': request.url.path.replace('story-2', 'story-22')})
+        if slow in request.url.path:
+            await anyio.sleep(0.5)
+        body = article_body(request.url.path)
+        if body is None:
+            return httpx.Response(404, text='not found')
+        return httpx.Response(200, text=body, headers={'content-type': 'text/html; charset=utf-8'})
+    return handler
+
+
+def read_traces(path):
+    with open(path) as f:
+        return {item['url'].rsplit('/', 1)[1]: item for item in map(json.loads, f)}
+
+
+def test_pool_traces_articles_and_captures_slow_ones(monkeypatch, tmp_path):
+    handler = handler_with_redirect('story-1')
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    recorder = TraceRecorder(str(tmp_path / 'traces.jsonl'), slow_seconds=0.4)
+    sources = make_sources('http://a.test')
+
+    async def crawl():
+        async with AsyncNewsPool(recorder=recorder) as pool:
+            await pool.async_set(sources, override_threads=2, parse=True)
+            await pool.async_join()
+
+    anyio.run(crawl)
+    recorder.close()
+    check_sources(sources, parse=True)
+    assert all(a.trace is None for a in sources[0].articles)
+
+    traces = read_traces(tmp_path / 'traces.jsonl')
+    assert sorted(traces) == ['missing-3.html', 'short-4.html', 'story-1.html', 'story-2.html']
+    names = [span['name'] for span in traces['story-2.html']['spans']]
+    assert names[:4] == ['queued', 'fetch', 'redirect', 'decode'] and 'parse.calculate_best_node' in names
+    assert names.index('parse') < names.index('parse.guard')
+    fetch = traces['story-2.html']['spans'][1]
+    assert fetch['status'] == 200 and fetch['duration'] >= traces['story-2.html']['spans'][2]['duration']
+    assert [s['name'] for s in traces['missing-3.html']['spans']] == ['queued', 'fetch', 'decode']
+
+    # only the slow one was captured
+    assert [name for name, item in traces.items() if 'capture' in item] == ['story-1.html']
+    capture = traces['story-1.html']['capture']
+    with open(capture['html']) as f:
+        assert 'Sentence 59 of story 1' in f.read()
+    assert any('guard_html' in function for _, _, function in pstats.Stats(capture['profile']).stats)
+    with open(capture['memory']) as f:
+        assert f.readline().strip() == sources[0].articles[0].url
+
+
+def test_memory_threshold(monkeypatch, tmp_path):
+    monkeypatch.setattr(network, 'get_async_client', functools.partial(
+        network.get_async_client, transport=httpx.MockTransport(handler_with_redirect('none'))))
+    assert not tracemalloc.is_tracing()
+    recorder = TraceRecorder(str(tmp_path / 'traces.jsonl'), memory_threshold=1000, max_captures=1,
+                             capture_directory=str(tmp_path / 'big'))
+    assert tracemalloc.is_tracing()
+    sources = make_sources('http://a.test')
+
+    async def crawl():
+        pool = AsyncNewsPool(recorder=recorder)
+        await pool.async_set(sources, parse=True)
+        await pool.async_join()
+
+    anyio.run(crawl)
+    recorder.close()
+    assert not tracemalloc.is_tracing()
+    traces = read_traces(tmp_path / 'traces.jsonl')
+    assert traces['story-1.html']['memory'] > 1000
+    # the stories are over the threshold, but one capture at most
+    assert sum('capture' in item for item in traces.values()) == 1
+    assert len(list((tmp_path / 'big').glob('*.html'))) == 1
+
+
+def test_cancelled_crawls_still_write_their_traces(monkeypatch, tmp_path):
+    async def handler(request: httpx.Request):
+        # never answers, only a cancel gets past it
+        if request.url.path.endswith('/story-2.html'):
+            await anyio.Event().wait()
+        return httpx.Response(200, text=article_body(request.url.path) or '',
+                              headers={'content-type': 'text/html; charset=utf-8'})
+
+    monkeypatch.setattr(network, 'get_async_client',
+                        functools.partial(network.get_async_client, transport=httpx.MockTransport(handler)))
+    recorder = TraceRecorder(str(tmp_path / 'traces.jsonl'))
+    articles = make_sources('http://a.test')[0].articles
+
+    async def crawl():
+        with anyio.move_on_after(0.5):
+            await async_crawl_articles(articles, Configuration(), 2, recorder=recorder)
+
+    anyio.run(crawl)
+    recorder.close()
+    assert all(a.trace is None for a in articles)
+    assert sorted(read_traces(tmp_path / 'traces.jsonl')) == [
+        'missing-3.html', 'short-4.html', 'story-1.html', 'story-2.html']
@@ -0,0 +1,49 @@
+from newspaper import urls as newspaper_urls
+
+from newz import urls
+from newz.urls import UrlClassifier, is_article_url, path_prefix
+
+URLS = [
+    'http://cnn.com/2022/06/01/politics/story.html',
+    'http://cnn.com/video/2022/06/01/some-thing',
+    'http://careers.cnn.com/jobs/2022/06/01/engineer',
+    'http://cnn.com/about/team',
+    'http://cnn.com/a/b/c.jpg',
+    'http://cnn.com/news/a-b-c-d-e-f',
+    'http://cnn.com/x/cnn-is-hiring-new-interns-now',
+    'https://www.theguardian.com/world/2022/jun/01/some-story',
+    'http://www.amazon.com/2022/06/01/deal.html',
+    'http://cnn.com/world/',
+    'mailto:desk@cnn.com',
+    'http://cnn.com/section/index',
+]
+
+
+def test_same_decisions_as_newspaper():
+    assert [is_article_url(u) for u in URLS] == [newspaper_urls.valid_url(u) for u in URLS]
+
+
+def test_host_split_is_cached_per_host():
+    urls._split_host.cache_clear()
+    is_article_url('http://hosts.test/2022/06/01/first.html')
+    is_article_url('http://hosts.test/2022/06/02/second.html')
+    info = urls._split_host.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_learns_non_article_prefixes():
+    classifier = UrlClassifier('learn.test', min_samples=3)
+    videos = ['http://learn.test/video/2022/06/%02d/clip.html' % i for i in range(1, 5)]
+    story = 'http://learn.test/world/2022/06/01/story.html'
+    assert classifier.classify_many(videos + [story]) == [True] * 5
+    assert path_prefix(videos[0]) == '/video/' and path_prefix('http://learn.test/about') == ''
+
+    # without any article on the domain nothing is learned
+    for url in videos[:3]:
+        classifier.record(url, False)
+    assert not classifier.non_article_prefixes
+
+    classifier.record(story, True)
+    classifier.record(videos[3], False)
+    assert classifier.non_article_prefixes == {'/video/'}
+    assert classifier.filter(videos + [story]) == [story]